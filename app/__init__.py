@@ -1,5 +1,6 @@
 from flask import Flask
 from config import Config
+from functools import partial
 import os
 
 
@@ -12,6 +13,12 @@ def create_app(config_class=Config):
     os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
     os.makedirs(app.config["DOWNLOAD_FOLDER"], exist_ok=True)
 
+    # 建立工作資訊存取層並啟動背景轉換工作佇列
+    init_job_repository(app)
+    init_instrument_model(app)
+    init_job_queue(app)
+    init_chart_service(app)
+
     # 註冊路由
     from app.routes import main_bp
 
@@ -23,3 +30,65 @@ def create_app(config_class=Config):
         print(f"{rule.endpoint} - {rule.rule} [{', '.join(rule.methods)}]")
 
     return app
+
+
+def init_job_repository(app):
+    """建立工作資訊存取層，存放於 app.extensions["job_repository"]"""
+    from app.job_store import JobRepository
+
+    repository = JobRepository(
+        app.config["UPLOAD_FOLDER"],
+        app.config["DOWNLOAD_FOLDER"],
+        max_entries=app.config["JOB_CACHE_SIZE"],
+    )
+    app.extensions["job_repository"] = repository
+    return repository
+
+
+def init_instrument_model(app):
+    """載入並暖機樂器分配模型，存放於 app.extensions["instrument_model"]，找不到模型時為 None"""
+    from app.pipeline import load_instrument_model
+
+    model = load_instrument_model(
+        app.config["MODEL_PATH"],
+        app.config["MODEL_CHECKPOINT_DIR"],
+        quantized=app.config["MODEL_QUANTIZE"],
+    )
+    app.extensions["instrument_model"] = model
+    return model
+
+
+def init_job_queue(app):
+    """建立工作佇列並啟動背景執行緒，存放於 app.extensions["job_queue"]"""
+    from app.jobs import JobQueue
+    from app.pipeline import run_conversion
+
+    # 與請求共用同一個存取層，背景工作寫入的結果會直接更新快取
+    handler = partial(
+        run_conversion,
+        repository=app.extensions["job_repository"],
+        instrument_model=app.extensions["instrument_model"],
+    )
+    queue = JobQueue(
+        app.config["JOB_DB_PATH"],
+        handler,
+        workers=app.config["JOB_WORKERS"],
+        max_queued=app.config["JOB_QUEUE_LIMIT"],
+        stale_seconds=app.config["JOB_STALE_SECONDS"],
+    )
+    queue.start()
+    app.extensions["job_queue"] = queue
+    return queue
+
+
+def init_chart_service(app):
+    """建立圖表服務，存放於 app.extensions["chart_service"]"""
+    from app.charts import ChartService
+
+    service = ChartService(
+        app.config["DOWNLOAD_FOLDER"],
+        stats_folder=app.config["CHART_STATS_FOLDER"],
+        max_bytes=app.config["CHART_CACHE_BYTES"],
+    )
+    app.extensions["chart_service"] = service
+    return service
@@ -0,0 +1,125 @@
+import os
+import hashlib
+import zipfile
+
+ARCHIVE_FOLDER = "archives"  # 結果目錄下快取 ZIP 的位置
+CHUNK_SIZE = 64 * 1024
+
+
+def result_entries(analysis_result):
+    """
+    列出下載 ZIP 的內容，回傳 {檔名: 內容}
+
+    內容為 bytes 或磁碟上的檔案路徑；同名的軌道以後者為準
+    """
+    entries = {}
+    for track in analysis_result.get("tracks", []):
+        midi_filename = f"{track['instrument']}.MIDI"
+        # 音源分離與 MIDI 輸出尚未完成，暫時提供示例內容
+        entries[midi_filename] = f"This is a placeholder for {midi_filename}".encode()
+    return entries
+
+
+def _read_chunks(source, chunk_size=CHUNK_SIZE):
+    if isinstance(source, bytes):
+        yield source
+        return
+    with open(source, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def archive_digest(entries):
+    """以檔名與內容計算 ZIP 的雜湊，內容不變時可重複使用快取"""
+    digest = hashlib.sha1()
+    for name in sorted(entries):
+        digest.update(name.encode("utf-8") + b"\0")
+        for chunk in _read_chunks(entries[name]):
+            digest.update(chunk)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def cached_archive_path(results_dir, digest):
+    """快取 ZIP 的路徑"""
+    return os.path.join(results_dir, ARCHIVE_FOLDER, f"{digest[:16]}.zip")
+
+
+class _ChunkWriter:
+    """只能附加寫入的輸出，zipfile 會改用 data descriptor 而不回頭修改標頭"""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def stream_zip(entries, cache_path=None):
+    """
+    邊壓縮邊輸出 ZIP，不在磁碟上建立暫存目錄或完整的暫存檔
+
+    cache_path 不為 None 時，輸出的內容同時寫入該檔案，完整送出後才
+    替換到正式位置；連線中斷時刪除未完成的檔案。
+    """
+    cache_file = None
+    tmp_path = None
+    if cache_path is not None:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.{id(entries)}.tmp"
+        cache_file = open(tmp_path, "wb")
+
+    def emit(chunks):
+        for chunk in chunks:
+            if cache_file is not None:
+                cache_file.write(chunk)
+            yield chunk
+
+    writer = _ChunkWriter()
+    try:
+        with zipfile.ZipFile(writer, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, source in entries.items():
+                with zf.open(name, "w") as member:
+                    for chunk in _read_chunks(source):
+                        member.write(chunk)
+                        yield from emit(writer.drain())
+                yield from emit(writer.drain())
+        yield from emit(writer.drain())
+
+        if cache_file is not None:
+            cache_file.close()
+            os.replace(tmp_path, cache_path)
+            cache_file = None
+            _remove_other_archives(cache_path)
+    finally:
+        if cache_file is not None:
+            cache_file.close()
+            os.remove(tmp_path)
+
+
+def _remove_other_archives(cache_path):
+    """結果內容變更後，舊雜湊的 ZIP 已不會再被使用"""
+    folder = os.path.dirname(cache_path)
+    keep = os.path.basename(cache_path)
+    for filename in os.listdir(folder):
+        if filename.endswith(".zip") and filename != keep:
+            try:
+                os.remove(os.path.join(folder, filename))
+            except FileNotFoundError:
+                pass
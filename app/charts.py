@@ -0,0 +1,316 @@
+import io
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from app.pipeline import job_notes_dir, load_job_stems
+
+# app.pipeline 已將 code/ 加入搜尋路徑
+from note_store import INDEX_FILENAME  # noqa: E402
+from aggregate_analyze import (  # noqa: E402
+    score_track_stems,
+    new_score_histograms,
+    add_track_scores,
+    summarize_scores,
+)
+
+# 圖表類型：(分數序列, 參考線統計, 標題, Y 軸標籤)
+CHART_TYPES = {
+    "breathing": (
+        "breathing",
+        "breathing",
+        "Breathing Suitability Analysis\n(Higher score = more suitable)",
+        "Suitability Score",
+    ),
+    "difficulty": (
+        "difficulty",
+        "difficulty",
+        "Technical Difficulty Analysis\n(Higher score = more difficult)",
+        "Difficulty Score",
+    ),
+    "technical": (
+        "technical",
+        "difficulty",
+        "Technical Curve\n(Moving average of difficulty)",
+        "Difficulty Score",
+    ),
+}
+MIMETYPES = {"png": "image/png", "svg": "image/svg+xml"}
+TECHNICAL_WINDOW = 8  # 技術曲線的移動平均音符數
+STATS_FILES = {"breathing": "avg_breath.json", "difficulty": "avg_difficult.json"}
+
+
+def technical_curve(series, window=TECHNICAL_WINDOW):
+    """難度分數的移動平均，呈現段落層級的技術負擔變化"""
+    positions, scores = series
+    window = min(window, len(scores))
+    if window == 0:
+        return positions, scores
+    kernel = np.full(window, 1.0 / window)
+    return positions[window - 1 :], np.convolve(scores, kernel, mode="valid")
+
+
+def lttb(positions, scores, threshold):
+    """
+    Largest-Triangle-Three-Buckets 降採樣，保留視覺上重要的轉折點
+
+    頭尾兩點固定保留，其餘每個區間選出與前一個選點、下一區間平均點
+    構成最大三角形面積的點。回傳所選點的索引。
+    """
+    count = len(positions)
+    if threshold >= count or threshold < 3:
+        return np.arange(count)
+
+    edges = np.linspace(1, count - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = count - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_stop = edges[bucket + 2] if bucket + 2 < len(edges) else count
+        next_x = positions[stop:next_stop].mean()
+        next_y = scores[stop:next_stop].mean()
+
+        x, y = positions[previous], scores[previous]
+        areas = np.abs(
+            (x - next_x) * (scores[start:stop] - y)
+            - (x - positions[start:stop]) * (next_y - y)
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def minmax_decimate(scores, threshold):
+    """每個區間保留最小與最大值（依原順序），適合呈現尖峰；回傳所選點的索引"""
+    count = len(scores)
+    buckets = threshold // 2
+    if threshold >= count or buckets < 1:
+        return np.arange(count)
+
+    edges = np.linspace(0, count, buckets + 1).astype(np.int64)
+    selected = []
+    for start, stop in zip(edges[:-1], edges[1:]):
+        bucket = scores[start:stop]
+        low = start + int(np.argmin(bucket))
+        high = start + int(np.argmax(bucket))
+        selected.extend(sorted({low, high}))
+    return np.asarray(selected, dtype=np.int64)
+
+
+DOWNSAMPLERS = {
+    "lttb": lambda positions, scores, points: lttb(positions, scores, points),
+    "minmax": lambda positions, scores, points: minmax_decimate(scores, points),
+}
+
+
+def load_corpus_stats(stats_folder):
+    """讀取 analyze.py 輸出的全域統計，不存在時回傳 None"""
+    if not stats_folder:
+        return None
+    stats = {}
+    for kind, filename in STATS_FILES.items():
+        try:
+            with open(os.path.join(stats_folder, filename), "r") as f:
+                stats[kind] = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+    return stats
+
+
+class ChartService:
+    """
+    依請求繪製工作的分析圖表
+
+    所有圖表共用同一個 Agg Figure，只更新線條資料與文字，不重新建立
+    座標軸；繪製完成的圖片依 (工作, stem, 類型, 格式, note store 版本)
+    存入依總位元組數淘汰的 LRU 快取，並以內容雜湊作為 ETag。
+    參考線優先使用語料庫的全域統計，沒有時改用該工作所有 stem 的統計。
+    最近使用的 max_jobs 個工作保留計算好的分數，供圖表與序列資料共用。
+    """
+
+    def __init__(
+        self, download_folder, stats_folder=None, max_bytes=32 * 1024 * 1024, max_jobs=16
+    ):
+        self.download_folder = download_folder
+        self.max_bytes = max_bytes
+        self.max_jobs = max_jobs
+        self.corpus_stats = load_corpus_stats(stats_folder)
+
+        self._cache = OrderedDict()  # key -> (etag, data)
+        self._cache_bytes = 0
+        self._cache_lock = threading.Lock()
+        self._job_scores = OrderedDict()  # (job_id, version) -> (分數, 參考線統計)
+
+        # Figure 不是執行緒安全的，繪製時需持有 _figure_lock
+        self._figure_lock = threading.Lock()
+        self._figure = Figure(figsize=(10, 5))
+        FigureCanvasAgg(self._figure)
+        self._axes = self._figure.add_subplot()
+        (self._line,) = self._axes.plot([], [])
+        self._reference_lines = [
+            self._axes.axhline(y=0, color="red", linestyle="-"),
+            self._axes.axhline(y=0, color="blue", linestyle="--"),
+            self._axes.axhline(y=0, color="green", linestyle="--"),
+        ]
+        self._axes.set_xlabel("Position (seconds)")
+
+    def store_version(self, job_id):
+        """工作 note store 的版本（index 修改時間），沒有資料時回傳 None"""
+        try:
+            return os.stat(
+                os.path.join(job_notes_dir(self.download_folder, job_id), INDEX_FILENAME)
+            ).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def stems(self, job_id):
+        """工作中有音符資料的 stem"""
+        return sorted(load_job_stems(self.download_folder, job_id))
+
+    def chart(self, job_id, stem_id, chart_type, fmt="png"):
+        """
+        取得圖表，回傳 (etag, 圖片內容)
+
+        工作、stem 或圖表類型不存在時回傳 None
+        """
+        if chart_type not in CHART_TYPES or fmt not in MIMETYPES:
+            return None
+        version = self.store_version(job_id)
+        if version is None:
+            return None
+
+        key = (job_id, stem_id, chart_type, fmt, version)
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        found = self._series(job_id, version, stem_id, chart_type)
+        if found is None:
+            return None
+
+        series, stats = found
+        _, _, title, ylabel = CHART_TYPES[chart_type]
+        data = self._render(series, stats, title, ylabel, fmt)
+        cached = (hashlib.sha1(data).hexdigest(), data)
+        self._remember(key, cached)
+        return cached
+
+    def series_data(
+        self, job_id, stem_id, chart_type, points, start=None, end=None, method="lttb"
+    ):
+        """
+        取得圖表的分數序列，降採樣到 points 個點以內
+
+        start、end 為位置範圍（秒），用於縮放時只取可見區段。
+        工作、stem 或圖表類型不存在時回傳 None
+        """
+        if chart_type not in CHART_TYPES or method not in DOWNSAMPLERS:
+            return None
+        version = self.store_version(job_id)
+        if version is None:
+            return None
+        found = self._series(job_id, version, stem_id, chart_type)
+        if found is None:
+            return None
+
+        (positions, scores), stats = found
+        extent = [float(positions[0]), float(positions[-1])] if len(positions) else []
+        # 位置已排序，以二分搜尋切出範圍
+        lower = 0 if start is None else np.searchsorted(positions, start, side="left")
+        upper = len(positions) if end is None else np.searchsorted(positions, end, side="right")
+        positions = positions[lower:upper]
+        scores = scores[lower:upper]
+
+        selected = DOWNSAMPLERS[method](positions, scores, points)
+        return {
+            "positions": positions[selected].tolist(),
+            "scores": scores[selected].tolist(),
+            "total_points": len(positions),
+            "extent": extent,
+            "reference": stats,
+        }
+
+    def _series(self, job_id, version, stem_id, chart_type):
+        """回傳 (分數序列, 參考線統計)，stem 不存在時回傳 None"""
+        track_scores, job_stats = self._scores(job_id, version)
+        if stem_id not in track_scores:
+            return None
+
+        series_name, stats_name, _, _ = CHART_TYPES[chart_type]
+        if series_name == "technical":
+            series = technical_curve(track_scores[stem_id]["difficulty"])
+        else:
+            series = track_scores[stem_id][series_name]
+        stats = self.corpus_stats if self.corpus_stats is not None else job_stats
+        return series, stats[stats_name]
+
+    def _scores(self, job_id, version):
+        """工作所有 stem 的分數與統計，縮放時的連續請求不需重新計算"""
+        key = (job_id, version)
+        with self._cache_lock:
+            scored = self._job_scores.get(key)
+            if scored is not None:
+                self._job_scores.move_to_end(key)
+                return scored
+
+        # 位置欄位是 note store 的 mmap 檢視，複製後再快取，重新轉換覆寫檔案時才不受影響
+        track_scores = {
+            stem_id: {
+                name: (np.array(positions), np.array(scores))
+                for name, (positions, scores) in series.items()
+            }
+            for stem_id, series in score_track_stems(
+                load_job_stems(self.download_folder, job_id)
+            ).items()
+        }
+        breathing_hist, difficulty_hist = new_score_histograms()
+        add_track_scores(track_scores, breathing_hist, difficulty_hist)
+        breathing, difficulty = summarize_scores(breathing_hist, difficulty_hist)
+        scored = (track_scores, {"breathing": breathing, "difficulty": difficulty})
+
+        with self._cache_lock:
+            self._job_scores[key] = scored
+            while len(self._job_scores) > self.max_jobs:
+                self._job_scores.popitem(last=False)
+        return scored
+
+    def _render(self, series, stats, title, ylabel, fmt):
+        positions, scores = series
+        values = (stats["average"], stats["25th_percentile"], stats["75th_percentile"])
+        labels = ("Avg", "25th", "75th")
+
+        with self._figure_lock:
+            self._line.set_data(positions, scores)
+            for line, label, value in zip(self._reference_lines, labels, values):
+                line.set_ydata([value, value])
+                line.set_label(f"{label}: {value:.2f}")
+            self._axes.set_title(title)
+            self._axes.set_ylabel(ylabel)
+            self._axes.relim()
+            self._axes.autoscale_view()
+            self._axes.legend(handles=self._reference_lines)
+
+            buffer = io.BytesIO()
+            self._figure.savefig(buffer, format=fmt)
+        return buffer.getvalue()
+
+    def _remember(self, key, cached):
+        size = len(cached[1])
+        if size > self.max_bytes:
+            return
+        with self._cache_lock:
+            if key in self._cache:
+                return
+            self._cache[key] = cached
+            self._cache_bytes += size
+            while self._cache_bytes > self.max_bytes:
+                _, (_, evicted) = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted)
@@ -0,0 +1,136 @@
+import os
+import json
+import uuid
+import fcntl
+import hashlib
+
+UPLOADS_FOLDER = ".uploads"  # 工作目錄下存放未完成上傳的位置
+BLOCK_SIZE = 64 * 1024  # 每次從請求讀取並寫入的大小
+
+
+class UploadError(Exception):
+    """分段上傳的請求不合法"""
+
+
+class OffsetMismatchError(UploadError):
+    """分段的起始位置與已接收的大小不一致，客戶端應從 received 繼續"""
+
+    def __init__(self, received):
+        super().__init__(f"分段位置不符，已接收 {received} 位元組")
+        self.received = received
+
+
+def _paths(job_dir, upload_id):
+    folder = os.path.join(job_dir, UPLOADS_FOLDER)
+    return (
+        os.path.join(folder, f"{upload_id}.json"),
+        os.path.join(folder, f"{upload_id}.part"),
+    )
+
+
+def create_upload(job_dir, filename, original_filename, size):
+    """建立上傳工作階段，回傳紀錄（不含已接收大小）"""
+    upload_id = uuid.uuid4().hex
+    record_path, part_path = _paths(job_dir, upload_id)
+    os.makedirs(os.path.dirname(record_path), exist_ok=True)
+
+    record = {
+        "upload_id": upload_id,
+        "filename": filename,
+        "original_filename": original_filename,
+        "size": size,
+    }
+    open(part_path, "wb").close()
+    with open(record_path, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False, indent=4)
+    return record
+
+
+def get_upload(job_dir, upload_id):
+    """取得上傳紀錄與已接收的位元組數，不存在時回傳 None"""
+    record_path, part_path = _paths(job_dir, upload_id)
+    try:
+        with open(record_path, "r", encoding="utf-8") as f:
+            record = json.load(f)
+        received = os.path.getsize(part_path)
+    except FileNotFoundError:
+        return None
+    return {**record, "received": received}
+
+
+def write_chunk(job_dir, upload_id, offset, stream, length, sha256):
+    """
+    將一個分段附加到暫存檔，回傳寫入後已接收的位元組數
+
+    分段以 BLOCK_SIZE 為單位邊讀邊寫，記憶體用量與分段大小無關。
+    sha256 與實際內容不符或內容不完整時，暫存檔會截回寫入前的大小，
+    客戶端可直接重送同一分段。
+
+    位置檢查、寫入與失敗時的截斷都持有暫存檔的 flock：客戶端重送的請求與
+    仍在執行的原請求依序進行，後到者會收到 OffsetMismatchError。
+    """
+    upload = get_upload(job_dir, upload_id)
+    if upload is None:
+        raise UploadError("找不到上傳工作階段")
+    if offset + length > upload["size"]:
+        raise UploadError("分段超出檔案大小")
+
+    _, part_path = _paths(job_dir, upload_id)
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        f = open(part_path, "r+b")
+    except FileNotFoundError:
+        raise UploadError("找不到上傳工作階段")
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        # 取得鎖定後才讀取已接收大小，等待期間其他請求可能已寫入
+        received = os.fstat(f.fileno()).st_size
+        if offset != received:
+            raise OffsetMismatchError(received)
+        f.seek(offset)
+        try:
+            while written < length:
+                block = stream.read(min(BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                f.write(block)
+                digest.update(block)
+                written += len(block)
+        except BaseException:
+            f.truncate(offset)
+            raise
+
+        if written != length:
+            f.truncate(offset)
+            raise UploadError("分段內容不完整")
+        if digest.hexdigest() != sha256.lower():
+            f.truncate(offset)
+            raise UploadError("分段校驗碼不符")
+
+    return offset + written
+
+
+def complete_upload(job_dir, upload_id):
+    """確認所有分段已接收，將暫存檔移到工作目錄並回傳上傳紀錄與檔案路徑"""
+    upload = get_upload(job_dir, upload_id)
+    if upload is None:
+        raise UploadError("找不到上傳工作階段")
+    if upload["received"] != upload["size"]:
+        raise OffsetMismatchError(upload["received"])
+
+    record_path, part_path = _paths(job_dir, upload_id)
+    file_path = os.path.join(job_dir, upload["filename"])
+    try:
+        f = open(part_path, "rb")
+    except FileNotFoundError:
+        raise UploadError("找不到上傳工作階段")
+    with f:
+        # 等待仍在寫入的分段請求結束，確認大小後才移動暫存檔
+        fcntl.flock(f, fcntl.LOCK_EX)
+        received = os.fstat(f.fileno()).st_size
+        if received != upload["size"]:
+            raise OffsetMismatchError(received)
+        os.replace(part_path, file_path)
+    os.remove(record_path)
+    return upload, file_path
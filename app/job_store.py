@@ -0,0 +1,133 @@
+import os
+import json
+import fcntl
+import tempfile
+import threading
+from collections import OrderedDict
+
+JOB_INFO_FILENAME = "job_info.json"
+RESULT_FILENAME = "analysis_result.json"
+INFO_LOCK_FILENAME = ".job_info.lock"
+
+
+class JobRepository:
+    """
+    工作資訊與分析結果的存取層
+
+    job_info.json 與 analysis_result.json 仍是資料來源，讀取結果連同檔案的
+    inode、大小與修改時間保存在容量有限的 LRU 快取中，寫入時同時更新檔案
+    與快取（write-through）。每次查詢只需 stat 一次檔案：檔案未變更時直接
+    回傳快取，其他程序（例如另一個 gunicorn worker）寫入後則重新讀取。
+
+    只有「存在」的資料會被快取：其他程序剛寫入的結果在快取未命中時會
+    從檔案讀取，不會因為先前查詢不到而一直回報不存在。
+    回傳的字典與快取共用，請勿直接修改，更新時請複製後透過 save_* 寫回。
+    """
+
+    def __init__(self, upload_folder, download_folder, max_entries=1024):
+        self.upload_folder = upload_folder
+        self.download_folder = download_folder
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # (kind, job_id) -> (檔案狀態, dict)
+        self._lock = threading.Lock()
+
+    def job_dir(self, job_id):
+        return os.path.join(self.upload_folder, job_id)
+
+    def results_dir(self, job_id):
+        return os.path.join(self.download_folder, job_id)
+
+    def _path(self, kind, job_id):
+        if kind == "info":
+            return os.path.join(self.job_dir(job_id), JOB_INFO_FILENAME)
+        return os.path.join(self.results_dir(job_id), RESULT_FILENAME)
+
+    @staticmethod
+    def _file_state(stat):
+        # os.replace 寫入的檔案 inode 必定不同，大小與修改時間相同也能分辨
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _remember(self, key, state, value):
+        with self._lock:
+            self._cache[key] = (state, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _get(self, kind, job_id):
+        key = (kind, job_id)
+        path = self._path(kind, job_id)
+        try:
+            state = self._file_state(os.stat(path))
+        except FileNotFoundError:
+            return None
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] == state:
+                self._cache.move_to_end(key)
+                return cached[1]
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = self._file_state(os.fstat(f.fileno()))
+                value = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        self._remember(key, state, value)
+        return value
+
+    def _save(self, kind, job_id, value):
+        path = self._path(kind, job_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先寫入暫存檔再替換，避免其他程序讀到寫到一半的 JSON；
+        # 暫存檔名不重複，同時寫入同一個檔案的執行緒或程序不會互相覆蓋
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False, indent=4)
+                f.flush()
+                # 替換後檔案保有相同的 inode 與修改時間，作為快取比對的狀態
+                state = self._file_state(os.fstat(f.fileno()))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._remember((kind, job_id), state, value)
+
+    def get_info(self, job_id):
+        """取得工作資訊，不存在時回傳 None"""
+        return self._get("info", job_id)
+
+    def save_info(self, job_id, job_info):
+        """寫入工作資訊"""
+        self._save("info", job_id, job_info)
+
+    def update_info(self, job_id, update):
+        """
+        以 update(舊資訊或 None) 的回傳值取代工作資訊並寫入
+
+        讀取到寫回期間持有工作目錄中鎖定檔的 flock，跨執行緒與跨程序的更新
+        都依序執行，避免同時完成的上傳互相覆蓋檔案列表
+        """
+        job_dir = self.job_dir(job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        with open(os.path.join(job_dir, INFO_LOCK_FILENAME), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                job_info = update(self.get_info(job_id))
+                self.save_info(job_id, job_info)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return job_info
+
+    def get_result(self, job_id):
+        """取得分析結果，尚未完成時回傳 None"""
+        return self._get("result", job_id)
+
+    def save_result(self, job_id, analysis_result):
+        """寫入分析結果"""
+        self._save("result", job_id, analysis_result)
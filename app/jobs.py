@@ -0,0 +1,292 @@
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+import traceback
+from contextlib import closing
+
+# 工作狀態
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """佇列中等待的工作已達上限"""
+
+
+class JobQueue:
+    """
+    SQLite 佇列 + 固定數量的背景執行緒
+
+    工作狀態與進度寫在 SQLite 檔案中，重啟或多個 gunicorn worker 共用同一
+    個檔案時仍能取得一致的狀態。每個工作只會被一個執行緒以原子操作領取。
+    handler(job_id, report) 執行實際處理，透過 report(stage, progress) 回報
+    進度；拋出例外時工作標記為 failed。
+
+    執行中的工作記錄領取它的佇列（owner），該佇列的心跳執行緒定期更新
+    heartbeat_at；只有擁有者超過 stale_seconds 沒有心跳（例如程序已結束）
+    的工作才會重新排入佇列，長時間執行的工作不會被重複執行。
+    """
+
+    def __init__(
+        self, db_path, handler, workers=2, max_queued=100, stale_seconds=600
+    ):
+        self.db_path = db_path
+        self.handler = handler
+        self.workers = workers
+        self.max_queued = max_queued
+        self.stale_seconds = stale_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._heartbeat_seconds = max(stale_seconds / 4, 1.0)
+        self._active = set()  # 本佇列執行中的工作，由心跳執行緒定期更新
+        self._active_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        # 各工作的變更次數，供 wait_for_update 在同一程序內即時得知進度更新
+        self._changed = threading.Condition()
+        self._versions = {}
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    stage TEXT NOT NULL DEFAULT '',
+                    progress INTEGER NOT NULL DEFAULT 0,
+                    message TEXT NOT NULL DEFAULT '',
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    owner TEXT NOT NULL DEFAULT '',
+                    heartbeat_at REAL NOT NULL DEFAULT 0
+                )
+                """
+            )
+            # 舊版資料庫沒有擁有者與心跳欄位
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, definition in (
+                ("owner", "TEXT NOT NULL DEFAULT ''"),
+                ("heartbeat_at", "REAL NOT NULL DEFAULT 0"),
+            ):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def _notify(self, job_id):
+        with self._changed:
+            self._versions[job_id] = self._versions.get(job_id, 0) + 1
+            self._changed.notify_all()
+
+    def enqueue(self, job_id):
+        """將工作加入佇列，已在佇列或執行中的工作不會重複加入"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT state FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if row and row[0] in (QUEUED, RUNNING):
+                conn.execute("COMMIT")
+                return False
+
+            (queued,) = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = ?", (QUEUED,)
+            ).fetchone()
+            if queued >= self.max_queued:
+                conn.execute("ROLLBACK")
+                raise QueueFullError(f"等待中的工作已達上限 ({self.max_queued})")
+
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO jobs
+                    (job_id, state, stage, progress, message, created_at, updated_at)
+                VALUES (?, ?, '等待中', 0, '', ?, ?)
+                """,
+                (job_id, QUEUED, now, now),
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        self._notify(job_id)
+        self._wakeup.set()
+        return True
+
+    def get(self, job_id):
+        """取得工作狀態，不存在時回傳 None"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT job_id, state, stage, progress, message, updated_at "
+                "FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("job_id", "state", "stage", "progress", "message", "updated_at")
+        return dict(zip(keys, row))
+
+    def update(self, job_id, **fields):
+        """更新工作欄位（state、stage、progress、message）"""
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                f"UPDATE jobs SET {columns} WHERE job_id = ?",
+                (*fields.values(), job_id),
+            )
+        self._notify(job_id)
+
+    def wait_for_update(self, job_id, since=None, timeout=15.0, poll_interval=0.5):
+        """
+        等待工作狀態變更後回傳最新狀態，最多等待 timeout 秒
+
+        since 為上次取得的 updated_at（工作尚未加入佇列時為 None）；狀態已不同
+        時立即回傳。同一程序內的更新會立即喚醒等待者，其他程序的更新則每
+        poll_interval 秒查詢一次 SQLite 的 updated_at 取得。
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._changed:
+                version = self._versions.get(job_id, 0)
+
+            job = self.get(job_id)
+            if (job["updated_at"] if job else None) != since:
+                return job
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stopping.is_set():
+                return job
+            with self._changed:
+                self._changed.wait_for(
+                    lambda: self._versions.get(job_id, 0) != version
+                    or self._stopping.is_set(),
+                    min(poll_interval, remaining),
+                )
+
+    def _claim(self):
+        """以原子操作領取最早的等待中工作"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # 擁有者長時間沒有心跳的執行中工作視為中斷（例如程序重啟），重新排入佇列
+            conn.execute(
+                "UPDATE jobs SET state = ?, owner = '' WHERE state = ? AND heartbeat_at < ?",
+                (QUEUED, RUNNING, time.time() - self.stale_seconds),
+            )
+            row = conn.execute(
+                "SELECT job_id FROM jobs WHERE state = ? ORDER BY created_at LIMIT 1",
+                (QUEUED,),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET state = ?, stage = '開始處理', progress = 0, "
+                "updated_at = ?, owner = ?, heartbeat_at = ? WHERE job_id = ?",
+                (RUNNING, now, self.owner, now, row[0]),
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        self._notify(row[0])
+        return row[0]
+
+    def _run(self, job_id):
+        def report(stage, progress):
+            self.update(job_id, stage=stage, progress=int(progress))
+
+        with self._active_lock:
+            self._active.add(job_id)
+        try:
+            try:
+                self.handler(job_id, report)
+            except Exception as e:
+                traceback.print_exc()
+                self.update(job_id, state=FAILED, stage="處理失敗", message=str(e))
+            else:
+                self.update(job_id, state=COMPLETED, stage="轉換完成", progress=100)
+        finally:
+            # 無法寫入最終狀態時停止心跳，工作逾時後由佇列重新排入
+            with self._active_lock:
+                self._active.discard(job_id)
+            # 工作已結束，之後的狀態查詢會直接回傳最終狀態，不再需要變更計數
+            with self._changed:
+                self._versions.pop(job_id, None)
+
+    def _heartbeat(self):
+        """更新本佇列執行中工作的 heartbeat_at"""
+        with self._active_lock:
+            job_ids = list(self._active)
+        if not job_ids:
+            return
+        placeholders = ", ".join("?" for _ in job_ids)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                f"UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND state = ? "
+                f"AND job_id IN ({placeholders})",
+                (time.time(), self.owner, RUNNING, *job_ids),
+            )
+
+    def _heartbeat_loop(self):
+        while not self._stopping.wait(self._heartbeat_seconds):
+            try:
+                self._heartbeat()
+            except Exception:
+                traceback.print_exc()
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            # 資料庫暫時鎖定或寫入失敗時記錄錯誤並稍後重試，執行緒不會因此結束
+            try:
+                job_id = self._claim()
+            except Exception:
+                traceback.print_exc()
+                self._stopping.wait(1.0)
+                continue
+            if job_id is None:
+                # 沒有工作時等待新工作通知；其他程序加入的工作靠逾時輪詢取得
+                self._wakeup.wait(timeout=1.0)
+                self._wakeup.clear()
+                continue
+            try:
+                self._run(job_id)
+            except Exception:
+                traceback.print_exc()
+
+    def start(self):
+        """啟動背景執行緒"""
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker_loop, name=f"job-worker-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(
+            target=self._heartbeat_loop, name="job-heartbeat", daemon=True
+        )
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """通知背景執行緒結束，執行中的工作會先完成"""
+        self._stopping.set()
+        self._wakeup.set()
+        with self._changed:
+            self._changed.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
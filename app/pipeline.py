@@ -0,0 +1,152 @@
+import os
+import sys
+import numpy as np
+from app.utils import get_formatted_time
+
+# 分析模組位於專案的 code/ 資料夾（非套件），加到搜尋路徑尾端以免遮蔽標準函式庫
+CODE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code")
+if CODE_DIR not in sys.path:
+    sys.path.append(CODE_DIR)
+
+from midi_ingest import load_midi_notes, notes_from_arrays, features_from_arrays  # noqa: E402
+from note_store import write_track, has_track, read_track  # noqa: E402
+from aggregate_analyze import score_track_stems  # noqa: E402
+from serving import get_served_model  # noqa: E402
+from baseline_rule import features_table, classify_stems  # noqa: E402
+
+MIDI_EXTENSIONS = {"mid", "midi"}
+NOTES_FOLDER = "notes"  # 結果目錄下的 note store
+
+# 音源分離與樂器分配模型尚未接上，軌道列表暫時沿用固定內容
+PLACEHOLDER_TRACKS = [
+    {"name": "主旋律", "instrument": "Trumpet1", "role": "主旋律", "score": 9},
+    {"name": "和聲1", "instrument": "Trombone", "role": "和弦墊底", "score": 8},
+    {"name": "和聲2", "instrument": "Horn", "role": "和弦墊底", "score": 7},
+    {
+        "name": "低音部",
+        "instrument": "Tuba",
+        "role": "主律動（基底）",
+        "score": 9,
+    },
+    {"name": "打擊樂", "instrument": "Drums", "role": "節奏樂器", "score": 8},
+]
+
+
+def job_notes_dir(download_folder, job_id):
+    """工作的 note store 位置"""
+    return os.path.join(download_folder, job_id, NOTES_FOLDER)
+
+
+def load_job_stems(download_folder, job_id):
+    """讀取工作的各 stem 音符欄位，沒有資料時回傳空字典"""
+    notes_dir = job_notes_dir(download_folder, job_id)
+    if not has_track(notes_dir):
+        return {}
+    return {
+        stem_id: columns
+        for stem_id, columns in read_track(notes_dir).items()
+        if len(columns["position"]) > 0
+    }
+
+
+def load_instrument_model(model_path, checkpoint_dir, quantized=False):
+    """載入共用的樂器分配模型，模型檔不存在時回傳 None"""
+    try:
+        model = get_served_model(model_path, checkpoint_dir, quantized)
+    except FileNotFoundError as e:
+        print(f"[警告] 找不到樂器分配模型，略過樂器預測: {e.filename}")
+        return None
+    print(f"✅ 已載入樂器分配模型: {model.path}{' (int8)' if model.quantized else ''}")
+    return model
+
+
+def predict_stem_instruments(instrument_model, stems):
+    """以模型預測每個 stem 的音符樂器，回傳各 stem 最多音符被分配到的樂器"""
+    stem_ids = list(stems)
+    phrases = [
+        np.stack(
+            [
+                stems[stem_id]["pitch"] % 12,
+                stems[stem_id]["pitch"] // 12,
+                stems[stem_id]["duration"],
+                stems[stem_id]["position"],
+            ],
+            axis=1,
+        ).astype(np.float32)
+        for stem_id in stem_ids
+    ]
+    instruments = {}
+    for stem_id, label_ids in zip(stem_ids, instrument_model.predict_ids(phrases)):
+        counts = np.bincount(label_ids)
+        instruments[stem_id] = instrument_model.label_to_instrument[int(counts.argmax())]
+    return instruments
+
+
+def run_conversion(job_id, report, repository, instrument_model=None):
+    """背景工作：解析上傳的 MIDI、計算分析分數並寫入 analysis_result.json"""
+    download_folder = repository.download_folder
+
+    report("讀取工作資訊", 5)
+    job_info = repository.get_info(job_id)
+    if job_info is None:
+        raise FileNotFoundError(f"找不到工作資訊: {job_id}")
+
+    # 解析 MIDI 檔案（音訊檔需等音源分離模組完成後才能處理）
+    midi_files = [
+        file_info
+        for file_info in job_info["files"]
+        if file_info["filename"].rsplit(".", 1)[-1].lower() in MIDI_EXTENSIONS
+    ]
+    stems = {}
+    stem_features = {}  # 有音高音符的 stem 的特徵，供規則分類
+    for index, file_info in enumerate(midi_files):
+        report(f"解析 {file_info['original_filename']}", 10 + 60 * index // len(midi_files))
+        midi_notes = load_midi_notes(file_info["file_path"])
+        phrases = notes_from_arrays(midi_notes)
+        stem_id = os.path.splitext(file_info["filename"])[0]
+        stems[stem_id] = phrases[0] if phrases else []
+        if phrases:
+            stem_features[stem_id] = features_from_arrays(midi_notes)
+    write_track(job_notes_dir(download_folder, job_id), stems)
+
+    report("計算分析分數", 75)
+    job_stems = load_job_stems(download_folder, job_id)
+    stem_results = {}
+    for stem_id, series in score_track_stems(job_stems).items():
+        breathing_scores = series["breathing"][1]
+        difficulty_scores = series["difficulty"][1]
+        stem_results[stem_id] = {
+            "breath": float(np.mean(breathing_scores)) if len(breathing_scores) else 0.0,
+            "difficulty": float(np.mean(difficulty_scores)) if len(difficulty_scores) else 0.0,
+            "note_count": len(series["breathing"][0]) + 1,
+        }
+
+    # 規則分類：整個工作的 stem 一次分類並分配聲部
+    rule_stems = [stem_id for stem_id in sorted(stem_features) if stem_id in stem_results]
+    table = features_table([stem_features[stem_id] for stem_id in rule_stems])
+    for stem_id, assignment in zip(rule_stems, classify_stems(table)):
+        stem_results[stem_id]["rule_instrument"] = list(assignment)
+
+    if instrument_model is not None and job_stems:
+        report("預測樂器", 85)
+        for stem_id, instrument in predict_stem_instruments(instrument_model, job_stems).items():
+            if stem_id in stem_results:
+                stem_results[stem_id]["instrument"] = instrument
+
+    report("儲存分析結果", 90)
+    analysis_result = {
+        "job_id": job_id,
+        "completion_time": get_formatted_time(),
+        "file_count": len(job_info["files"]),
+        "track_count": len(PLACEHOLDER_TRACKS),
+        "duration": 180,  # 秒
+        "difficulty": 7,  # 1-10
+        "tracks": PLACEHOLDER_TRACKS,
+        "stems": stem_results,
+        "files": job_info["files"],  # 保存原始檔案資訊
+    }
+
+    repository.save_result(job_id, analysis_result)
+
+    # 更新工作狀態（複製後寫回，不直接修改快取中的資料）
+    repository.save_info(job_id, {**job_info, "status": "converted"})
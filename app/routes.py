@@ -9,14 +9,26 @@ from flask import (
     url_for,
     session,
     send_from_directory,
+    Response,
+    stream_with_context,
 )
 import os
 from werkzeug.utils import secure_filename
 import json
-import shutil
 import uuid
 from datetime import datetime
 from app.utils import allowed_file, generate_job_id, get_file_size, get_formatted_time
+from app.jobs import QueueFullError, COMPLETED, FAILED, RUNNING
+from app.chunked_upload import (
+    UploadError,
+    OffsetMismatchError,
+    create_upload,
+    get_upload,
+    write_chunk,
+    complete_upload,
+)
+from app.charts import CHART_TYPES, MIMETYPES as CHART_MIMETYPES
+from app.archive import result_entries, archive_digest, cached_archive_path, stream_zip
 
 # 建立藍圖
 main_bp = Blueprint("main", __name__)
@@ -112,10 +124,8 @@ def upload_file():
     }
 
     # 將工作資訊保存為JSON檔案
-    job_info_path = os.path.join(job_dir, "job_info.json")
-    with open(job_info_path, "w", encoding="utf-8") as f:
-        json.dump(job_info, f, ensure_ascii=False, indent=4)
-    print(f"工作資訊已保存: {job_info_path}")
+    get_job_repository().save_info(job_id, job_info)
+    print(f"工作資訊已保存: {job_id}")
 
     # 打印重定向URL
     redirect_url = url_for("main.result_page", job_id=job_id)
@@ -125,20 +135,175 @@ def upload_file():
     return redirect(redirect_url)
 
 
+def valid_id(value):
+    """工作與上傳 ID 會組成路徑，只接受不含路徑字元的值"""
+    return bool(value) and secure_filename(value) == value
+
+
+def get_upload_job_dir(job_id, upload_id):
+    """取得分段上傳所屬的工作目錄，ID 不合法或工作不存在時回傳 None"""
+    if not valid_id(job_id) or not valid_id(upload_id):
+        return None
+    job_dir = get_job_repository().job_dir(job_id)
+    return job_dir if os.path.isdir(job_dir) else None
+
+
+@main_bp.route("/api/uploads", methods=["POST"])
+def create_chunked_upload():
+    """
+    建立分段上傳，適用於超過單次請求上限的大型檔案
+
+    請求內容為 JSON：filename、size，以及可選的 job_id（同一工作上傳多個檔案時）
+    """
+    data = request.get_json(silent=True) or {}
+    original_filename = str(data.get("filename", ""))
+    size = data.get("size")
+
+    if not allowed_file(original_filename):
+        allowed_exts = ", ".join(current_app.config["ALLOWED_EXTENSIONS"])
+        return jsonify(
+            {"status": "error", "message": f"檔案類型不支援。允許的類型：{allowed_exts}"}
+        ), 400
+    if not isinstance(size, int) or size <= 0:
+        return jsonify({"status": "error", "message": "檔案大小不正確"}), 400
+    if size > current_app.config["UPLOAD_MAX_FILE_SIZE"]:
+        return jsonify({"status": "error", "message": "檔案超過大小上限"}), 413
+
+    job_id = data.get("job_id")
+    if job_id:
+        if not valid_id(job_id) or not os.path.isdir(
+            get_job_repository().job_dir(job_id)
+        ):
+            return jsonify({"status": "error", "message": "找不到工作資訊"}), 404
+    else:
+        job_id = generate_job_id()
+    job_dir = get_job_repository().job_dir(job_id)
+    os.makedirs(job_dir, exist_ok=True)
+
+    upload = create_upload(
+        job_dir, secure_filename(original_filename), original_filename, size
+    )
+    return jsonify(
+        {
+            "status": "success",
+            "job_id": job_id,
+            "upload_id": upload["upload_id"],
+            "chunk_size": current_app.config["UPLOAD_CHUNK_SIZE"],
+            "received": 0,
+        }
+    )
+
+
+@main_bp.route("/api/uploads/<job_id>/<upload_id>", methods=["GET"])
+def get_chunked_upload(job_id, upload_id):
+    """查詢已接收的大小，中斷後由此位置繼續上傳"""
+    job_dir = get_upload_job_dir(job_id, upload_id)
+    upload = get_upload(job_dir, upload_id) if job_dir else None
+    if upload is None:
+        return jsonify({"status": "error", "message": "找不到上傳工作階段"}), 404
+
+    return jsonify(
+        {
+            "status": "success",
+            "job_id": job_id,
+            "upload_id": upload_id,
+            "size": upload["size"],
+            "received": upload["received"],
+        }
+    )
+
+
+@main_bp.route("/api/uploads/<job_id>/<upload_id>", methods=["PUT"])
+def put_upload_chunk(job_id, upload_id):
+    """
+    接收一個分段
+
+    請求本體為原始位元組，查詢參數 offset 為分段起始位置，
+    X-Chunk-SHA256 標頭為分段內容的 SHA-256
+    """
+    job_dir = get_upload_job_dir(job_id, upload_id)
+    if job_dir is None:
+        return jsonify({"status": "error", "message": "找不到上傳工作階段"}), 404
+
+    offset = request.args.get("offset", type=int)
+    checksum = request.headers.get("X-Chunk-SHA256")
+    length = request.content_length
+    if offset is None or not checksum or not length:
+        return jsonify(
+            {"status": "error", "message": "缺少 offset、X-Chunk-SHA256 或 Content-Length"}
+        ), 400
+
+    try:
+        received = write_chunk(
+            job_dir, upload_id, offset, request.stream, length, checksum
+        )
+    except OffsetMismatchError as e:
+        return jsonify(
+            {"status": "error", "message": str(e), "received": e.received}
+        ), 409
+    except UploadError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    return jsonify({"status": "success", "received": received})
+
+
+@main_bp.route("/api/uploads/<job_id>/<upload_id>/complete", methods=["POST"])
+def complete_chunked_upload(job_id, upload_id):
+    """組合完成的檔案並加入工作資訊"""
+    job_dir = get_upload_job_dir(job_id, upload_id)
+    if job_dir is None:
+        return jsonify({"status": "error", "message": "找不到上傳工作階段"}), 404
+
+    try:
+        upload, file_path = complete_upload(job_dir, upload_id)
+    except OffsetMismatchError as e:
+        return jsonify(
+            {"status": "error", "message": "檔案尚未上傳完成", "received": e.received}
+        ), 409
+    except UploadError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    file_info = {
+        "filename": upload["filename"],
+        "original_filename": upload["original_filename"],
+        "file_path": file_path,
+        "filesize": get_file_size(file_path),
+    }
+
+    def add_file(job_info):
+        if job_info is None:
+            job_info = {
+                "job_id": job_id,
+                "upload_time": get_formatted_time(),
+                "status": "uploaded",
+                "files": [],
+            }
+        # 同名檔案重新上傳時取代原本的紀錄
+        files = [f for f in job_info["files"] if f["filename"] != file_info["filename"]]
+        return {**job_info, "files": files + [file_info]}
+
+    get_job_repository().update_info(job_id, add_file)
+    print(f"分段上傳完成: {file_path}")
+
+    return jsonify(
+        {
+            "status": "success",
+            "job_id": job_id,
+            "redirect_url": url_for("main.result_page", job_id=job_id),
+        }
+    )
+
+
 @main_bp.route("/result/<job_id>")
 def result_page(job_id):
     """結果頁面路由"""
     # 讀取工作資訊
-    job_dir = os.path.join(current_app.config["UPLOAD_FOLDER"], job_id)
-    job_info_path = os.path.join(job_dir, "job_info.json")
-
-    if not os.path.exists(job_info_path):
+    repository = get_job_repository()
+    job_info = repository.get_info(job_id)
+    if job_info is None:
         flash("找不到工作資訊", "danger")
         return redirect(url_for("main.index"))
 
-    with open(job_info_path, "r", encoding="utf-8") as f:
-        job_info = json.load(f)
-
     # 獲取輸入文件列表
     input_files = [
         {
@@ -149,15 +314,8 @@ def result_page(job_id):
     ]
 
     # 檢查是否已經有處理結果
-    results_dir = os.path.join(current_app.config["DOWNLOAD_FOLDER"], job_id)
-    if os.path.exists(results_dir) and os.path.exists(
-        os.path.join(results_dir, "analysis_result.json")
-    ):
-        with open(
-            os.path.join(results_dir, "analysis_result.json"), "r", encoding="utf-8"
-        ) as f:
-            analysis_result = json.load(f)
-
+    analysis_result = repository.get_result(job_id)
+    if analysis_result is not None:
         # 獲取輸出文件列表
         output_files = [
             {"name": track["instrument"] + ".MIDI", "type": "MIDI"}
@@ -167,9 +325,10 @@ def result_page(job_id):
         # 計算進度為100%
         progress = 100
     else:
-        # 沒有結果時，輸出文件列表為空，進度為0
+        # 沒有結果時，輸出文件列表為空，進度取自背景工作
         output_files = []
-        progress = 0
+        job_status = describe_job(job_id)
+        progress = job_status[1] if job_status and job_status[0] == "processing" else 0
 
     return render_template(
         "result.html",
@@ -182,100 +341,151 @@ def result_page(job_id):
 
 @main_bp.route("/api/convert/<job_id>", methods=["POST"])
 def convert_file(job_id):
-    """開始文件轉換處理"""
+    """將文件轉換加入背景工作佇列"""
     # 讀取工作資訊
-    job_dir = os.path.join(current_app.config["UPLOAD_FOLDER"], job_id)
-    job_info_path = os.path.join(job_dir, "job_info.json")
-
-    if not os.path.exists(job_info_path):
+    if get_job_repository().get_info(job_id) is None:
         return jsonify({"status": "error", "message": "找不到工作資訊"})
 
-    with open(job_info_path, "r", encoding="utf-8") as f:
-        job_info = json.load(f)
+    # 實際的解析與分析由背景執行緒處理，請求立即返回
+    try:
+        get_job_queue().enqueue(job_id)
+    except QueueFullError as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
 
-    # 模擬轉換過程
-    # 實際應用中，這裡會呼叫您的後端模組對每個檔案進行處理
+    return jsonify({"status": "success", "message": "已加入轉換佇列"})
+
+
+def get_job_queue():
+    """取得應用程式的背景工作佇列"""
+    return current_app.extensions["job_queue"]
 
-    # 模擬分析結果
-    analysis_result = {
-        "job_id": job_id,
-        "completion_time": get_formatted_time(),
-        "file_count": len(job_info["files"]),
-        "track_count": 5,  # 假設值
-        "duration": 180,  # 秒
-        "difficulty": 7,  # 1-10
-        "tracks": [
-            {"name": "主旋律", "instrument": "Trumpet1", "role": "主旋律", "score": 9},
-            {"name": "和聲1", "instrument": "Trombone", "role": "和弦墊底", "score": 8},
-            {"name": "和聲2", "instrument": "Horn", "role": "和弦墊底", "score": 7},
-            {
-                "name": "低音部",
-                "instrument": "Tuba",
-                "role": "主律動（基底）",
-                "score": 9,
-            },
-            {"name": "打擊樂", "instrument": "Drums", "role": "節奏樂器", "score": 8},
-        ],
-        "files": job_info["files"],  # 保存原始檔案資訊
-    }
 
-    # 保存分析結果
-    results_dir = os.path.join(current_app.config["DOWNLOAD_FOLDER"], job_id)
-    os.makedirs(results_dir, exist_ok=True)
+def get_job_repository():
+    """取得應用程式的工作資訊存取層"""
+    return current_app.extensions["job_repository"]
 
-    with open(
-        os.path.join(results_dir, "analysis_result.json"), "w", encoding="utf-8"
-    ) as f:
-        json.dump(analysis_result, f, ensure_ascii=False, indent=4)
 
-    # 更新工作狀態
-    job_info["status"] = "converted"
+def describe_job(job_id, job=None):
+    """
+    整理工作狀態，回傳 (status, progress, stage, message)；找不到工作時回傳 None
 
-    with open(job_info_path, "w", encoding="utf-8") as f:
-        json.dump(job_info, f, ensure_ascii=False, indent=4)
+    job 為已從佇列取得的工作狀態，省略時自行查詢
+    """
+    if job is None:
+        job = get_job_queue().get(job_id)
+    if job is not None:
+        if job["state"] == COMPLETED:
+            return "completed", 100, job["stage"], ""
+        if job["state"] == FAILED:
+            return "error", job["progress"], job["stage"], job["message"]
+        if job["state"] == RUNNING:
+            return "processing", job["progress"], job["stage"], ""
+        return "waiting", 0, job["stage"], ""
 
-    return jsonify({"status": "success", "message": "轉換完成"})
+    # 佇列中沒有紀錄的工作（例如佇列建立前已完成）以結果檔案判斷
+    repository = get_job_repository()
+    if repository.get_info(job_id) is None:
+        return None
+
+    if repository.get_result(job_id) is not None:
+        return "completed", 100, "轉換完成", ""
+    return "waiting", 0, "", ""
 
 
 @main_bp.route("/api/status/<job_id>")
 def get_job_status(job_id):
     """獲取工作狀態"""
-    job_dir = os.path.join(current_app.config["UPLOAD_FOLDER"], job_id)
-    job_info_path = os.path.join(job_dir, "job_info.json")
-
-    if not os.path.exists(job_info_path):
+    job_status = describe_job(job_id)
+    if job_status is None:
         return jsonify({"status": "error", "message": "找不到工作資訊"})
 
-    with open(job_info_path, "r", encoding="utf-8") as f:
-        job_info = json.load(f)
+    status, progress, stage, message = job_status
+    if status == "error":
+        return jsonify(
+            {
+                "status": "error",
+                "message": message or "轉換失敗",
+                "progress": progress,
+                "job_id": job_id,
+            }
+        )
 
-    # 檢查是否已經完成
-    results_dir = os.path.join(current_app.config["DOWNLOAD_FOLDER"], job_id)
-    if os.path.exists(results_dir) and os.path.exists(
-        os.path.join(results_dir, "analysis_result.json")
-    ):
-        progress = 100
-        status = "completed"
-    else:
-        # 模擬進度
-        if job_info["status"] == "uploaded":
-            progress = 0
-            status = "waiting"
+    return jsonify(
+        {"status": status, "progress": progress, "stage": stage, "job_id": job_id}
+    )
+
+
+@main_bp.route("/api/events/<job_id>")
+def job_events(job_id):
+    """
+    以 Server-Sent Events 推送工作進度，取代輪詢 /api/status
+
+    每個連線以長輪詢方式運作：送出目前狀態，等待下一次變更（最多
+    SSE_KEEPALIVE_SECONDS 秒）後即結束，瀏覽器的 EventSource 會依 retry
+    自動重新連線；事件 id 為狀態的 updated_at，重新連線時瀏覽器帶回
+    Last-Event-ID，未變更的狀態不會重送。其他程序的進度每 SSE_POLL_SECONDS
+    秒查詢一次。
+
+    等待期間連線佔用一個處理執行緒，每個開著的結果頁面各佔一個，因此須以
+    執行緒或非同步 worker 執行（見 gunicorn.conf.py）；同步 worker 下每個
+    頁面會佔住整個 worker。
+    """
+    job_queue = get_job_queue()
+    keepalive = current_app.config["SSE_KEEPALIVE_SECONDS"]
+    retry = current_app.config["SSE_RETRY_MILLISECONDS"]
+    poll_interval = current_app.config["SSE_POLL_SECONDS"]
+    last_event_id = request.headers.get("Last-Event-ID")
+
+    def event_id(job):
+        return repr(job["updated_at"]) if job else ""
+
+    def format_event(job_status, job=None):
+        status, progress, stage, message = job_status
+        data = {"status": status, "progress": progress, "stage": stage, "job_id": job_id}
+        if status == "error":
+            data["message"] = message or "轉換失敗"
+        return (
+            f"id: {event_id(job)}\nretry: {retry}\n"
+            f"event: progress\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        )
+
+    def stream():
+        job = job_queue.get(job_id)
+        job_status = describe_job(job_id, job)
+        if job_status is None:
+            yield format_event(("error", 0, "", "找不到工作資訊"))
+            return
+
+        if event_id(job) != last_event_id or job_status[0] in ("completed", "error"):
+            yield format_event(job_status, job)
+            if job_status[0] in ("completed", "error"):
+                return
+
+        # 同一程序內的進度更新會立即喚醒，其他程序的更新以短間隔輪詢取得
+        since = job["updated_at"] if job else None
+        updated = job_queue.wait_for_update(
+            job_id, since, timeout=keepalive, poll_interval=poll_interval
+        )
+        job_status = describe_job(job_id, updated)
+        if job_status is not None and event_id(updated) != event_id(job):
+            yield format_event(job_status, updated)
         else:
-            progress = 50  # 假設進度
-            status = "processing"
+            # 註解行讓代理伺服器與瀏覽器維持連線，結束後由瀏覽器重新連線
+            yield ": keepalive\n\n"
 
-    return jsonify({"status": status, "progress": progress, "job_id": job_id})
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @main_bp.route("/statistic/<job_id>/<chart_type>")
 def statistic_page(job_id, chart_type):
     """統計頁面路由"""
     # 檢查工作和圖表類型存在
-    job_dir = os.path.join(current_app.config["UPLOAD_FOLDER"], job_id)
-    results_dir = os.path.join(current_app.config["DOWNLOAD_FOLDER"], job_id)
-
-    if not os.path.exists(job_dir) or not os.path.exists(results_dir):
+    repository = get_job_repository()
+    if repository.get_info(job_id) is None or repository.get_result(job_id) is None:
         flash("找不到工作資訊或分析結果", "danger")
         return redirect(url_for("main.index"))
 
@@ -297,81 +507,134 @@ def statistic_page(job_id, chart_type):
 
 @main_bp.route("/api/charts/<job_id>/<chart_type>")
 def get_chart(job_id, chart_type):
-    """獲取圖表數據API"""
-    # 實際應用中，這裡會從您的後端獲取實際的圖表數據或圖片
-    # 目前我們只返回一些佔位圖片或數據
+    """獲取圖表數據API，stem 參數省略時使用第一個 stem"""
+    if chart_type not in CHART_TYPES:
+        return jsonify({"status": "error", "message": "不支援的圖表類型"}), 404
+
+    stems = get_chart_service().stems(job_id)
+    if not stems:
+        return jsonify({"status": "error", "message": "找不到分析結果"}), 404
+
+    stem_id = request.args.get("stem", stems[0])
+    if stem_id not in stems:
+        return jsonify({"status": "error", "message": "找不到指定的 stem"}), 404
+
+    chart_url = url_for(
+        "main.chart_image",
+        job_id=job_id,
+        stem_id=stem_id,
+        chart_type=chart_type,
+        fmt=request.args.get("format", "png"),
+    )
+    return jsonify(
+        {
+            "status": "success",
+            "chart_url": chart_url,
+            "chart_type": chart_type,
+            "stem": stem_id,
+            "stems": stems,
+        }
+    )
+
 
-    # 模擬返回圖片URL
-    chart_url = f"/static/img/placeholder_{chart_type}.png"
+@main_bp.route("/charts/<job_id>/<stem_id>/<chart_type>.<fmt>")
+def chart_image(job_id, stem_id, chart_type, fmt):
+    """依請求繪製圖表，支援 If-None-Match 條件請求"""
+    chart = get_chart_service().chart(job_id, stem_id, chart_type, fmt)
+    if chart is None:
+        return jsonify({"status": "error", "message": "找不到圖表"}), 404
+
+    etag, data = chart
+    response = Response(data, mimetype=CHART_MIMETYPES[fmt])
+    response.set_etag(etag)
+    # 圖表內容隨分析結果變更，瀏覽器每次以 ETag 確認後沿用快取
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@main_bp.route("/api/chart-data/<job_id>/<chart_type>")
+def get_chart_data(job_id, chart_type):
+    """
+    取得圖表的分數序列供前端繪製
+
+    查詢參數：stem（省略時使用第一個 stem）、points（點數上限）、
+    start/end（位置範圍，秒）、method（lttb 或 minmax）
+    """
+    service = get_chart_service()
+    stem_id = request.args.get("stem")
+    if stem_id is None:
+        stems = service.stems(job_id)
+        stem_id = stems[0] if stems else ""
+
+    points = request.args.get("points", current_app.config["CHART_DEFAULT_POINTS"], type=int)
+    # 至少保留頭尾與一個中間點，降採樣才有意義
+    points = max(3, min(points, current_app.config["CHART_MAX_POINTS"]))
+    method = request.args.get("method", "lttb")
+    data = service.series_data(
+        job_id,
+        stem_id,
+        chart_type,
+        points,
+        start=request.args.get("start", type=float),
+        end=request.args.get("end", type=float),
+        method=method,
+    )
+    if data is None:
+        return jsonify({"status": "error", "message": "找不到圖表資料"}), 404
 
     return jsonify(
-        {"status": "success", "chart_url": chart_url, "chart_type": chart_type}
+        {
+            "status": "success",
+            "job_id": job_id,
+            "stem": stem_id,
+            "chart_type": chart_type,
+            "method": method,
+            **data,
+        }
     )
 
 
+def get_chart_service():
+    """取得應用程式的圖表服務"""
+    return current_app.extensions["chart_service"]
+
+
 @main_bp.route("/download/<job_id>")
 def download_results(job_id):
     """下載處理結果"""
-    # 檢查結果目錄是否存在
-    results_dir = os.path.join(current_app.config["DOWNLOAD_FOLDER"], job_id)
-    if not os.path.exists(results_dir):
-        flash("找不到處理結果", "danger")
-        return redirect(url_for("main.result_page", job_id=job_id))
-
     # 讀取分析結果
-    analysis_path = os.path.join(results_dir, "analysis_result.json")
-    if not os.path.exists(analysis_path):
+    analysis_result = get_job_repository().get_result(job_id)
+    if analysis_result is None:
         flash("找不到分析結果", "danger")
         return redirect(url_for("main.result_page", job_id=job_id))
 
-    # 創建臨時目錄來存放MIDI檔案
-    temp_dir = os.path.join(results_dir, "temp_midi")
-    os.makedirs(temp_dir, exist_ok=True)
+    results_dir = os.path.abspath(
+        os.path.join(current_app.config["DOWNLOAD_FOLDER"], job_id)
+    )
+    zip_filename = f"converted_files_{job_id}.zip"
 
     try:
-        # 讀取分析結果
-        with open(analysis_path, "r", encoding="utf-8") as f:
-            analysis_result = json.load(f)
-
-        # 為每個軌道創建模擬MIDI檔案
-        for track in analysis_result.get("tracks", []):
-            midi_filename = f"{track['instrument']}.MIDI"
-            midi_path = os.path.join(temp_dir, midi_filename)
-
-            # 創建簡單的示例MIDI檔案
-            with open(midi_path, "w") as f:
-                f.write(f"This is a placeholder for {midi_filename}")
-
-        # 創建ZIP文件
-        zip_filename = f"converted_files_{job_id}.zip"
-        zip_path = os.path.join(current_app.config["DOWNLOAD_FOLDER"], zip_filename)
-
-        # 刪除已存在的ZIP檔案（如果有）
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
-
-        # 創建新的ZIP檔案
-        shutil.make_archive(zip_path[:-4], "zip", temp_dir)
-
-        # 確認ZIP檔案已創建
-        if not os.path.exists(zip_path):
-            flash("創建ZIP檔案失敗", "danger")
-            return redirect(url_for("main.result_page", job_id=job_id))
-
-        # 提供ZIP檔案下載
-        return send_from_directory(
-            directory=os.path.dirname(zip_path),
-            path=os.path.basename(zip_path),
-            as_attachment=True,
-            download_name=zip_filename,
-        )
-
+        entries = result_entries(analysis_result)
+
+        # 內容相同的 ZIP 已快取時直接送出檔案
+        cache_path = None
+        if current_app.config["DOWNLOAD_CACHE_ARCHIVES"]:
+            cache_path = cached_archive_path(results_dir, archive_digest(entries))
+            if os.path.exists(cache_path):
+                return send_from_directory(
+                    directory=os.path.dirname(cache_path),
+                    path=os.path.basename(cache_path),
+                    as_attachment=True,
+                    download_name=zip_filename,
+                )
     except Exception as e:
         # 捕獲並顯示任何錯誤
         flash(f"下載處理過程中發生錯誤: {str(e)}", "danger")
         return redirect(url_for("main.result_page", job_id=job_id))
 
-    finally:
-        # 清理臨時目錄（無論成功與否）
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
+    # 邊壓縮邊傳送，開啟快取時同時寫入快取檔（產生器不需要請求上下文）
+    return Response(
+        stream_zip(entries, cache_path),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={zip_filename}"},
+    )
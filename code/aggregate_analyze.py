@@ -1,61 +1,103 @@
 import os
 import json
-import numpy as np
+from scoring import calculate_breathing_suitability, calculate_technical_difficulty
+from note_store import load_track_stems
+from track_executor import list_track_folders, iter_tracks
+from streaming_stats import ScoreHistogram
 
 
-def calculate_breathing_suitability(notes):
-    """Calculates the breathing suitability scores for a list of notes."""
+def score_track_stems(stems):
+    """
+    Computes the breathing and difficulty series of every stem once.
+
+    Args:
+        stems (dict): Stem id -> columns, as returned by load_track_stems.
+
+    Returns:
+        dict: Stem id -> {"breathing": (positions, scores),
+        "difficulty": (positions, scores)}.
+    """
+
+    return {
+        stem_id: {
+            "breathing": calculate_breathing_suitability(columns),
+            "difficulty": calculate_technical_difficulty(columns),
+        }
+        for stem_id, columns in stems.items()
+    }
+
+
+def score_track_folder(track_folder, converted_root, store_root=None):
+    """Loads and scores every stem of one track folder under converted_root."""
+
+    stems = load_track_stems(os.path.join(converted_root, track_folder), store_root)
+    return score_track_stems(stems)
+
+
+def new_score_histograms():
+    """
+    Returns empty (breathing, difficulty) histograms for the global
+    statistics. Breathing scores below 0.01 are ignored.
+    """
+
+    return ScoreHistogram(min_value=0.01), ScoreHistogram()
+
+
+def add_track_scores(track_scores, breathing_hist, difficulty_hist):
+    """Adds every stem series of a scored track to the histograms."""
 
-    positions = []
-    suitability_scores = []
-    max_pause = 0
+    for series in track_scores.values():
+        breathing_hist.add(series["breathing"][1])
+        difficulty_hist.add(series["difficulty"][1])
 
-    for i in range(1, len(notes)):
-        pause_duration = (
-            notes[i]["position"] - notes[i - 1]["position"] - notes[i - 1]["duration"]
-        )
-        pause_duration = max(0, pause_duration)
-        positions.append(notes[i]["position"])
-        suitability_scores.append(pause_duration)
-        max_pause = max(max_pause, pause_duration)
 
-    if max_pause > 0:
-        suitability_scores = np.array(suitability_scores) / max_pause
-    else:
-        suitability_scores = np.zeros_like(suitability_scores)
+def aggregate_track_folder(track_folder, converted_root, store_root=None):
+    """Scores one track and returns its partial (breathing, difficulty) histograms."""
 
-    return positions, suitability_scores
+    breathing_hist, difficulty_hist = new_score_histograms()
+    add_track_scores(
+        score_track_folder(track_folder, converted_root, store_root),
+        breathing_hist,
+        difficulty_hist,
+    )
+    return breathing_hist, difficulty_hist
+
+
+def summarize_scores(breathing_hist, difficulty_hist):
+    """
+    Computes the average and the 25th/75th percentile bands of the pooled
+    breathing and difficulty scores. The bands are the means of the
+    20%-30% and 70%-80% slices of the sorted scores.
 
+    Returns:
+        tuple: (breathing_stats, difficulty_stats) dicts with "average",
+        "25th_percentile" and "75th_percentile" keys.
+    """
 
-def calculate_technical_difficulty(notes):
-    """Calculates the technical difficulty scores for a list of notes."""
+    breathing_stats = {
+        "average": breathing_hist.mean(),
+        "25th_percentile": breathing_hist.band_mean(0.2, 0.3),
+        "75th_percentile": breathing_hist.band_mean(0.7, 0.8),
+    }
+    difficulty_stats = {
+        "average": difficulty_hist.mean(),
+        "25th_percentile": difficulty_hist.band_mean(0.2, 0.3),
+        "75th_percentile": difficulty_hist.band_mean(0.7, 0.8),
+    }
+    return breathing_stats, difficulty_stats
 
-    positions = []
-    difficulty_scores = []
-    max_pitch_change = 0
-    max_density = 0
 
-    for i in range(1, len(notes)):
-        pitch1 = notes[i - 1]["octave"] * 12 + notes[i - 1]["pitch_class"]
-        pitch2 = notes[i]["octave"] * 12 + notes[i]["pitch_class"]
-        pitch_change = abs(pitch2 - pitch1)
-        note_density = 1 / notes[i]["duration"] if notes[i]["duration"] > 0 else 0
-        positions.append(notes[i]["position"])
-        difficulty_scores.append(pitch_change + note_density)
-        max_pitch_change = max(max_pitch_change, pitch_change)
-        max_density = max(max_density, note_density)
+def save_statistics(breathing_stats, difficulty_stats, output_root):
+    """Writes avg_breath.json and avg_difficult.json to output_root."""
 
-    if max_pitch_change + max_density > 0:
-        difficulty_scores = np.array(difficulty_scores) / (
-            max_pitch_change + max_density
-        )
-    else:
-        difficulty_scores = np.zeros_like(difficulty_scores)
+    with open(os.path.join(output_root, "avg_breath.json"), "w") as f:
+        json.dump(breathing_stats, f, indent=4)
 
-    return positions, difficulty_scores
+    with open(os.path.join(output_root, "avg_difficult.json"), "w") as f:
+        json.dump(difficulty_stats, f, indent=4)
 
 
-def analyze_and_aggregate(converted_root, output_root):
+def analyze_and_aggregate(converted_root, output_root, store_root=None, workers=None):
     """
     Analyzes all MIDI files and aggregates breathing suitability and
     technical difficulty data.
@@ -63,126 +105,39 @@ def analyze_and_aggregate(converted_root, output_root):
     Args:
         converted_root (str): Root path to the converted JSON data.
         output_root (str): Root path for output files.
-    """
+        store_root (str): Root path to the binary note store. Tracks found
+            there are memory-mapped instead of parsing their JSON files.
+        workers (int): Number of worker processes, see run_tracks.
 
-    all_breathing_scores = []
-    all_difficulty_scores = []
-
-    for track_folder in os.listdir(converted_root):
-        converted_track_folder_path = os.path.join(converted_root, track_folder)
-        if os.path.isdir(converted_track_folder_path) and track_folder.startswith(
-            "Track"
-        ):
-            for filename in os.listdir(converted_track_folder_path):
-                if filename.startswith("S") and filename.endswith(".json"):
-                    json_path = os.path.join(converted_track_folder_path, filename)
-                    try:
-                        with open(json_path, "r") as f:
-                            notes_data = json.load(f)
-                            if (
-                                not isinstance(notes_data, list) or not notes_data
-                            ):  # Check if notes_data is a list and not empty
-                                print(
-                                    f"[警告] {json_path} does not contain valid note data, skipping"
-                                )
-                                continue
-                            notes_data = notes_data[0]
-                    except FileNotFoundError:
-                        print(f"[警告] 找不到 {json_path}，略過")
-                        continue
-                    except json.JSONDecodeError:
-                        print(f"[警告] {json_path} is not a valid JSON file, skipping")
-                        continue
-
-                    _, breathing_scores = calculate_breathing_suitability(notes_data)
-                    _, difficulty_scores = calculate_technical_difficulty(notes_data)
-
-                    all_breathing_scores.extend(breathing_scores)
-                    all_difficulty_scores.extend(difficulty_scores)
-
-    # Calculate statistics for breathing scores, ignoring values less than 0.01
-    valid_breathing_scores = [
-        score for score in all_breathing_scores if score >= 0.01
-    ]
-    avg_breathing = (
-        np.mean(valid_breathing_scores) if valid_breathing_scores else 0
-    )  # Only calculate if there are valid scores
-    sorted_breathing_scores = sorted(valid_breathing_scores)
-    q1_breathing = (
-        np.mean(
-            sorted_breathing_scores[
-                int(len(sorted_breathing_scores) * 0.2) : int(
-                    len(sorted_breathing_scores) * 0.3
-                )
-            ]
-        )
-        if sorted_breathing_scores
-        else 0
-    )
-    q3_breathing = (
-        np.mean(
-            sorted_breathing_scores[
-                int(len(sorted_breathing_scores) * 0.7) : int(
-                    len(sorted_breathing_scores) * 0.8
-                )
-            ]
-        )
-        if sorted_breathing_scores
-        else 0
-    )
+    Returns:
+        tuple: (breathing_stats, difficulty_stats) as written to output_root.
+    """
 
-    # Calculate statistics for difficulty scores (no change needed here)
-    avg_difficulty = np.mean(all_difficulty_scores) if all_difficulty_scores else 0
-    sorted_difficulty_scores = sorted(all_difficulty_scores)
-    q1_difficulty = (
-        np.mean(
-            sorted_difficulty_scores[
-                int(len(sorted_difficulty_scores) * 0.2) : int(
-                    len(sorted_difficulty_scores) * 0.3
-                )
-            ]
-        )
-        if sorted_difficulty_scores
-        else 0
-    )
-    q3_difficulty = (
-        np.mean(
-            sorted_difficulty_scores[
-                int(len(sorted_difficulty_scores) * 0.7) : int(
-                    len(sorted_difficulty_scores) * 0.8
-                )
-            ]
-        )
-        if sorted_difficulty_scores
-        else 0
+    # 每個 worker 回傳該 Track 的部分直方圖，主程序在結果送達時立即合併後丟棄，
+    # 記憶體用量不隨 Track 數量增加
+    breathing_hist, difficulty_hist = new_score_histograms()
+    for _, partial, error in iter_tracks(
+        aggregate_track_folder,
+        list_track_folders(converted_root),
+        converted_root,
+        store_root,
+        workers=workers,
+    ):
+        if error is None:
+            track_breathing_hist, track_difficulty_hist = partial
+            breathing_hist.merge(track_breathing_hist)
+            difficulty_hist.merge(track_difficulty_hist)
+
+    breathing_stats, difficulty_stats = summarize_scores(
+        breathing_hist, difficulty_hist
     )
-
-    # Save statistics to JSON files
-    with open(os.path.join(output_root, "avg_breath.json"), "w") as f:
-        json.dump(
-            {
-                "average": avg_breathing,
-                "25th_percentile": q1_breathing,
-                "75th_percentile": q3_breathing,
-            },
-            f,
-            indent=4,
-        )
-
-    with open(os.path.join(output_root, "avg_difficult.json"), "w") as f:
-        json.dump(
-            {
-                "average": avg_difficulty,
-                "25th_percentile": q1_difficulty,
-                "75th_percentile": q3_difficulty,
-            },
-            f,
-            indent=4,
-        )
+    save_statistics(breathing_stats, difficulty_stats, output_root)
+    return breathing_stats, difficulty_stats
 
 
 if __name__ == "__main__":
     converted_root = "./converted_json"  # 修改為你的 converted_json 資料夾路徑
     output_root = "./output"  # 輸出資料夾的根路徑
-    analyze_and_aggregate(converted_root, output_root)
+    store_root = "./converted_npy"  # slakh_midi_to_json.py 產生的二進位 note store
+    analyze_and_aggregate(converted_root, output_root, store_root)
     print("🎉 統計資料彙總完成！")
\ No newline at end of file
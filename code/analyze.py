@@ -1,8 +1,19 @@
 import os
-import json
 import numpy as np
-import matplotlib.pyplot as plt
-import subprocess  # 用於執行外部 Python 腳本
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from scoring import calculate_breathing_suitability, calculate_technical_difficulty
+import scoring
+from note_store import load_track_stems, stem_source_files
+from aggregate_analyze import (
+    score_track_stems,
+    new_score_histograms,
+    add_track_scores,
+    summarize_scores,
+    save_statistics,
+)
+from track_executor import list_track_folders, run_tracks, iter_tracks
+from build_manifest import BuildManifest, MANIFEST_FILENAME, hash_code, hash_params
 
 # ANSI 顏色程式碼 (用於終端輸出)
 RED = "\033[91m"
@@ -10,135 +21,203 @@ GREEN = "\033[92m"
 BLUE = "\033[94m"
 RESET = "\033[0m"
 
+# 繪圖程式碼變更時需重繪所有圖表
+CODE_FILES = [__file__, scoring.__file__]
+# True 時每個 stem 輸出一張上下排列兩張圖的 {stem}_analysis.png，只需繪製一次
+COMBINED_PLOTS = False
 
-def calculate_breathing_suitability(notes):
-    """Calculates the breathing suitability scores for a list of notes."""
 
-    positions = []
-    suitability_scores = []
-    max_pause = 0
-
-    for i in range(1, len(notes)):
-        pause_duration = (
-            notes[i]["position"] - notes[i - 1]["position"] - notes[i - 1]["duration"]
-        )
-        pause_duration = max(0, pause_duration)
-        positions.append(notes[i]["position"])
-        suitability_scores.append(pause_duration)
-        max_pause = max(max_pause, pause_duration)
-
-    if max_pause > 0:
-        suitability_scores = np.array(suitability_scores) / max_pause
-    else:
-        suitability_scores = np.zeros_like(suitability_scores)
-
-    return positions, suitability_scores
-
-
-def calculate_technical_difficulty(notes):
-    """Calculates the technical difficulty scores for a list of notes."""
+class ScorePlot:
+    """
+    A score line with average and quartile reference lines on one axes.
 
-    positions = []
-    difficulty_scores = []
-    max_pitch_change = 0
-    max_density = 0
+    The artists are created once; update() only replaces their data and
+    labels, so the same axes can draw every stem.
+    """
 
-    for i in range(1, len(notes)):
-        pitch1 = notes[i - 1]["octave"] * 12 + notes[i - 1]["pitch_class"]
-        pitch2 = notes[i]["octave"] * 12 + notes[i]["pitch_class"]
-        pitch_change = abs(pitch2 - pitch1)
-        note_density = 1 / notes[i]["duration"] if notes[i]["duration"] > 0 else 0
-        positions.append(notes[i]["position"])
-        difficulty_scores.append(pitch_change + note_density)
-        max_pitch_change = max(max_pitch_change, pitch_change)
-        max_density = max(max_density, note_density)
+    def __init__(self, ax, title, ylabel):
+        self.ax = ax
+        (self.line,) = ax.plot([], [])
+        self.reference_lines = [
+            ax.axhline(y=0, color="red", linestyle="-"),
+            ax.axhline(y=0, color="blue", linestyle="--"),
+            ax.axhline(y=0, color="green", linestyle="--"),
+        ]
+        ax.set_title(title)
+        ax.set_xlabel("Position (seconds)")
+        ax.set_ylabel(ylabel)
+
+    def update(self, series, avg, q1, q3):
+        positions, scores = series
+        self.line.set_data(positions, scores)
+
+        # 與 axhline 相同：先依分數決定範圍，參考線落在範圍外時才擴大 Y 軸
+        for line in self.reference_lines:
+            line.set_visible(False)
+        self.ax.relim(visible_only=True)
+        self.ax.autoscale_view()
+        for line, label, value in zip(
+            self.reference_lines, ("Avg", "25th", "75th"), (avg, q1, q3)
+        ):
+            line.set_ydata([value, value])
+            line.set_label(f"{label}: {value:.2f}")
+            line.set_visible(True)
+            ymin, ymax = self.ax.get_ybound()
+            if value < ymin or value > ymax:
+                self.ax.relim(visible_only=True)
+                self.ax.autoscale_view(scalex=False)
+        self.ax.legend()  # 顯示圖例
+
+
+BREATHING_PLOT = (
+    "Breathing Suitability Analysis\n(Higher score = more suitable)",
+    "Suitability Score",
+)
+DIFFICULTY_PLOT = (
+    "Technical Difficulty Analysis\n(Higher score = more difficult)",
+    "Difficulty Score",
+)
+
+# 每個程序各自保留一組 Figure，逐 stem 更新資料後輸出，不重建座標軸
+_figures = {}
+
+
+def get_score_figure(kind):
+    """
+    Returns this process's reusable Agg figure and its ScorePlots.
 
-    if max_pitch_change + max_density > 0:
-        difficulty_scores = np.array(difficulty_scores) / (
-            max_pitch_change + max_density
-        )
-    else:
-        difficulty_scores = np.zeros_like(difficulty_scores)
+    Args:
+        kind (str): "breathing", "difficulty", or "combined" for both
+            plots stacked in one figure.
+    """
 
-    return positions, difficulty_scores
+    if kind not in _figures:
+        layouts = {
+            "breathing": [BREATHING_PLOT],
+            "difficulty": [DIFFICULTY_PLOT],
+            "combined": [BREATHING_PLOT, DIFFICULTY_PLOT],
+        }[kind]
+        fig = Figure(figsize=(10, 5 * len(layouts)))
+        FigureCanvasAgg(fig)
+        # 上下排列時留出 X 軸標籤與下一張標題的間距
+        axes = fig.subplots(
+            len(layouts), 1, squeeze=False, gridspec_kw={"hspace": 0.45}
+        )[:, 0]
+        plots = [ScorePlot(ax, *layout) for ax, layout in zip(axes, layouts)]
+        _figures[kind] = (fig, plots)
+    return _figures[kind]
 
 
 def analyze_breathing_suitability(
-    notes, output_path, avg_breathing, q1_breathing, q3_breathing
+    notes, output_path, avg_breathing, q1_breathing, q3_breathing, series=None
 ):
     """
     Analyzes the breathing suitability of a sequence of notes and plots
     the results with average and quartile lines.
 
     Args:
-        notes (list): A list of note data.
+        notes (list or dict): A list of note data, or columns from notes_to_columns.
         output_path (str): The path to save the generated plot.
         avg_breathing (float): Average breathing suitability score.
         q1_breathing (float): 25th percentile of breathing suitability scores.
         q3_breathing (float): 75th percentile of breathing suitability scores.
+        series (tuple): Precomputed (positions, scores); computed from notes
+            when omitted.
     """
 
-    positions, suitability_scores = calculate_breathing_suitability(notes)
+    if series is None:
+        series = calculate_breathing_suitability(notes)
 
-    plt.figure(figsize=(10, 5))
-    plt.plot(positions, suitability_scores)
-    plt.axhline(
-        y=avg_breathing, color="red", linestyle="-", label=f"Avg: {avg_breathing:.2f}"
-    )
-    plt.axhline(
-        y=q1_breathing, color="blue", linestyle="--", label=f"25th: {q1_breathing:.2f}"
-    )
-    plt.axhline(
-        y=q3_breathing, color="green", linestyle="--", label=f"75th: {q3_breathing:.2f}"
-    )
-    plt.title("Breathing Suitability Analysis\n(Higher score = more suitable)")
-    plt.xlabel("Position (seconds)")
-    plt.ylabel("Suitability Score")
-    plt.legend()  # 顯示圖例
-    plt.savefig(output_path)
-    plt.close()
+    fig, (plot,) = get_score_figure("breathing")
+    plot.update(series, avg_breathing, q1_breathing, q3_breathing)
+    fig.savefig(output_path)
 
 
 def analyze_technical_difficulty(
-    notes, output_path, avg_difficulty, q1_difficulty, q3_difficulty
+    notes, output_path, avg_difficulty, q1_difficulty, q3_difficulty, series=None
 ):
     """
     Analyzes the technical difficulty of a sequence of notes and plots
     the results with average and quartile lines.
 
     Args:
-        notes (list): A list of note data.
+        notes (list or dict): A list of note data, or columns from notes_to_columns.
         output_path (str): The path to save the generated plot.
         avg_difficulty (float): Average technical difficulty score.
         q1_difficulty (float): 25th percentile of technical difficulty scores.
         q3_difficulty (float): 75th percentile of technical difficulty scores.
+        series (tuple): Precomputed (positions, scores); computed from notes
+            when omitted.
     """
 
-    positions, difficulty_scores = calculate_technical_difficulty(notes)
+    if series is None:
+        series = calculate_technical_difficulty(notes)
 
-    plt.figure(figsize=(10, 5))
-    plt.plot(positions, difficulty_scores)
-    plt.axhline(
-        y=avg_difficulty, color="red", linestyle="-", label=f"Avg: {avg_difficulty:.2f}"
-    )
-    plt.axhline(
-        y=q1_difficulty,
-        color="blue",
-        linestyle="--",
-        label=f"25th: {q1_difficulty:.2f}",
-    )
-    plt.axhline(
-        y=q3_difficulty,
-        color="green",
-        linestyle="--",
-        label=f"75th: {q3_difficulty:.2f}",
-    )
-    plt.title("Technical Difficulty Analysis\n(Higher score = more difficult)")
-    plt.xlabel("Position (seconds)")
-    plt.ylabel("Difficulty Score")
-    plt.legend()  # 顯示圖例
-    plt.savefig(output_path)
-    plt.close()
+    fig, (plot,) = get_score_figure("difficulty")
+    plot.update(series, avg_difficulty, q1_difficulty, q3_difficulty)
+    fig.savefig(output_path)
+
+
+def analyze_stem(track_series, output_path, breathing_stats, difficulty_stats):
+    """
+    Plots the breathing and difficulty scores of one stem into a single
+    figure, rendered in one pass.
+
+    Args:
+        track_series (dict): "breathing" and "difficulty" (positions, scores).
+        output_path (str): The path to save the generated plot.
+        breathing_stats (tuple): (average, 25th, 75th) breathing scores.
+        difficulty_stats (tuple): (average, 25th, 75th) difficulty scores.
+    """
+
+    fig, (breathing_plot, difficulty_plot) = get_score_figure("combined")
+    breathing_plot.update(track_series["breathing"], *breathing_stats)
+    difficulty_plot.update(track_series["difficulty"], *difficulty_stats)
+    fig.savefig(output_path)
+
+
+def stem_plot_paths(output_folder_path, stem_id):
+    """Paths of the plots of one stem, depending on COMBINED_PLOTS."""
+
+    if COMBINED_PLOTS:
+        return [os.path.join(output_folder_path, f"{stem_id}_analysis.png")]
+    return [
+        os.path.join(output_folder_path, f"{stem_id}_breathing.png"),
+        os.path.join(output_folder_path, f"{stem_id}_difficulty.png"),
+    ]
+
+
+def stem_averages(series):
+    """Mean breathing and difficulty score of one scored stem (0 without scores)."""
+
+    breathing_scores = series["breathing"][1]
+    difficulty_scores = series["difficulty"][1]
+    return {
+        "breath": float(np.mean(breathing_scores)) if len(breathing_scores) > 0 else 0.0,
+        "difficulty": float(np.mean(difficulty_scores)) if len(difficulty_scores) > 0 else 0.0,
+    }
+
+
+def plot_stem(series, outputs, breathing_stats, difficulty_stats):
+    """
+    Plots one scored stem to the paths from stem_plot_paths.
+
+    Args:
+        series (dict): "breathing" and "difficulty" (positions, scores).
+        outputs (list): Plot paths, see stem_plot_paths.
+        breathing_stats (tuple): (average, 25th, 75th) breathing scores.
+        difficulty_stats (tuple): (average, 25th, 75th) difficulty scores.
+    """
+
+    if COMBINED_PLOTS:
+        analyze_stem(series, outputs[0], breathing_stats, difficulty_stats)
+    else:
+        analyze_breathing_suitability(
+            None, outputs[0], *breathing_stats, series=series["breathing"]
+        )
+        analyze_technical_difficulty(
+            None, outputs[1], *difficulty_stats, series=series["difficulty"]
+        )
 
 
 def process_track_folder(
@@ -150,90 +229,163 @@ def process_track_folder(
     avg_difficulty,
     q1_difficulty,
     q3_difficulty,
+    store_root=None,
+    track_scores=None,
 ):
     """
     Processes all SXX.json files within a given track folder and returns
-    a dictionary of analysis results keyed by filename.
+    a dictionary of analysis results keyed by filename. Tracks present in
+    the note store under store_root are read from there instead.
+
+    track_scores, as returned by score_track_stems, skips loading and
+    scoring the stems again.
     """
     track_folder_name = os.path.basename(converted_track_folder_path)
-    output_folder_name = track_folder_name + "_features"
-    output_folder_path = os.path.join(output_root, output_folder_name)
+    output_folder_path = os.path.join(output_root, track_folder_name + "_features")
     os.makedirs(output_folder_path, exist_ok=True)
 
-    analysis_results = {}
+    if track_scores is None:
+        stems = load_track_stems(converted_track_folder_path, store_root)
+        track_scores = score_track_stems(stems)
 
-    for filename in os.listdir(converted_track_folder_path):
-        if filename.startswith("S") and filename.endswith(".json"):
-            stem_id = filename.replace(".json", "")
-            json_path = os.path.join(converted_track_folder_path, filename)
-            output_breathing_path = os.path.join(
-                output_folder_path, f"{stem_id}_breathing.png"
-            )
-            output_difficulty_path = os.path.join(
-                output_folder_path, f"{stem_id}_difficulty.png"
-            )
-
-            try:
-                with open(json_path, "r") as f:
-                    notes_data = json.load(f)
-                    if not isinstance(notes_data, list) or not notes_data:
-                        print(f"[警告] {json_path} does not contain valid note data, skipping")
-                        continue
-                    notes_data = notes_data[0]
-            except FileNotFoundError:
-                print(f"[警告] 找不到 {json_path}，略過")
-                continue
-            except json.JSONDecodeError:
-                print(f"[警告] {json_path} is not a valid JSON file, skipping")
-                continue
-
-            # Calculate and store the mean values with the filename as key
-            breathing_positions, breathing_scores = calculate_breathing_suitability(notes_data)
-            avg_breathing_score = np.mean(breathing_scores) if len(breathing_scores) > 0 else 0
-
-            difficulty_positions, difficulty_scores = calculate_technical_difficulty(notes_data)
-            avg_difficulty_score = np.mean(difficulty_scores) if len(difficulty_scores) > 0 else 0
-
-            analysis_results[filename] = {
-                "breath": avg_breathing_score,
-                "difficulty": avg_difficulty_score,
-            }
-
-            # Plot with global averages and quartiles
-            analyze_breathing_suitability(
-                notes_data,
-                output_breathing_path,
-                avg_breathing,
-                q1_breathing,
-                q3_breathing,
-            )
-            analyze_technical_difficulty(
-                notes_data,
-                output_difficulty_path,
-                avg_difficulty,
-                q1_difficulty,
-                q3_difficulty,
-            )
-
-            print(f"✅ 已處理 {filename}")
+    analysis_results = {}
+    for stem_id, series in track_scores.items():
+        analysis_results[f"{stem_id}.json"] = stem_averages(series)
+        # Plot with global averages and quartiles
+        plot_stem(
+            series,
+            stem_plot_paths(output_folder_path, stem_id),
+            (avg_breathing, q1_breathing, q3_breathing),
+            (avg_difficulty, q1_difficulty, q3_difficulty),
+        )
+        print(f"✅ 已處理 {stem_id}.json")
 
     return analysis_results
 
 
+def score_track(track_folder, manifest, converted_root, output_root, store_root=None, code_digest=None):
+    """
+    First pass over one track: loads and scores every stem once.
+
+    Besides the track's partial histograms for the global statistics, each
+    stem gets its averages and its manifest fingerprint (without the
+    reference lines, which are only known once every track is scored).
+    The score series is kept only for stems whose notes, plotting code or
+    plots changed since they were last drawn; other stems need a redraw
+    only if the reference lines moved.
+
+    Args:
+        manifest (BuildManifest): This track's entries, see
+            BuildManifest.track_manifests.
+        code_digest (str): Defaults to hash_code(CODE_FILES).
+
+    Returns:
+        tuple: (breathing histogram, difficulty histogram, stems), where
+        stems maps stem id -> {"result", "fingerprint", "params", "series"};
+        "params" is the digest the current plots were drawn with, or None.
+    """
+
+    converted_track_folder_path = os.path.join(converted_root, track_folder)
+    output_folder_path = os.path.join(output_root, track_folder + "_features")
+    code_digest = code_digest or hash_code(CODE_FILES)
+
+    track_scores = score_track_stems(load_track_stems(converted_track_folder_path, store_root))
+    breathing_hist, difficulty_hist = new_score_histograms()
+    add_track_scores(track_scores, breathing_hist, difficulty_hist)
+
+    stems = {}
+    for stem_id, series in track_scores.items():
+        key = f"{track_folder}/{stem_id}"
+        fingerprint = manifest.fingerprint(
+            key,
+            stem_source_files(converted_track_folder_path, stem_id, store_root),
+            code_digest,
+        )
+        entry = manifest.entries.get(key)
+        params = entry["params"] if entry is not None else None
+        # 以上次繪圖的參考線比對：只有參考線可能變更的 stem 不保留分數序列
+        current = params is not None and not manifest.is_stale(
+            key,
+            dict(fingerprint, params=params),
+            stem_plot_paths(output_folder_path, stem_id),
+        )
+        stems[stem_id] = {
+            "result": stem_averages(series),
+            "fingerprint": fingerprint,
+            "params": params,
+            "series": None if current else series,
+        }
+    return breathing_hist, difficulty_hist, stems
+
+
+def render_track(
+    track_folder,
+    stems,
+    converted_root,
+    output_root,
+    breathing_stats,
+    difficulty_stats,
+    store_root=None,
+):
+    """
+    Second pass over one track: plots the given stems.
+
+    stems maps stem id -> score series, as kept by score_track. A stem
+    without a series (its plots only need new reference lines) is scored
+    again from the note store.
+
+    Returns:
+        dict: Stem id -> list of written plot paths.
+    """
+
+    converted_track_folder_path = os.path.join(converted_root, track_folder)
+    output_folder_path = os.path.join(output_root, track_folder + "_features")
+    os.makedirs(output_folder_path, exist_ok=True)
+
+    missing = [stem_id for stem_id, series in stems.items() if series is None]
+    if missing:
+        track_stems = load_track_stems(converted_track_folder_path, store_root)
+        rescored = score_track_stems({stem_id: track_stems[stem_id] for stem_id in missing})
+        stems = dict(stems, **rescored)
+
+    written = {}
+    for stem_id, series in stems.items():
+        outputs = stem_plot_paths(output_folder_path, stem_id)
+        plot_stem(series, outputs, breathing_stats, difficulty_stats)
+        written[stem_id] = outputs
+        print(f"✅ 已處理 {track_folder}/{stem_id}.json")
+    return written
+
+
 if __name__ == "__main__":
     converted_root = "./converted_json"  # 修改為你的 converted_json 資料夾路徑
     output_root = "./output"  # 輸出資料夾的根路徑
+    store_root = "./converted_npy"  # slakh_midi_to_json.py 產生的二進位 note store
     os.makedirs(output_root, exist_ok=True)
 
-    # 執行 aggregate_analysis.py 進行資料彙總
-    subprocess.run(["python", "./code/aggregate_analyze.py"], check=True)
-
-    # Load aggregated statistics
-    with open(os.path.join(output_root, "avg_breath.json"), "r") as f:
-        avg_breath_data = json.load(f)
-
-    with open(os.path.join(output_root, "avg_difficult.json"), "r") as f:
-        avg_difficult_data = json.load(f)
+    # 各 Track 以 process pool 平行處理，TRACK_WORKERS 環境變數可調整程序數
+    # 第一輪每個 stem 只讀取並計分一次：部分直方圖在送達時合併，主程序只保留
+    # 各 stem 的平均值與需要重繪的分數序列；程式碼摘要只計算一次
+    manifest = BuildManifest(os.path.join(output_root, MANIFEST_FILENAME))
+    track_folders = list_track_folders(converted_root)
+    breathing_hist, difficulty_hist = new_score_histograms()
+    all_stems = {}
+    for track_folder, scored, error in iter_tracks(
+        score_track,
+        track_folders,
+        converted_root,
+        output_root,
+        store_root,
+        hash_code(CODE_FILES),
+        track_inputs=manifest.track_manifests(track_folders),
+    ):
+        if error is None:
+            track_breathing_hist, track_difficulty_hist, all_stems[track_folder] = scored
+            breathing_hist.merge(track_breathing_hist)
+            difficulty_hist.merge(track_difficulty_hist)
+
+    avg_breath_data, avg_difficult_data = summarize_scores(breathing_hist, difficulty_hist)
+    save_statistics(avg_breath_data, avg_difficult_data, output_root)
 
     # Extract stats for easier use
     avg_breathing = avg_breath_data["average"]
@@ -242,43 +394,63 @@ if __name__ == "__main__":
     avg_difficulty = avg_difficult_data["average"]
     q1_difficulty = avg_difficult_data["25th_percentile"]
     q3_difficulty = avg_difficult_data["75th_percentile"]
+    breathing_stats = (avg_breathing, q1_breathing, q3_breathing)
+    difficulty_stats = (avg_difficulty, q1_difficulty, q3_difficulty)
+
+    # 參考線數值四捨五入後才納入比對，避免統計值的微小浮動觸發整批重繪
+    params = hash_params([round(value, 3) for value in breathing_stats + difficulty_stats])
+
+    # 第二輪只把需要重繪的 stem 交給 worker，輸入、程式碼與參考線都未變更的圖表不重繪
+    to_render = {}
+    for track_folder, stems in all_stems.items():
+        track_render = {}
+        for stem_id, info in stems.items():
+            if info["series"] is not None or info["params"] != params:
+                track_render[stem_id] = info.pop("series")
+            else:
+                print(f"- 未變更，略過 {track_folder}/{stem_id}.json")
+        if track_render:
+            to_render[track_folder] = track_render
+    rendered, _ = run_tracks(
+        render_track,
+        list(to_render),
+        converted_root,
+        output_root,
+        breathing_stats,
+        difficulty_stats,
+        store_root,
+        track_inputs=to_render,
+    )
+    for track_folder, written in rendered.items():
+        for stem_id, outputs in written.items():
+            key = f"{track_folder}/{stem_id}"
+            fingerprint = dict(all_stems[track_folder][stem_id]["fingerprint"], params=params)
+            manifest.record(key, fingerprint, outputs)
+    manifest.save()
 
     print("\n📊 所有 Track 的分析結果：")
-    for track_folder in os.listdir(converted_root):
+    for track_folder, stems in all_stems.items():
+        analysis_results = {f"{stem_id}.json": info["result"] for stem_id, info in stems.items()}
         converted_track_folder_path = os.path.join(converted_root, track_folder)
-        if (
-            os.path.isdir(converted_track_folder_path)
-            and track_folder.startswith("Track")
-        ):
-            print(f"\n🎵 {track_folder}:")
-            analysis_results = process_track_folder(
-                converted_track_folder_path,
-                output_root,
-                avg_breathing,
-                q1_breathing,
-                q3_breathing,
-                avg_difficulty,
-                q1_difficulty,
-                q3_difficulty,
-            )
-
-            for filename in os.listdir(converted_track_folder_path):
-                if filename.startswith("S") and filename.endswith(".json"):
-                    print(f"  - {filename}:")
-                    if filename in analysis_results:
-                        print(
-                            f"    Breath: {analysis_results[filename]['breath']:.4f} "
-                            f" (Avg: {RED}{avg_breathing:.4f}{RESET}, "
-                            f"Q1: {BLUE}{q1_breathing:.4f}{RESET}, "
-                            f"Q3: {GREEN}{q3_breathing:.4f}{RESET}) "
-                        )
-                        print(
-                            f"    Diff: {analysis_results[filename]['difficulty']:.4f} "
-                            f" (Avg: {RED}{avg_difficulty:.4f}{RESET}, "
-                            f"Q1: {BLUE}{q1_difficulty:.4f}{RESET}, "
-                            f"Q3: {GREEN}{q3_difficulty:.4f}{RESET}) "
-                        )
-                    else:
-                        print(f"    (分析失敗或跳過)")
+        print(f"\n🎵 {track_folder}:")
+
+        for filename in os.listdir(converted_track_folder_path):
+            if filename.startswith("S") and filename.endswith(".json"):
+                print(f"  - {filename}:")
+                if filename in analysis_results:
+                    print(
+                        f"    Breath: {analysis_results[filename]['breath']:.4f} "
+                        f" (Avg: {RED}{avg_breathing:.4f}{RESET}, "
+                        f"Q1: {BLUE}{q1_breathing:.4f}{RESET}, "
+                        f"Q3: {GREEN}{q3_breathing:.4f}{RESET}) "
+                    )
+                    print(
+                        f"    Diff: {analysis_results[filename]['difficulty']:.4f} "
+                        f" (Avg: {RED}{avg_difficulty:.4f}{RESET}, "
+                        f"Q1: {BLUE}{q1_difficulty:.4f}{RESET}, "
+                        f"Q3: {GREEN}{q3_difficulty:.4f}{RESET}) "
+                    )
+                else:
+                    print(f"    (分析失敗或跳過)")
 
     print("\n🎉 分析完成！")
\ No newline at end of file
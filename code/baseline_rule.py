@@ -1,65 +1,139 @@
 import os
 import json
-from collections import defaultdict
+import numpy as np
+from track_executor import list_track_folders, run_tracks
+from feature_table import load_feature_table, build_feature_table, default_table_path
+from feature_schema import read_features
 
 # 根資料夾設定
 features_root = "./features_json"
 output_root = "./output"
-os.makedirs(output_root, exist_ok=True)
 
-# 樂器分配
-instrument_assignments = defaultdict(lambda: defaultdict(bool))  # 追蹤樂器和聲部是否已分配
-available_parts = []  # 每個 Track 的可用聲部列表
+# 規則使用的特徵欄位與缺少時的預設值
+FEATURE_DEFAULTS = {
+    "avg_pitch": 0,
+    "min_pitch": 0,
+    "max_pitch": 127,
+    "avg_duration": 0,
+    "note_density": 0,
+}
+NUM_PARTS = 21  # 假設每個 Track 最多 21 個聲部，根據你的需求調整
+
+
+def features_table(stem_features):
+    """
+    Builds the features table of a list of stem feature dicts.
+
+    Returns:
+        dict: One float64 array per FEATURE_DEFAULTS column, one row per
+        stem; missing features take their default.
+    """
+
+    return {
+        column: np.array(
+            [features.get(column, default) for features in stem_features], dtype=np.float64
+        ).reshape(-1)
+        for column, default in FEATURE_DEFAULTS.items()
+    }
 
-# 樂器分類規則
-def classify_brass_instrument(features):
-    global instrument_assignments, available_parts
-
-    avg_pitch = features.get("avg_pitch", 0)
-    min_pitch = features.get("min_pitch", 0)
-    max_pitch = features.get("max_pitch", 127)
-    avg_duration = features.get("avg_duration", 0)
-    note_density = features.get("note_density", 0)
-    pitch_range = max_pitch - min_pitch
 
-    # 規則優先級
-    if avg_pitch > 70 and max_pitch > 80 and avg_duration < 0.5 and note_density > 1.5:
-        instrument = "Trumpet"
-    elif avg_pitch > 70 and max_pitch > 75 and pitch_range > 20:
-        instrument = "Trumpet"
-    elif 55 <= avg_pitch <= 70 and pitch_range > 25 and note_density < 1.5:
-        instrument = "French Horn"
-    elif avg_pitch < 55 and min_pitch < 50 and avg_duration > 0.6:
-        instrument = "Tuba"
-    elif avg_pitch < 60 and min_pitch < 55 and avg_duration > 0.5:
-        instrument = "Tuba"
-    # 備份規則
-    elif avg_pitch > 70:
-        instrument = "Trumpet"
-    elif 55 <= avg_pitch <= 70:
-        instrument = "French Horn"
-    else:
-        instrument = "Tuba"
+def fill_feature_defaults(columns):
+    """Features table from feature_table columns, with NaN (missing) values set to their default."""
 
-    # 找到可用的聲部
-    assigned_part = None
-    for part in available_parts:
-        if not instrument_assignments[instrument][part]:
-            assigned_part = part
-            break
+    return {
+        column: np.where(np.isnan(columns[column]), default, columns[column])
+        for column, default in FEATURE_DEFAULTS.items()
+    }
 
-    # 如果沒有可用的聲部，則分配第一個
-    if assigned_part is None:
-        assigned_part = available_parts[0]
 
-    instrument_assignments[instrument][assigned_part] = True
-    return instrument, assigned_part
+# 樂器分類規則
+def classify_instruments(table):
+    """
+    Applies the brass rules to every row of a features table at once.
+
+    Each rule is a boolean mask over the columns; np.select takes the
+    first matching rule per row, like the original if/elif chain.
+
+    Returns:
+        np.ndarray: Instrument name of every row.
+    """
+
+    avg_pitch = table["avg_pitch"]
+    min_pitch = table["min_pitch"]
+    max_pitch = table["max_pitch"]
+    avg_duration = table["avg_duration"]
+    note_density = table["note_density"]
+    pitch_range = max_pitch - min_pitch
+    mid_pitch = (avg_pitch >= 55) & (avg_pitch <= 70)
 
-# 處理每一個 track 資料夾
-for track_folder in os.listdir(features_root):
+    # 規則優先級
+    rules = [
+        ((avg_pitch > 70) & (max_pitch > 80) & (avg_duration < 0.5) & (note_density > 1.5), "Trumpet"),
+        ((avg_pitch > 70) & (max_pitch > 75) & (pitch_range > 20), "Trumpet"),
+        (mid_pitch & (pitch_range > 25) & (note_density < 1.5), "French Horn"),
+        ((avg_pitch < 55) & (min_pitch < 50) & (avg_duration > 0.6), "Tuba"),
+        ((avg_pitch < 60) & (min_pitch < 55) & (avg_duration > 0.5), "Tuba"),
+        # 備份規則
+        (avg_pitch > 70, "Trumpet"),
+        (mid_pitch, "French Horn"),
+    ]
+    return np.select(
+        [mask for mask, _ in rules],
+        [instrument for _, instrument in rules],
+        default="Tuba",
+    )
+
+
+def assign_parts(track_ids, instruments, num_parts=NUM_PARTS):
+    """
+    Numbers the stems of each instrument within each track.
+
+    The k-th stem (in row order) given an instrument in a track gets part
+    k; once all num_parts parts are taken, further stems share part 1.
+
+    Returns:
+        np.ndarray: Part number of every row.
+    """
+
+    track_codes = np.unique(np.asarray(track_ids), return_inverse=True)[1].reshape(-1)
+    instrument_codes = np.unique(np.asarray(instruments), return_inverse=True)[1].reshape(-1)
+
+    # 依 (track, 樂器) 穩定排序後，組內序號即為此樂器在此 track 中的第幾個 stem
+    order = np.lexsort((np.arange(len(track_codes)), instrument_codes, track_codes))
+    group = np.stack([track_codes[order], instrument_codes[order]], axis=1)
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = (group[1:] != group[:-1]).any(axis=1)
+    group_start = np.maximum.accumulate(np.where(new_group, np.arange(len(order)), 0))
+
+    parts = np.empty(len(order), dtype=np.int64)
+    parts[order] = np.arange(len(order)) - group_start + 1
+    parts[parts > num_parts] = 1
+    return parts
+
+
+def classify_stems(table, track_ids=None, num_parts=NUM_PARTS):
+    """
+    Classifies every non-drum stem of a features table, across any number
+    of tracks, in one call.
+
+    Args:
+        table (dict): Features table from features_table, rows in stem order.
+        track_ids (list): Track of every row; None treats all rows as one track.
+        num_parts (int): Parts available per instrument and track.
+
+    Returns:
+        list: (instrument, part) of every row.
+    """
+
+    instruments = classify_instruments(table)
+    if track_ids is None:
+        track_ids = np.zeros(len(instruments), dtype=np.int64)
+    parts = assign_parts(track_ids, instruments, num_parts)
+    return list(zip(instruments.tolist(), parts.tolist()))
+
+# 處理單一 track 資料夾
+def process_track(track_folder):
     track_path = os.path.join(features_root, track_folder)
-    if not os.path.isdir(track_path) or not track_folder.startswith("Track"):
-        continue
 
     print(f"\n🔍 處理中: {track_folder}")
 
@@ -67,7 +141,7 @@ for track_folder in os.listdir(features_root):
     metadata_path = os.path.join(track_path, "metadata.json")
     if not os.path.exists(metadata_path):
         print(f"[警告] 找不到 metadata.json，略過 {track_folder}")
-        continue
+        return None
 
     with open(metadata_path, "r") as f:
         metadata = json.load(f)
@@ -77,11 +151,8 @@ for track_folder in os.listdir(features_root):
         "stems": {}
     }
 
-    # 重置樂器分配和生成可用聲部列表
-    instrument_assignments.clear()
-    available_parts = list(range(1, 22))  # 假設最多 21 個聲部，根據你的需求調整
-
-    # 處理每個 stem S00～S20
+    # 先收集此 track 所有 stem，再一次分類並分配聲部
+    stem_rows = []
     for i in range(21):
         stem_id = f"S{i:02d}"
         json_path = os.path.join(track_path, f"{stem_id}.json")
@@ -95,22 +166,24 @@ for track_folder in os.listdir(features_root):
             continue
 
         stem_info = metadata["stems"][stem_id]
-        is_drum = stem_info.get("is_drum", False)
-        inst_class = stem_info.get("inst_class", "")
-
-        if is_drum:
-            assigned_instrument = "Drums"
-        else:
-            with open(json_path, "r") as f:
-                features = json.load(f)
-            assigned_instrument = classify_brass_instrument(features)
-
+        features = None
+        if not stem_info.get("is_drum", False):
+            features = read_features(json_path)
+        stem_rows.append((stem_id, stem_info.get("inst_class", ""), features))
+
+    pitched = [features for _, _, features in stem_rows if features is not None]
+    assignments = iter(classify_stems(features_table(pitched)))
+    for stem_id, inst_class, features in stem_rows:
         result_metadata["stems"][stem_id] = {
             "original_inst_class": inst_class,
-            "assigned_instrument": assigned_instrument
+            "assigned_instrument": "Drums" if features is None else next(assignments),
         }
 
-    # 輸出到對應的資料夾
+    return write_track_result(track_folder, result_metadata)
+
+
+# 輸出到對應的資料夾
+def write_track_result(track_folder, result_metadata):
     track_output_dir = os.path.join(output_root, track_folder)
     os.makedirs(track_output_dir, exist_ok=True)
     output_metadata_path = os.path.join(track_output_dir, "metadata.json")
@@ -118,5 +191,55 @@ for track_folder in os.listdir(features_root):
         json.dump(result_metadata, f, indent=4)
 
     print(f"✅ 已儲存至 {output_metadata_path}")
+    return output_metadata_path
+
+
+def process_feature_table(table):
+    """
+    Classifies every stem of a feature_table table in one call and writes
+    each track's output metadata.json.
+
+    Returns:
+        list: Paths of the written files.
+    """
 
-print("\n🎉 所有 track 資料夾處理完成！")
\ No newline at end of file
+    pitched = ~table["is_drum"]
+    features = fill_feature_defaults({column: table[column][pitched] for column in FEATURE_DEFAULTS})
+    assignments = iter(classify_stems(features, table["track"][pitched]))
+
+    results = {
+        track_folder: {"UUID": uuid, "stems": {}}
+        for track_folder, uuid in zip(table["tracks"].tolist(), table["uuids"].tolist())
+    }
+    for track_folder, stem_id, inst_class, is_drum in zip(
+        table["track"].tolist(),
+        table["stem"].tolist(),
+        table["inst_class"].tolist(),
+        table["is_drum"].tolist(),
+    ):
+        results[track_folder]["stems"][stem_id] = {
+            "original_inst_class": inst_class,
+            "assigned_instrument": "Drums" if is_drum else next(assignments),
+        }
+    return [
+        write_track_result(track_folder, result_metadata)
+        for track_folder, result_metadata in results.items()
+    ]
+
+
+if __name__ == "__main__":
+    # 有 feature_table.py 建立的特徵表時一次讀入並分類整個資料集，特徵檔在建表後
+    # 有變更時先重建特徵表；否則各 track 以 process pool 平行讀取逐 stem 的 JSON，
+    # 聲部依 track 各自分配
+    table_path = default_table_path(features_root)
+    table = load_feature_table(table_path, features_root)
+    if table is None and os.path.exists(table_path):
+        print(f"🔍 特徵檔已變更，重新建立特徵表 {table_path}")
+        build_feature_table(features_root, table_path)
+        table = load_feature_table(table_path)
+    if table is not None:
+        print(f"📄 使用特徵表 {table_path}")
+        process_feature_table(table)
+    else:
+        results, failures = run_tracks(process_track, list_track_folders(features_root))
+    print("\n🎉 所有 track 資料夾處理完成！")
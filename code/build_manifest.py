@@ -0,0 +1,168 @@
+import os
+import json
+import hashlib
+
+MANIFEST_FILENAME = ".build_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def _hash_bytes(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def hash_params(params):
+    """Returns the digest of JSON-serializable parameters stored in a fingerprint."""
+
+    return _hash_bytes(json.dumps(params, sort_keys=True).encode())
+
+
+def hash_file(path):
+    """Returns the SHA-1 of a file's content."""
+
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_code(code_files):
+    """Returns one digest over the source of every file in code_files."""
+
+    digest = hashlib.sha1()
+    for path in code_files:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class BuildManifest:
+    """
+    Records which inputs and code produced each derived artifact.
+
+    An entry is keyed by artifact (for example "Track00001/S00") and keeps
+    the content hash of every source file, a digest of the producing code,
+    a digest of extra parameters and the list of outputs. A source whose
+    size and mtime match the recorded values reuses its recorded hash, so
+    unchanged inputs are not read again.
+
+    Worker processes check staleness against the small per-track copies
+    from track_manifests() and return new entries, which the parent merges
+    with update() before save().
+
+    Args:
+        path (str): JSON file the manifest is loaded from and saved to.
+        entries (dict): Entries to start from instead of loading path.
+    """
+
+    def __init__(self, path, entries=None):
+        self.path = path
+        self.entries = {}
+        if entries is not None:
+            self.entries = dict(entries)
+        elif os.path.exists(path):
+            with open(path, "r") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data.get("entries", {})
+
+    def _source_state(self, key, path):
+        stat = os.stat(path)
+        recorded = self.entries.get(key, {}).get("sources", {}).get(path)
+        if (
+            recorded
+            and recorded["size"] == stat.st_size
+            and recorded["mtime_ns"] == stat.st_mtime_ns
+        ):
+            file_hash = recorded["sha1"]
+        else:
+            file_hash = hash_file(path)
+        return {"sha1": file_hash, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def fingerprint(self, key, sources, code_digest, params=None, source_states=None):
+        """
+        Describes the current inputs of an artifact.
+
+        Args:
+            key (str): Artifact key.
+            sources (list): Input file paths.
+            code_digest (str): Digest of the producing code, see hash_code.
+            params: JSON-serializable parameters that affect the output.
+            source_states (dict): States already computed for some of the
+                paths, e.g. another fingerprint's "sources"; they are reused
+                instead of hashing the files again.
+
+        Returns:
+            dict: Fingerprint to pass to is_stale and record.
+        """
+
+        source_states = source_states or {}
+        return {
+            "sources": {
+                path: source_states.get(path) or self._source_state(key, path)
+                for path in sources
+            },
+            "code": code_digest,
+            "params": hash_params(params),
+        }
+
+    def is_stale(self, key, fingerprint, outputs):
+        """Returns True if the artifact must be rebuilt."""
+
+        entry = self.entries.get(key)
+        if entry is None:
+            return True
+        if entry["code"] != fingerprint["code"] or entry["params"] != fingerprint["params"]:
+            return True
+
+        recorded = {path: state["sha1"] for path, state in entry["sources"].items()}
+        current = {
+            path: state["sha1"] for path, state in fingerprint["sources"].items()
+        }
+        if recorded != current:
+            return True
+        return not all(os.path.exists(path) for path in outputs)
+
+    def record(self, key, fingerprint, outputs):
+        """Stores the fingerprint of a freshly built artifact and returns the entry."""
+
+        entry = dict(fingerprint, outputs=list(outputs))
+        self.entries[key] = entry
+        return entry
+
+    def track_manifests(self, track_folders):
+        """
+        Splits the manifest into one copy per track, holding only the
+        entries whose key is the track folder or starts with "<track>/".
+
+        Returns:
+            dict: Track folder -> BuildManifest, for run_tracks track_inputs.
+        """
+
+        grouped = {track_folder: {} for track_folder in track_folders}
+        for key, entry in self.entries.items():
+            track_entries = grouped.get(key.split("/", 1)[0])
+            if track_entries is not None:
+                track_entries[key] = entry
+        return {
+            track_folder: BuildManifest(self.path, entries)
+            for track_folder, entries in grouped.items()
+        }
+
+    def update(self, entries):
+        """Merges entries recorded by another copy of the manifest."""
+
+        self.entries.update(entries)
+
+    def save(self):
+        """Writes the manifest atomically."""
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {"version": MANIFEST_VERSION, "entries": self.entries}, f, indent=1
+            )
+        os.replace(tmp_path, self.path)
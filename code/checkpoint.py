@@ -0,0 +1,141 @@
+# Model Checkpoints - versioned saves, TorchScript export and loading
+
+import os
+import re
+import sys
+import json
+import time
+import torch
+from model import MODEL_CLASSES
+
+CHECKPOINT_FORMAT = 1
+CHECKPOINT_DIR = "./checkpoints"
+TORCHSCRIPT_SUFFIX = ".ts"
+LABEL_MAP_FILE = "label_map.json"  # TorchScript 檔內附帶的標籤對照
+
+# 舊版 bilstm_model.pth 只有 state_dict，以 test.py 的預設設定還原
+LEGACY_MODEL = ("InstrumentBiLSTM", {"input_dim": 4, "hidden_dim": 64, "output_dim": 3})
+LEGACY_LABEL_MAP = {"trumpet": 0, "trombone": 1, "tuba": 2}
+
+_VERSION_PATTERN = re.compile(r"^bilstm_v(\d+)\.pt$")
+
+
+def list_checkpoints(checkpoint_dir=CHECKPOINT_DIR):
+    """Returns [(version, path)] of the checkpoints in checkpoint_dir, oldest first."""
+
+    if not os.path.isdir(checkpoint_dir):
+        return []
+    found = []
+    for filename in os.listdir(checkpoint_dir):
+        match = _VERSION_PATTERN.match(filename)
+        if match:
+            found.append((int(match.group(1)), os.path.join(checkpoint_dir, filename)))
+    return sorted(found)
+
+
+def latest_checkpoint(checkpoint_dir=CHECKPOINT_DIR):
+    """Path of the newest checkpoint, or None."""
+
+    checkpoints = list_checkpoints(checkpoint_dir)
+    return checkpoints[-1][1] if checkpoints else None
+
+
+def save_checkpoint(model, label_map, checkpoint_dir=CHECKPOINT_DIR, **metadata):
+    """
+    Saves model as the next version bilstm_vNNNN.pt in checkpoint_dir.
+
+    The checkpoint stores the model class and constructor arguments next to
+    the weights, so it can be loaded without knowing how it was built, plus
+    the label map the output ids refer to. Extra keyword arguments (e.g.
+    epochs, loss) are kept as metadata.
+
+    Returns:
+        str: Path of the new checkpoint.
+    """
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    checkpoints = list_checkpoints(checkpoint_dir)
+    version = checkpoints[-1][0] + 1 if checkpoints else 1
+    path = os.path.join(checkpoint_dir, f"bilstm_v{version:04d}.pt")
+
+    checkpoint = {
+        "format": CHECKPOINT_FORMAT,
+        "version": version,
+        "model_class": type(model).__name__,
+        "model_config": model.config(),
+        "label_map": dict(label_map),
+        "state_dict": model.state_dict(),
+        "saved_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "metadata": metadata,
+    }
+    # 先寫入暫存檔再替換，讀取端不會載入寫到一半的檔案
+    torch.save(checkpoint, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def load_checkpoint(path):
+    """
+    Loads a checkpoint saved by save_checkpoint, or a legacy state_dict file.
+
+    Returns:
+        tuple: (model in eval mode, label map).
+    """
+
+    checkpoint = torch.load(path, map_location="cpu", weights_only=True)
+    if "format" in checkpoint:
+        model_class, config = checkpoint["model_class"], checkpoint["model_config"]
+        state_dict, label_map = checkpoint["state_dict"], checkpoint["label_map"]
+    else:
+        (model_class, config), state_dict = LEGACY_MODEL, checkpoint
+        label_map = LEGACY_LABEL_MAP
+
+    model = MODEL_CLASSES[model_class](**config)
+    model.load_state_dict(state_dict)
+    model.eval()
+    return model, label_map
+
+
+def export_torchscript(model, label_map, path):
+    """
+    Compiles model with TorchScript and saves it with its label map.
+
+    The artifact loads with torch.jit.load alone, without the Python model
+    classes.
+    """
+
+    model.eval()
+    scripted = torch.jit.script(model)
+    torch.jit.save(scripted, path, _extra_files={LABEL_MAP_FILE: json.dumps(label_map)})
+    return path
+
+
+def load_torchscript(path):
+    """Loads an export_torchscript artifact; returns (module, label map)."""
+
+    extra_files = {LABEL_MAP_FILE: ""}
+    module = torch.jit.load(path, map_location="cpu", _extra_files=extra_files)
+    module.eval()
+    return module, json.loads(extra_files[LABEL_MAP_FILE])
+
+
+def load_model(path):
+    """Loads a TorchScript artifact (.ts) or a checkpoint; returns (model, label map)."""
+
+    if path.endswith(TORCHSCRIPT_SUFFIX):
+        return load_torchscript(path)
+    return load_checkpoint(path)
+
+
+if __name__ == "__main__":
+    # 用法：python checkpoint.py [checkpoint 路徑]，省略時匯出最新的 checkpoint
+    source = sys.argv[1] if len(sys.argv) > 1 else latest_checkpoint()
+    if source is None:
+        print(f"✗ {CHECKPOINT_DIR} 中沒有 checkpoint")
+        sys.exit(1)
+
+    model, label_map = load_checkpoint(source)
+    target = export_torchscript(
+        model, label_map, os.path.splitext(source)[0] + TORCHSCRIPT_SUFFIX
+    )
+    print(f"✓ 已匯出 TorchScript: {target}")
@@ -0,0 +1,184 @@
+# Feature Schema - compact per-stem feature summary and reader for old files
+
+import json
+import numpy as np
+
+# 第 1 版（無 schema_version）存放逐音符的 pitch_classes / octaves 列表，
+# 第 2 版改為固定大小的直方圖與百分位數，第 3 版加入複音與 IOI 統計
+SCHEMA_VERSION = 3
+OCTAVE_BINS = 11  # MIDI 音高 0-127 對應八度 0-10
+MAX_INTERVAL = 12  # 相鄰音符的音程截斷在 ±12 半音，共 25 格
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def pitch_histograms(pitch):
+    """Pitch-class (12) and octave (OCTAVE_BINS) note counts."""
+
+    pitch = np.asarray(pitch, dtype=np.int64)
+    return (
+        np.bincount(pitch % 12, minlength=12),
+        np.bincount(pitch // 12, minlength=OCTAVE_BINS),
+    )
+
+
+def interval_histogram(pitch):
+    """
+    Counts of the pitch steps between consecutive notes, clipped to
+    ±MAX_INTERVAL; bin MAX_INTERVAL + k holds steps of k semitones.
+    """
+
+    steps = np.clip(np.diff(np.asarray(pitch, dtype=np.int64)), -MAX_INTERVAL, MAX_INTERVAL)
+    return np.bincount(steps + MAX_INTERVAL, minlength=2 * MAX_INTERVAL + 1)
+
+
+def percentiles(values):
+    """PERCENTILES of values, or None when there are none."""
+
+    if len(values) == 0:
+        return None
+    return np.percentile(values, PERCENTILES).tolist()
+
+
+def polyphony_stats(start, end):
+    """
+    Sweeps note on/off events to measure how many notes sound at once.
+
+    Returns:
+        dict: max_polyphony, avg_polyphony (mean note count while anything
+        sounds) and polyphonic_ratio (share of that time with two or more
+        notes). The averages are None when no note has a duration.
+    """
+
+    count = len(start)
+    times = np.concatenate([start, end])
+    deltas = np.concatenate([np.ones(count, np.int64), -np.ones(count, np.int64)])
+    # 同一時間先處理 note off，首尾相接的音符不算重疊
+    order = np.lexsort((deltas, times))
+    active = np.cumsum(deltas[order])[:-1]
+    spans = np.diff(times[order])
+
+    sounding = spans[active > 0].sum()
+    if sounding <= 0:
+        return {"max_polyphony": 1, "avg_polyphony": None, "polyphonic_ratio": None}
+    return {
+        "max_polyphony": int(max(active.max(), 1)),
+        "avg_polyphony": float((active * spans).sum() / sounding),
+        "polyphonic_ratio": float(spans[active > 1].sum() / sounding),
+    }
+
+
+def ioi_stats(start):
+    """
+    Inter-onset intervals between distinct note starts (chords count once).
+
+    Returns:
+        dict: ioi_mean, ioi_median and ioi_std, None with fewer than two onsets.
+    """
+
+    ioi = np.diff(np.unique(start))
+    if len(ioi) == 0:
+        return {"ioi_mean": None, "ioi_median": None, "ioi_std": None}
+    return {
+        "ioi_mean": float(ioi.mean()),
+        "ioi_median": float(np.median(ioi)),
+        "ioi_std": float(ioi.std()),
+    }
+
+
+def compute_features(pitch, start, end, end_time):
+    """
+    Computes the compact feature summary of one stem from its note arrays.
+
+    Every statistic is an array reduction over the notes. Intervals follow
+    the notes in start order (pitch order for notes that start together).
+    note_density is 0 when the file has no length (end_time 0).
+
+    Returns:
+        dict: The summary, or None for a stem without notes.
+    """
+
+    pitch = np.asarray(pitch, dtype=np.int64)
+    if len(pitch) == 0:
+        return None
+
+    start = np.asarray(start, dtype=np.float64)
+    end = np.asarray(end, dtype=np.float64)
+    durations = end - start
+    pitch_class_counts, octave_counts = pitch_histograms(pitch)
+    order = np.lexsort((pitch, start))
+
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "min_pitch": int(pitch.min()),
+        "max_pitch": int(pitch.max()),
+        "avg_pitch": float(pitch.mean()),
+        "avg_duration": float(durations.mean()),
+        "avg_position": float(start.mean()),
+        "note_density": len(pitch) / end_time if end_time > 0 else 0.0,
+        "note_count": len(pitch),
+        "pitch_class_histogram": pitch_class_counts.tolist(),
+        "octave_histogram": octave_counts.tolist(),
+        "interval_histogram": interval_histogram(pitch[order]).tolist(),
+        "pitch_percentiles": percentiles(pitch),
+        "duration_percentiles": percentiles(durations),
+        **polyphony_stats(start, end),
+        **ioi_stats(start),
+    }
+
+
+def migrate_features(features):
+    """
+    Converts a feature dict of any schema version to the current one.
+
+    Version 1 dicts have their pitch_classes/octaves lists replaced by the
+    histograms. Their notes are in file order rather than start order, so
+    the interval histogram is an approximation, and durations were not
+    stored, so duration_percentiles is None. Polyphony and IOI statistics
+    need note times, which older versions did not store, so they are None.
+    The input is not modified.
+    """
+
+    version = features.get("schema_version", 1)
+    if version >= SCHEMA_VERSION:
+        return features
+
+    migrated = {
+        key: value
+        for key, value in features.items()
+        if key not in ("pitch_classes", "octaves")
+    }
+    if version < 2:
+        pitch = (
+            np.asarray(features.get("octaves", []), dtype=np.int64) * 12
+            + np.asarray(features.get("pitch_classes", []), dtype=np.int64)
+        )
+        pitch_class_counts, octave_counts = pitch_histograms(pitch)
+        migrated.update(
+            {
+                "note_count": len(pitch),
+                "pitch_class_histogram": pitch_class_counts.tolist(),
+                "octave_histogram": octave_counts.tolist(),
+                "interval_histogram": interval_histogram(pitch).tolist(),
+                "pitch_percentiles": percentiles(pitch),
+                "duration_percentiles": None,
+            }
+        )
+    migrated.update(
+        {
+            "max_polyphony": None,
+            "avg_polyphony": None,
+            "polyphonic_ratio": None,
+            "ioi_mean": None,
+            "ioi_median": None,
+            "ioi_std": None,
+        }
+    )
+    migrated["schema_version"] = SCHEMA_VERSION
+    return migrated
+
+
+def read_features(json_path):
+    """Reads a features_json file of any schema version as the current schema."""
+
+    with open(json_path, "r") as f:
+        return migrate_features(json.load(f))
@@ -0,0 +1,174 @@
+# Consolidated feature table - one npz with every stem's features and metadata
+
+import os
+import json
+import uuid
+import numpy as np
+from track_executor import list_track_folders
+from feature_schema import read_features
+
+FEATURES_ROOT = "./features_json"
+TABLE_FILENAME = "features.npz"
+TABLE_VERSION = 3  # 第 3 版記錄建表時特徵檔的世代戳記
+GENERATION_FILENAME = ".generation"  # 特徵檔寫入端每次變更後更新
+STEM_COUNT = 21  # 每個 track 的 stem 為 S00～S20
+# 純量特徵欄位，缺少的值存為 NaN
+FEATURE_COLUMNS = (
+    "min_pitch",
+    "max_pitch",
+    "avg_pitch",
+    "avg_duration",
+    "avg_position",
+    "note_density",
+)
+
+
+def default_table_path(features_root=FEATURES_ROOT):
+    return os.path.join(features_root, TABLE_FILENAME)
+
+
+def read_generation(features_root):
+    """Current generation stamp of features_root, "" if no writer has set one."""
+
+    try:
+        with open(os.path.join(features_root, GENERATION_FILENAME), "r") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def bump_generation(features_root):
+    """
+    Marks the feature files under features_root as changed.
+
+    Every script that writes or removes feature files or metadata.json
+    calls this once after it is done, so tables built earlier are seen as
+    out of date without listing the files.
+
+    Returns:
+        str: The new generation stamp.
+    """
+
+    generation = uuid.uuid4().hex
+    path = os.path.join(features_root, GENERATION_FILENAME)
+    with open(path + ".tmp", "w") as f:
+        f.write(generation)
+    os.replace(path + ".tmp", path)
+    return generation
+
+
+def read_track_rows(track_path):
+    """
+    Reads the metadata.json and S00-S20 feature files of one track.
+
+    Only stems that have a feature file and a metadata entry become rows,
+    in stem order, matching what baseline_rule classifies.
+
+    Returns:
+        tuple: (UUID, list of row dicts), or None without metadata.json.
+    """
+
+    metadata_path = os.path.join(track_path, "metadata.json")
+    if not os.path.exists(metadata_path):
+        return None
+    with open(metadata_path, "r") as f:
+        metadata = json.load(f)
+
+    stems = metadata.get("stems", {})
+    rows = []
+    for i in range(STEM_COUNT):
+        stem_id = f"S{i:02d}"
+        json_path = os.path.join(track_path, f"{stem_id}.json")
+        if stem_id not in stems or not os.path.exists(json_path):
+            continue
+        features = read_features(json_path)
+        rows.append(
+            {
+                "stem": stem_id,
+                "is_drum": bool(stems[stem_id].get("is_drum", False)),
+                "inst_class": stems[stem_id].get("inst_class") or "",
+                **{column: features.get(column, np.nan) for column in FEATURE_COLUMNS},
+            }
+        )
+    return metadata.get("UUID", ""), rows
+
+
+def build_feature_table(features_root=FEATURES_ROOT, table_path=None):
+    """
+    Collects every track under features_root into one npz table.
+
+    The table has one row per stem with the columns track, stem, is_drum,
+    inst_class and FEATURE_COLUMNS, sorted by track and stem. The arrays
+    tracks/uuids list every track with a metadata.json, including tracks
+    without stems. The generation stamp of features_root (see
+    bump_generation) is stored too, so load_feature_table can tell when
+    the table is out of date by reading one file.
+
+    Returns:
+        str: Path of the table.
+    """
+
+    table_path = table_path or default_table_path(features_root)
+    track_folders = list_track_folders(features_root)
+    # 讀取前先記錄世代戳記，建表期間有檔案變更時下次會判定為過期
+    generation = read_generation(features_root)
+    tracks, uuids, rows = [], [], []
+    for track_folder in track_folders:
+        result = read_track_rows(os.path.join(features_root, track_folder))
+        if result is None:
+            print(f"[警告] 找不到 metadata.json，略過 {track_folder}")
+            continue
+        uuid, track_rows = result
+        tracks.append(track_folder)
+        uuids.append(uuid)
+        rows.extend({"track": track_folder, **row} for row in track_rows)
+
+    columns = {
+        "version": np.array(TABLE_VERSION),
+        "tracks": np.array(tracks, dtype=str),
+        "uuids": np.array(uuids, dtype=str),
+        "track": np.array([row["track"] for row in rows], dtype=str),
+        "stem": np.array([row["stem"] for row in rows], dtype=str),
+        "is_drum": np.array([row["is_drum"] for row in rows], dtype=bool),
+        "inst_class": np.array([row["inst_class"] for row in rows], dtype=str),
+        "generation": np.array(generation),
+    }
+    for column in FEATURE_COLUMNS:
+        columns[column] = np.array([row[column] for row in rows], dtype=np.float64)
+
+    # 先寫入暫存檔再替換，讀取端不會讀到寫到一半的表
+    with open(table_path + ".tmp", "wb") as f:
+        np.savez(f, **columns)
+    os.replace(table_path + ".tmp", table_path)
+    return table_path
+
+
+def load_feature_table(table_path, features_root=None):
+    """
+    Reads a table written by build_feature_table in one read.
+
+    With features_root, the table is only returned if its generation stamp
+    still matches the one of features_root, i.e. no feature writer ran
+    since it was built.
+
+    Returns:
+        dict: Column name -> array, or None if the file is missing, from
+        another table version or out of date.
+    """
+
+    if not os.path.exists(table_path):
+        return None
+    with np.load(table_path, allow_pickle=False) as data:
+        columns = {name: data[name] for name in data.files}
+    if int(columns.pop("version")) != TABLE_VERSION:
+        return None
+    generation = str(columns.pop("generation"))
+    if features_root is not None and generation != read_generation(features_root):
+        return None
+    return columns
+
+
+if __name__ == "__main__":
+    path = build_feature_table()
+    table = load_feature_table(path)
+    print(f"✅ 已建立特徵表 {path}: {len(table['tracks'])} 個 track，{len(table['stem'])} 個 stem")
@@ -1,70 +1,102 @@
 import os
-import pretty_midi
 import json
+from track_executor import list_track_folders, run_tracks
+from build_manifest import BuildManifest, MANIFEST_FILENAME, hash_code
+from feature_table import bump_generation
+from midi_ingest import load_midi_notes, features_from_arrays, features_key, FEATURES_CODE_FILES
 
-# 定義提取 MIDI 特徵的函數
+# 與 midi_ingest.py 共用 manifest 的鍵與程式碼摘要，兩者產生的特徵檔可互相沿用
+CODE_FILES = FEATURES_CODE_FILES
+
+# 定義提取 MIDI 特徵的函數（與 midi_ingest.py 共用解析結果的計算）
 def extract_features_from_midi(midi_path):
-    pm = pretty_midi.PrettyMIDI(midi_path)
-    
-    # 收集音符
-    notes = [note for instr in pm.instruments for note in instr.notes]
-    if not notes:
-        return None
-    
-    # 提取 pitch_class, octave, duration, position
-    pitches = [note.pitch for note in notes]
-    durations = [note.end - note.start for note in notes]
-    positions = [note.start for note in notes]
+    return features_from_arrays(load_midi_notes(midi_path))
 
-    # pitch_class 和 octave 的處理
-    pitch_classes = [pitch % 12 for pitch in pitches]
-    octaves = [pitch // 12 for pitch in pitches]
+# 處理單一 Track 資料夾中的所有 MIDI 文件
+# 有 manifest 時，只重新處理 MIDI 或程式碼有變更、或輸出遺失的 stem
+# manifest 只需包含該 Track 的項目（見 BuildManifest.track_manifests）
+def process_track(track_folder, manifest, base_dir, output_dir, code_digest=None):
+    track_path = os.path.join(base_dir, track_folder, "MIDI")
+    processed = 0
+    entries = {}
+    if manifest is not None and code_digest is None:
+        code_digest = hash_code(CODE_FILES)
 
-    features = {
-        "min_pitch": min(pitches),
-        "max_pitch": max(pitches),
-        "avg_pitch": sum(pitches) / len(pitches),
-        "avg_duration": sum(durations) / len(durations),
-        "avg_position": sum(positions) / len(positions),
-        "note_density": len(notes) / pm.get_end_time(),
-        "pitch_classes": pitch_classes,
-        "octaves": octaves
-    }
-    
-    return features
+    if os.path.isdir(track_path):  # 確保是資料夾
+        track_id = track_folder.split("Track")[1]
+        track_output_dir = os.path.join(output_dir, f"Track{track_id}_features")
+        os.makedirs(track_output_dir, exist_ok=True)
+        
+        # 遍歷該 Track 資料夾中的所有 MIDI 文件（假設文件名以 .mid 結尾）
+        for midi_file in os.listdir(track_path):
+            if midi_file.endswith(".mid"):
+                midi_path = os.path.join(track_path, midi_file)
+                midi_filename = midi_file.replace(".mid", ".json")
+                features_path = os.path.join(track_output_dir, midi_filename)
+                key = features_key(track_folder, midi_file)
 
-# 定義一個函數來處理資料夾中的所有 MIDI 文件
-def process_all_tracks(base_dir, output_dir):
+                if manifest is not None:
+                    fingerprint = manifest.fingerprint(key, [midi_path], code_digest)
+                    recorded = manifest.entries.get(key, {}).get("outputs", [features_path])
+                    if not manifest.is_stale(key, fingerprint, recorded):
+                        continue
+                
+                # 提取特徵
+                features = extract_features_from_midi(midi_path)
+                outputs = []
+                if features:
+                    # 將結果保存為 JSON 格式
+                    with open(features_path, 'w') as f:
+                        json.dump(features, f, indent=4)
+                    print(f"Processed {midi_file} and saved features to {features_path}")
+                    processed += 1
+                    outputs.append(features_path)
+
+                if manifest is not None:
+                    entries[key] = manifest.record(key, fingerprint, outputs)
+
+    return processed, entries
+
+# 定義一個函數來處理資料夾中的所有 MIDI 文件（以 process pool 平行處理各 Track）
+def process_all_tracks(base_dir, output_dir, workers=None, incremental=True):
     # 創建輸出資料夾（如果不存在）
     os.makedirs(output_dir, exist_ok=True)
+    manifest = (
+        BuildManifest(os.path.join(output_dir, MANIFEST_FILENAME))
+        if incremental
+        else None
+    )
     
     # 遍歷每個 Track 資料夾
-    for track_folder in os.listdir(base_dir):
-        track_path = os.path.join(base_dir, track_folder, "MIDI")
-        
-        if os.path.isdir(track_path):  # 確保是資料夾
-            track_id = track_folder.split("Track")[1]
-            track_output_dir = os.path.join(output_dir, f"Track{track_id}_features")
-            os.makedirs(track_output_dir, exist_ok=True)
-            
-            # 遍歷該 Track 資料夾中的所有 MIDI 文件（假設文件名以 .mid 結尾）
-            for midi_file in os.listdir(track_path):
-                if midi_file.endswith(".mid"):
-                    midi_path = os.path.join(track_path, midi_file)
-                    
-                    # 提取特徵
-                    features = extract_features_from_midi(midi_path)
-                    if features:
-                        # 將結果保存為 JSON 格式
-                        midi_filename = midi_file.replace(".mid", ".json")
-                        features_path = os.path.join(track_output_dir, midi_filename)
-                        with open(features_path, 'w') as f:
-                            json.dump(features, f, indent=4)
-                        print(f"Processed {midi_file} and saved features to {features_path}")
+    track_folders = list_track_folders(base_dir)
+    if manifest is not None:
+        track_manifests = manifest.track_manifests(track_folders)
+    else:
+        track_manifests = dict.fromkeys(track_folders)
+    results, failures = run_tracks(
+        process_track,
+        track_folders,
+        base_dir,
+        output_dir,
+        hash_code(CODE_FILES),
+        workers=workers,
+        track_inputs=track_manifests,
+    )
+    if manifest is not None:
+        for _, entries in results.values():
+            manifest.update(entries)
+        manifest.save()
+    processed = sum(count for count, _ in results.values())
+    # 有特徵檔被改寫時更新世代戳記，舊的 features.npz 會被視為過期
+    if processed or failures:
+        bump_generation(output_dir)
+    print(f"完成 {len(results)} 個 Track（更新 {processed} 個 stem），失敗 {len(failures)} 個")
+    return results, failures
 
-# 設定根目錄和輸出目錄
-base_directory = './babyslakh_16k/'
-output_directory = './features_json/'
+if __name__ == "__main__":
+    # 設定根目錄和輸出目錄
+    base_directory = './babyslakh_16k/'
+    output_directory = './features_json/'
 
-# 開始處理所有 Track 資料夾
-process_all_tracks(base_directory, output_directory)
+    # 開始處理所有 Track 資料夾
+    process_all_tracks(base_directory, output_directory)
@@ -0,0 +1,87 @@
+# Batched BiLSTM Inference - length-bucketed phrase batches
+
+import numpy as np
+import torch
+
+FEATURE_KEYS = ("pitch_class", "octave", "duration", "position")
+DEFAULT_BATCH_SIZE = 64
+
+
+def phrase_array(phrase):
+    """Converts one phrase (list of note dicts) into a (notes, 4) float32 array."""
+    return np.array(
+        [[note[key] for key in FEATURE_KEYS] for note in phrase], dtype=np.float32
+    ).reshape(-1, len(FEATURE_KEYS))
+
+
+def length_buckets(lengths, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Groups phrase indices into batches of similar length.
+
+    Phrases are sorted by length and cut into consecutive batches, so each
+    batch is only padded up to its own longest phrase.
+
+    Returns:
+        list: One index array per batch.
+    """
+
+    order = np.argsort(lengths, kind="stable")
+    return [
+        order[start : start + batch_size] for start in range(0, len(order), batch_size)
+    ]
+
+
+def pad_batch(arrays):
+    """Stacks phrase arrays into one zero-padded (batch, max_len, 4) array."""
+
+    lengths = np.array([len(array) for array in arrays], dtype=np.int64)
+    batch = np.zeros((len(arrays), lengths.max(), len(FEATURE_KEYS)), dtype=np.float32)
+    for row, array in enumerate(arrays):
+        batch[row, : len(array)] = array
+    return batch, lengths
+
+
+def predict_label_ids(model, phrases, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Predicts a label id for every note of every phrase.
+
+    Args:
+        model (nn.Module): A model called as model(x, lengths) that returns
+            (batch, max_len, classes) scores, such as InstrumentBiLSTM.
+        phrases (list): Phrases as lists of note dicts, or as arrays from
+            phrase_array.
+        batch_size (int): Number of phrases per forward pass.
+
+    Returns:
+        list: One int64 array of label ids per phrase, in input order.
+        Empty phrases get an empty array.
+    """
+
+    arrays = [
+        phrase if isinstance(phrase, np.ndarray) else phrase_array(phrase)
+        for phrase in phrases
+    ]
+    results = [np.empty(0, dtype=np.int64)] * len(arrays)
+    lengths = np.array([len(array) for array in arrays], dtype=np.int64)
+    # 空的樂句無法打包成序列，直接回傳空結果
+    non_empty = np.flatnonzero(lengths > 0)
+
+    model.eval()
+    with torch.inference_mode():
+        for bucket in length_buckets(lengths[non_empty], batch_size):
+            indices = non_empty[bucket]
+            batch, batch_lengths = pad_batch([arrays[i] for i in indices])
+            out = model(torch.from_numpy(batch), torch.from_numpy(batch_lengths))
+            predicted = out.argmax(dim=2).numpy()
+            for row, index in enumerate(indices):
+                results[index] = predicted[row, : batch_lengths[row]]
+    return results
+
+
+def predict_labels(model, phrases, label_to_instrument, batch_size=DEFAULT_BATCH_SIZE):
+    """Like predict_label_ids, but maps every id to its instrument name."""
+
+    return [
+        [label_to_instrument[label] for label in label_ids.tolist()]
+        for label_ids in predict_label_ids(model, phrases, batch_size)
+    ]
@@ -0,0 +1,229 @@
+import os
+import json
+import numpy as np
+import pretty_midi
+import note_store
+import scoring
+import feature_schema
+import midi_reader
+from note_store import write_track
+from track_executor import list_track_folders, run_tracks
+from build_manifest import BuildManifest, MANIFEST_FILENAME, hash_code
+from feature_table import bump_generation
+
+INPUT_DIR = "./babyslakh_16k"
+OUTPUT_DIR = "./converted_json"
+STORE_DIR = "./converted_npy"
+FEATURES_DIR = "./features_json"
+WRITE_JSON = True  # 保留逐 stem 的 JSON 供其他工具使用
+NATIVE_READER = True  # 以 midi_reader 直接解析 MIDI 位元組；False 時改用 pretty_midi
+# 解析或輸出程式碼變更時需重建所有 Track
+CODE_FILES = [
+    __file__, note_store.__file__, scoring.__file__, feature_schema.__file__, midi_reader.__file__
+]
+# features_json 的 manifest 與 features_extrect.py 共用：相同的鍵與程式碼摘要，
+# 由任一腳本產生的特徵檔都不會被另一個視為過期
+FEATURES_CODE_FILES = [__file__, feature_schema.__file__, midi_reader.__file__]
+
+
+def features_key(track_folder, midi_file):
+    """Key of one stem's features_json file in the FEATURES_DIR manifest."""
+
+    return f"{track_folder}/{midi_file}"
+
+
+def load_midi_notes(midi_path):
+    """
+    Parses a MIDI file once into flat note arrays.
+
+    Returns:
+        dict: "pitch", "start", "end", "velocity" and "is_drum" arrays with
+        one entry per note, in instrument order, plus the file's "end_time".
+    """
+
+    if NATIVE_READER:
+        return midi_reader.read_midi_notes(midi_path)
+    return load_midi_notes_pretty(midi_path)
+
+
+def load_midi_notes_pretty(midi_path):
+    """load_midi_notes through pretty_midi.PrettyMIDI, the reference for midi_reader."""
+
+    pm = pretty_midi.PrettyMIDI(midi_path)
+    pitch, start, end, velocity, is_drum = [], [], [], [], []
+    for instr in pm.instruments:
+        count = len(instr.notes)
+        pitch.append(np.fromiter((note.pitch for note in instr.notes), np.int64, count))
+        start.append(np.fromiter((note.start for note in instr.notes), np.float64, count))
+        end.append(np.fromiter((note.end for note in instr.notes), np.float64, count))
+        velocity.append(np.fromiter((note.velocity for note in instr.notes), np.int64, count))
+        is_drum.append(np.full(count, instr.is_drum))
+
+    def join(parts, dtype):
+        return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+    return {
+        "pitch": join(pitch, np.int64),
+        "start": join(start, np.float64),
+        "end": join(end, np.float64),
+        "velocity": join(velocity, np.int64),
+        "is_drum": join(is_drum, bool),
+        "end_time": pm.get_end_time(),
+    }
+
+
+def notes_from_arrays(midi_notes):
+    """
+    Builds the converted_json phrase list of one stem: every non-drum note
+    as a dict, sorted by position.
+    """
+
+    keep = ~midi_notes["is_drum"]
+    pitch = midi_notes["pitch"][keep]
+    start = midi_notes["start"][keep]
+    end = midi_notes["end"][keep]
+
+    notes = [
+        {"pitch_class": pc, "octave": octave, "duration": duration, "position": position}
+        for pc, octave, duration, position in zip(
+            (pitch % 12).tolist(),
+            (pitch // 12).tolist(),
+            np.round(end - start, 5).tolist(),
+            np.round(start, 5).tolist(),
+        )
+    ]
+    notes.sort(key=lambda x: x["position"])
+    return [notes] if notes else []
+
+
+def features_from_arrays(midi_notes):
+    """Computes the features_json summary of one stem over all its notes."""
+
+    return feature_schema.compute_features(
+        midi_notes["pitch"], midi_notes["start"], midi_notes["end"], midi_notes["end_time"]
+    )
+
+
+def ingest_track(track_folder, manifest=None, code_digest=None, features_digest=None):
+    """
+    Parses every MIDI file of one track once and writes its converted
+    notes (JSON and note store) and its features.
+
+    manifest only needs this track's entries (see
+    BuildManifest.track_manifests); code_digest and features_digest
+    default to hash_code(CODE_FILES) and hash_code(FEATURES_CODE_FILES).
+
+    Returns:
+        tuple: (ingested stem count, new manifest entries, new entries for
+        the FEATURES_DIR manifest).
+    """
+
+    midi_folder = os.path.join(INPUT_DIR, track_folder, "MIDI")
+    if not os.path.isdir(midi_folder):
+        return 0, {}, {}
+
+    output_folder = os.path.join(OUTPUT_DIR, track_folder)
+    store_folder = os.path.join(STORE_DIR, track_folder)
+    features_folder = os.path.join(FEATURES_DIR, f"{track_folder}_features")
+    midi_files = sorted(
+        midi_file for midi_file in os.listdir(midi_folder) if midi_file.endswith(".mid")
+    )
+    stem_ids = {midi_file: midi_file[: -len(".mid")] for midi_file in midi_files}
+
+    outputs = [os.path.join(store_folder, note_store.INDEX_FILENAME)]
+    if WRITE_JSON:
+        outputs.extend(
+            os.path.join(output_folder, f"{stem_id}.json") for stem_id in stem_ids.values()
+        )
+
+    if manifest is not None:
+        fingerprint = manifest.fingerprint(
+            track_folder,
+            [os.path.join(midi_folder, midi_file) for midi_file in midi_files],
+            code_digest or hash_code(CODE_FILES),
+            {"write_json": WRITE_JSON},
+        )
+        recorded = manifest.entries.get(track_folder, {}).get("outputs", outputs)
+        if not manifest.is_stale(track_folder, fingerprint, recorded):
+            print(f"- 未變更，略過: {track_folder}")
+            return 0, {}, {}
+        features_manifest = BuildManifest(os.path.join(FEATURES_DIR, MANIFEST_FILENAME), {})
+        features_digest = features_digest or hash_code(FEATURES_CODE_FILES)
+    feature_entries = {}
+
+    if WRITE_JSON:
+        os.makedirs(output_folder, exist_ok=True)
+    os.makedirs(features_folder, exist_ok=True)
+    track_stems = {}
+    failed = False
+
+    for midi_file in midi_files:
+        midi_path = os.path.join(midi_folder, midi_file)
+        stem_id = stem_ids[midi_file]
+        try:
+            midi_notes = load_midi_notes(midi_path)
+
+            phrases = notes_from_arrays(midi_notes)
+            if WRITE_JSON:
+                with open(os.path.join(output_folder, f"{stem_id}.json"), "w") as f:
+                    json.dump(phrases, f, indent=2)
+            track_stems[stem_id] = phrases[0] if phrases else []
+
+            features = features_from_arrays(midi_notes)
+            features_outputs = []
+            if features:
+                features_path = os.path.join(features_folder, f"{stem_id}.json")
+                with open(features_path, "w") as f:
+                    json.dump(features, f, indent=4)
+                outputs.append(features_path)
+                features_outputs.append(features_path)
+            if manifest is not None:
+                key = features_key(track_folder, midi_file)
+                feature_entries[key] = features_manifest.record(
+                    key,
+                    # 沿用 Track 指紋中已計算的雜湊，MIDI 檔不重複讀取
+                    features_manifest.fingerprint(
+                        key, [midi_path], features_digest, source_states=fingerprint["sources"]
+                    ),
+                    features_outputs,
+                )
+
+            print(f"✓ 解析成功: {track_folder}/{midi_file}")
+        except Exception as e:
+            print(f"✗ 解析失敗: {midi_path}，錯誤：{e}")
+            failed = True
+
+    write_track(store_folder, track_stems)
+
+    # 有 stem 解析失敗時不記錄，下次執行會重試
+    if manifest is None or failed:
+        return len(track_stems), {}, feature_entries
+    return (
+        len(track_stems),
+        {track_folder: manifest.record(track_folder, fingerprint, outputs)},
+        feature_entries,
+    )
+
+
+if __name__ == "__main__":
+    # 每個 MIDI 只解析一次，同時產生 converted_json、note store 與 features_json
+    # 寫出的 features_json 同時記錄到 features_extrect.py 讀取的 manifest
+    manifest = BuildManifest(os.path.join(STORE_DIR, MANIFEST_FILENAME))
+    features_manifest = BuildManifest(os.path.join(FEATURES_DIR, MANIFEST_FILENAME))
+    track_folders = list_track_folders(INPUT_DIR)
+    results, failures = run_tracks(
+        ingest_track,
+        track_folders,
+        hash_code(CODE_FILES),
+        hash_code(FEATURES_CODE_FILES),
+        track_inputs=manifest.track_manifests(track_folders),
+    )
+    for _, entries, feature_entries in results.values():
+        manifest.update(entries)
+        features_manifest.update(feature_entries)
+    manifest.save()
+    features_manifest.save()
+    # 有特徵檔被改寫時更新世代戳記，舊的 features.npz 會被視為過期
+    if failures or any(count for count, _, _ in results.values()):
+        bump_generation(FEATURES_DIR)
+    print(f"\n完成 {len(results)} 個 Track，失敗 {len(failures)} 個")
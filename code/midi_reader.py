@@ -0,0 +1,303 @@
+# Native MIDI Reader - note arrays straight from the SMF bytes, without pretty_midi objects
+
+import os
+import sys
+import time
+import struct
+from collections import defaultdict
+import numpy as np
+
+MAX_TICK = 1e7  # 與 pretty_midi 相同：超過此 tick 的檔案視為損壞
+DEFAULT_TICK_SCALE_BPM = 120.0
+DRUM_CHANNEL = 9
+
+# 通道訊息（高 4 位元）與系統訊息的資料位元組數，與 mido 的規格相同
+CHANNEL_DATA_BYTES = {0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2}
+SYSTEM_DATA_BYTES = {
+    0xF1: 1, 0xF2: 2, 0xF3: 1, 0xF6: 0,
+    0xF8: 0, 0xFA: 0, 0xFB: 0, 0xFC: 0, 0xFE: 0,
+}
+# 影響 pretty_midi get_end_time 的 meta 事件
+META_SET_TEMPO = 0x51
+META_TIME_SIGNATURE = 0x58
+META_KEY_SIGNATURE = 0x59
+META_TEXT = 0x01
+META_LYRICS = 0x05
+
+
+def _read_varint(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, pos
+
+
+class _NoteCollector:
+    """
+    Pairs note on/off events into notes the way pretty_midi does.
+
+    Instruments are keyed by (program, channel, track) and numbered in the
+    order their first note closes. Control change and pitch bend events
+    only matter for the file's end time, so every instrument just keeps the
+    largest tick of those events, shared with the "straggler" that held
+    them before the instrument existed, exactly like pretty_midi shares the
+    event lists.
+    """
+
+    def __init__(self):
+        self.instrument_map = {}  # (program, channel, track) -> (編號, [最大 tick])
+        self.stragglers = {}  # (channel, track) -> (None, [最大 tick])
+        self.instruments = []  # (program, is_drum, [最大 tick])
+        self.pitch, self.start, self.end, self.velocity, self.instrument = [], [], [], [], []
+
+    def get_instrument(self, program, channel, track, create_new):
+        key = (program, channel, track)
+        if key in self.instrument_map:
+            return self.instrument_map[key]
+        if not create_new and (channel, track) in self.stragglers:
+            return self.stragglers[(channel, track)]
+        if create_new:
+            straggler = self.stragglers.get((channel, track))
+            last_event = straggler[1] if straggler is not None else [-1]
+            instrument = (len(self.instruments), last_event)
+            self.instruments.append((program, channel == DRUM_CHANNEL, last_event))
+            self.instrument_map[key] = instrument
+            return instrument
+        straggler = (None, [-1])
+        self.stragglers[(channel, track)] = straggler
+        return straggler
+
+    def read_track(self, data, pos, end, track_index, on_meta):
+        """Parses the events of one MTrk chunk; returns the track's last tick."""
+
+        tick = 0
+        last_status = None
+        programs = [0] * 16
+        open_notes = defaultdict(list)  # (channel, pitch) -> [(開始 tick, velocity)]
+
+        while pos < end:
+            delta, pos = _read_varint(data, pos)
+            tick += delta
+            status = data[pos]
+            pos += 1
+            if status < 0x80:
+                # running status：沿用上一個狀態，此位元組即為第一個資料位元組
+                if last_status is None:
+                    raise ValueError("MIDI 檔案在沒有前一個狀態時使用 running status")
+                status = last_status
+                pos -= 1
+            elif status != 0xFF:
+                last_status = status
+
+            if status == 0xFF:
+                meta_type = data[pos]
+                length, pos = _read_varint(data, pos + 1)
+                on_meta(track_index, meta_type, tick, data[pos : pos + length])
+                pos += length
+                continue
+            if status == 0xF0 or status == 0xF7:
+                length, pos = _read_varint(data, pos)
+                pos += length
+                continue
+
+            kind = status & 0xF0
+            size = CHANNEL_DATA_BYTES.get(kind) if kind != 0xF0 else SYSTEM_DATA_BYTES.get(status)
+            if size is None:
+                raise ValueError(f"MIDI 檔案含未定義的狀態位元組 0x{status:02x}")
+            values = data[pos : pos + size]
+            pos += size
+            if len(values) < size:
+                raise ValueError("MIDI 檔案在訊息中途結束")
+            if size and max(values) > 127:
+                raise ValueError("MIDI 資料位元組須介於 0..127")
+            if kind == 0xF0:
+                continue
+
+            channel = status & 0x0F
+            if kind == 0xC0:
+                programs[channel] = values[0]
+            elif kind == 0x90 and values[1] > 0:
+                open_notes[(channel, values[0])].append((tick, values[1]))
+            elif kind == 0x80 or kind == 0x90:
+                key = (channel, values[0])
+                if key in open_notes:
+                    # 一個 note off 關閉之前所有同音高的音符；同一 tick 開始的音符保留
+                    notes = open_notes[key]
+                    to_close = [note for note in notes if note[0] != tick]
+                    to_keep = [note for note in notes if note[0] == tick]
+                    for start_tick, velocity in to_close:
+                        index, _ = self.get_instrument(programs[channel], channel, track_index, True)
+                        self.pitch.append(values[0])
+                        self.start.append(start_tick)
+                        self.end.append(tick)
+                        self.velocity.append(velocity)
+                        self.instrument.append(index)
+                    if to_close and to_keep:
+                        open_notes[key] = to_keep
+                    else:
+                        del open_notes[key]
+            elif kind == 0xE0 or kind == 0xB0:
+                _, last_event = self.get_instrument(programs[channel], channel, track_index, False)
+                last_event[0] = max(last_event[0], tick)
+        return tick
+
+
+def ticks_to_seconds(ticks, tick_scales):
+    """
+    Converts absolute ticks to seconds over a piecewise-constant tempo map.
+
+    Args:
+        ticks (np.ndarray): Absolute ticks.
+        tick_scales (list): (tick, seconds per tick) tempo segments, sorted by tick.
+
+    Returns:
+        np.ndarray: Times in seconds, computed with the same arithmetic as
+        pretty_midi so the values match bit for bit.
+    """
+
+    scale_ticks = np.array([tick for tick, _ in tick_scales], dtype=np.int64)
+    scales = np.array([scale for _, scale in tick_scales], dtype=np.float64)
+    # 每段起點的秒數
+    offsets = [0.0]
+    for i in range(1, len(tick_scales)):
+        offsets.append(offsets[-1] + scales[i - 1] * (scale_ticks[i] - scale_ticks[i - 1]))
+    offsets = np.array(offsets, dtype=np.float64)
+
+    ticks = np.asarray(ticks, dtype=np.int64)
+    segment = np.searchsorted(scale_ticks, ticks, side="right") - 1
+    return offsets[segment] + scales[segment] * (ticks - scale_ticks[segment])
+
+
+def read_midi_notes(midi_path):
+    """
+    Reads the notes of a standard MIDI file without pretty_midi.
+
+    Notes are paired, grouped into instruments and timed with the tempo
+    map of track 0 the same way pretty_midi does, so the arrays equal
+    those built from pretty_midi.PrettyMIDI (see compare_with_pretty_midi).
+
+    Returns:
+        dict: "pitch", "start", "end", "velocity" and "is_drum" arrays with
+        one entry per note, in instrument order, plus the file's "end_time".
+    """
+
+    with open(midi_path, "rb") as f:
+        data = f.read()
+
+    if data[:4] != b"MThd":
+        raise ValueError(f"不是 MIDI 檔案（找不到 MThd）: {midi_path}")
+    header_size = struct.unpack(">L", data[4:8])[0]
+    _, track_count, resolution = struct.unpack(">hhh", data[8:14])
+    pos = 8 + header_size
+
+    tick_scales = [(0, 60.0 / (DEFAULT_TICK_SCALE_BPM * resolution))]
+    end_ticks = [0]  # 影響結束時間的 meta 事件與速度變化
+
+    def on_meta(track_index, meta_type, tick, payload):
+        if track_index == 0 and meta_type == META_SET_TEMPO:
+            tempo = (payload[0] << 16) | (payload[1] << 8) | payload[2]
+            if tick == 0:
+                bpm = 6e7 / tempo
+                tick_scales[:] = [(0, 60.0 / (bpm * resolution))]
+            else:
+                # 忽略重複的相同速度
+                tick_scale = 60.0 / ((6e7 / tempo) * resolution)
+                if tick_scale != tick_scales[-1][1]:
+                    tick_scales.append((tick, tick_scale))
+        elif track_index == 0 and meta_type in (META_TIME_SIGNATURE, META_KEY_SIGNATURE):
+            end_ticks.append(tick)
+        elif meta_type in (META_TEXT, META_LYRICS):
+            end_ticks.append(tick)
+
+    collector = _NoteCollector()
+    max_tick = 0
+    for track_index in range(track_count):
+        if data[pos : pos + 4] != b"MTrk":
+            raise ValueError(f"MIDI 檔案第 {track_index} 個 track 缺少 MTrk: {midi_path}")
+        size = struct.unpack(">L", data[pos + 4 : pos + 8])[0]
+        start = pos + 8
+        max_tick = max(max_tick, collector.read_track(data, start, start + size, track_index, on_meta))
+        pos = start + size
+
+    if max_tick + 1 > MAX_TICK:
+        raise ValueError(f"MIDI file has a largest tick of {max_tick + 1}, it is likely corrupt")
+
+    # pretty_midi 依樂器依序串接音符；穩定排序保留每個樂器內的關閉順序
+    instrument = np.array(collector.instrument, dtype=np.int64)
+    order = np.argsort(instrument, kind="stable")
+    start_ticks = np.array(collector.start, dtype=np.int64)[order]
+    end_ticks_notes = np.array(collector.end, dtype=np.int64)[order]
+    drum_flags = np.array([is_drum for _, is_drum, _ in collector.instruments], dtype=bool)
+
+    # 結束時間：音符結束、樂器的控制事件、meta 事件與速度變化中最晚者
+    end_ticks.extend(tick for tick, _ in tick_scales)
+    end_ticks.extend(last_event[0] for _, _, last_event in collector.instruments)
+    if len(end_ticks_notes):
+        end_ticks.append(int(end_ticks_notes.max()))
+
+    return {
+        "pitch": np.array(collector.pitch, dtype=np.int64)[order],
+        "start": ticks_to_seconds(start_ticks, tick_scales),
+        "end": ticks_to_seconds(end_ticks_notes, tick_scales),
+        "velocity": np.array(collector.velocity, dtype=np.int64)[order],
+        "is_drum": drum_flags[instrument[order]],
+        "end_time": float(ticks_to_seconds([max(end_ticks)], tick_scales)[0]),
+    }
+
+
+def different_fields(expected, actual):
+    """Names of the note fields whose values are not exactly equal."""
+
+    return [
+        name
+        for name, value in expected.items()
+        if not np.array_equal(np.asarray(value), np.asarray(actual[name]))
+    ]
+
+
+def compare_with_pretty_midi(midi_path):
+    """
+    Reads midi_path with both readers.
+
+    Returns:
+        list: Names of the fields that differ; empty when the native reader
+        matches pretty_midi exactly.
+    """
+
+    from midi_ingest import load_midi_notes_pretty
+
+    return different_fields(load_midi_notes_pretty(midi_path), read_midi_notes(midi_path))
+
+
+if __name__ == "__main__":
+    # 用法：python midi_reader.py [資料夾]，與 pretty_midi 逐欄比對並比較解析時間
+    from midi_ingest import load_midi_notes_pretty, INPUT_DIR
+
+    root = sys.argv[1] if len(sys.argv) > 1 else INPUT_DIR
+    midi_paths = sorted(
+        os.path.join(folder, name)
+        for folder, _, names in os.walk(root)
+        for name in names
+        if name.lower().endswith((".mid", ".midi"))
+    )
+
+    mismatches = 0
+    native_seconds = pretty_seconds = 0.0
+    for midi_path in midi_paths:
+        start = time.perf_counter()
+        expected = load_midi_notes_pretty(midi_path)
+        pretty_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        actual = read_midi_notes(midi_path)
+        native_seconds += time.perf_counter() - start
+
+        different = different_fields(expected, actual)
+        if different:
+            mismatches += 1
+            print(f"✗ {midi_path}: {', '.join(different)} 不一致")
+
+    print(f"📊 {len(midi_paths)} 個 MIDI，{mismatches} 個與 pretty_midi 不一致")
+    print(f"pretty_midi: {pretty_seconds:.2f}s，內建解析器: {native_seconds:.2f}s")
@@ -0,0 +1,59 @@
+# BiLSTM Models for Instrument Assignment
+
+import torch.nn as nn
+from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
+
+
+# -------------------------------
+# Phrase-level BiLSTM (test.py)
+# -------------------------------
+class InstrumentBiLSTM(nn.Module):
+    def __init__(self, input_dim, hidden_dim, output_dim, num_layers=2):
+        super(InstrumentBiLSTM, self).__init__()
+        self.lstm = nn.LSTM(input_dim, hidden_dim, num_layers=num_layers,
+                            bidirectional=True, batch_first=True)
+        self.fc = nn.Linear(hidden_dim * 2, output_dim)
+
+    def forward(self, x, lengths):
+        packed = pack_padded_sequence(x, lengths.cpu(), batch_first=True, enforce_sorted=False)
+        out, _ = self.lstm(packed)
+        out, _ = pad_packed_sequence(out, batch_first=True)
+        out = self.fc(out)
+        return out
+
+    def config(self):
+        """Constructor arguments, stored in checkpoints to rebuild the model."""
+        return {
+            "input_dim": self.lstm.input_size,
+            "hidden_dim": self.lstm.hidden_size,
+            "output_dim": self.fc.out_features,
+            "num_layers": self.lstm.num_layers,
+        }
+
+
+# ----------------------
+# Single-layer BiLSTM (model_train.py)
+# ----------------------
+class BiLSTMClassifier(nn.Module):
+    def __init__(self, input_size=4, hidden_size=64, output_size=3):
+        super().__init__()
+        self.lstm = nn.LSTM(input_size, hidden_size, batch_first=True, bidirectional=True)
+        self.fc = nn.Linear(hidden_size * 2, output_size)
+
+    def forward(self, x, lengths):
+        packed = pack_padded_sequence(x, lengths.cpu(), batch_first=True, enforce_sorted=False)
+        out, _ = self.lstm(packed)
+        out, _ = pad_packed_sequence(out, batch_first=True)
+        out = self.fc(out)
+        return out
+
+    def config(self):
+        """Constructor arguments, stored in checkpoints to rebuild the model."""
+        return {
+            "input_size": self.lstm.input_size,
+            "hidden_size": self.lstm.hidden_size,
+            "output_size": self.fc.out_features,
+        }
+
+
+MODEL_CLASSES = {cls.__name__: cls for cls in (InstrumentBiLSTM, BiLSTMClassifier)}
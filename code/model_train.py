@@ -1,11 +1,14 @@
 # Simple BiLSTM Model for Instrument Classification
 
 import torch
-import torch.nn as nn
-import torch.optim as optim
-from torch.utils.data import DataLoader, Dataset
-from torch.nn.utils.rnn import pad_sequence, pack_padded_sequence, pad_packed_sequence
-import json
+from torch.utils.data import Dataset
+from torch.nn.utils.rnn import pad_sequence
+# 模型定義已移至 model.py，保留舊的匯入路徑 from model_train import BiLSTMClassifier
+from model import BiLSTMClassifier  # noqa: F401
+from inference import predict_labels, DEFAULT_BATCH_SIZE
+from phrase_cache import load_phrase_cache
+from checkpoint import save_checkpoint
+from training import train_epochs
 
 # ----------------------
 # Label Mapping
@@ -17,20 +20,18 @@ label_to_instrument = {v: k for k, v in instrument_labels.items()}
 # Dataset
 # ----------------------
 class MusicDataset(Dataset):
-    def __init__(self, phrases_path, labels_path):
-        with open(phrases_path) as f:
-            self.phrases = json.load(f)
-        with open(labels_path) as f:
-            self.labels = json.load(f)
+    def __init__(self, phrases_path, labels_path, cache_dir=None):
+        # 第一次使用時將 JSON 編碼成 phrase_cache，之後直接 mmap 讀取
+        self.cache = load_phrase_cache(
+            phrases_path, labels_path, instrument_labels, cache_dir
+        )
+        self.lengths = self.cache.lengths
 
     def __len__(self):
-        return len(self.phrases)
+        return len(self.cache)
 
     def __getitem__(self, idx):
-        phrase = [torch.tensor([note['pitch_class'], note['octave'], note['duration'], note['position']], dtype=torch.float32)
-                  for note in self.phrases[idx]]
-        label = [instrument_labels[name] for name in self.labels[idx]]
-        return torch.stack(phrase), torch.tensor(label)
+        return self.cache.features_at(idx), self.cache.labels_at(idx)
 
 # ----------------------
 # Collate Function
@@ -42,51 +43,22 @@ def collate_fn(batch):
     padded_labels = pad_sequence(labels, batch_first=True, padding_value=-100)
     return padded_phrases, padded_labels, lengths
 
-# ----------------------
-# BiLSTM Model
-# ----------------------
-class BiLSTMClassifier(nn.Module):
-    def __init__(self, input_size=4, hidden_size=64, output_size=3):
-        super().__init__()
-        self.lstm = nn.LSTM(input_size, hidden_size, batch_first=True, bidirectional=True)
-        self.fc = nn.Linear(hidden_size * 2, output_size)
-
-    def forward(self, x, lengths):
-        packed = pack_padded_sequence(x, lengths.cpu(), batch_first=True, enforce_sorted=False)
-        out, _ = self.lstm(packed)
-        out, _ = pad_packed_sequence(out, batch_first=True)
-        out = self.fc(out)
-        return out
-
 # ----------------------
 # Training
 # ----------------------
-def train(model, dataloader, epochs=10):
-    model.train()
-    optimizer = optim.Adam(model.parameters(), lr=0.001)
-    criterion = nn.CrossEntropyLoss(ignore_index=-100)
-
-    for epoch in range(epochs):
-        total_loss = 0
-        for X, y, lengths in dataloader:
-            optimizer.zero_grad()
-            out = model(X, lengths)
-            loss = criterion(out.view(-1, out.shape[-1]), y.view(-1))
-            loss.backward()
-            optimizer.step()
-            total_loss += loss.item()
-        print(f"Epoch {epoch+1} Loss: {total_loss:.4f}")
+def train(model, dataloader, epochs=10, lr=0.001, accumulation_steps=1, checkpoint_dir=None):
+    # 共用 training.py 的訓練迴圈：梯度累積、每個 epoch 才讀取 loss，並記錄 samples/s
+    history = train_epochs(model, dataloader, epochs, lr, accumulation_steps)
+    if checkpoint_dir:
+        # 連同標籤對照存成新版本的 checkpoint，供 predict.py / 網頁服務載入
+        path = save_checkpoint(model, instrument_labels, checkpoint_dir,
+                               epochs=epochs, loss=history[-1] if history else None)
+        print(f"✓ 已儲存 checkpoint: {path}")
+    return history
 
 # ----------------------
 # Prediction
 # ----------------------
-def predict(model, phrases):
-    model.eval()
-    with torch.no_grad():
-        sequences = [torch.tensor([[note['pitch_class'], note['octave'], note['duration'], note['position']]
-                                   for note in phrase], dtype=torch.float32) for phrase in phrases]
-        lengths = torch.tensor([len(seq) for seq in sequences])
-        padded = pad_sequence(sequences, batch_first=True)
-        out = model(padded, lengths)
-        pred = torch.argmax(out, dim=2)
-        return [[label_to_instrument[i.item()] for i in seq[:l]] for seq, l in zip(pred, lengths)]
+def predict(model, phrases, batch_size=DEFAULT_BATCH_SIZE):
+    # 依長度分組批次推論，避免逐音符建立 tensor 與整批補齊到最長樂句
+    return predict_labels(model, phrases, label_to_instrument, batch_size)
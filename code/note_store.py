@@ -0,0 +1,177 @@
+import os
+import json
+import numpy as np
+from scoring import notes_to_columns
+
+# 每個 Track 一個資料夾，每個欄位一個 .npy，所有 stem 的音符依序串接
+# index.json 記錄每個 stem 在欄位中的 [start, stop) 範圍
+STORE_VERSION = 1
+COLUMNS = {"pitch": np.uint8, "duration": np.float64, "position": np.float64}
+INDEX_FILENAME = "index.json"
+
+
+def write_track(track_dir, stems):
+    """
+    Writes the notes of every stem in a track as packed column files.
+
+    Args:
+        track_dir (str): Output folder for this track.
+        stems (dict): Stem id -> note dicts or columns from notes_to_columns.
+    """
+
+    os.makedirs(track_dir, exist_ok=True)
+
+    index = {}
+    parts = {name: [] for name in COLUMNS}
+    offset = 0
+    for stem_id in sorted(stems):
+        columns = notes_to_columns(stems[stem_id])
+        count = len(columns["position"])
+        index[stem_id] = [offset, offset + count]
+        offset += count
+        for name in COLUMNS:
+            parts[name].append(np.asarray(columns[name]))
+
+    for name, dtype in COLUMNS.items():
+        data = np.concatenate(parts[name]) if parts[name] else np.empty(0)
+        np.save(os.path.join(track_dir, f"{name}.npy"), data.astype(dtype))
+
+    # 最後寫入 index，讀取端以它是否存在判斷資料是否完整
+    with open(os.path.join(track_dir, INDEX_FILENAME), "w") as f:
+        json.dump({"version": STORE_VERSION, "stems": index}, f, indent=2)
+
+
+def has_track(track_dir):
+    """Returns True if track_dir contains a complete note store."""
+
+    return os.path.isfile(os.path.join(track_dir, INDEX_FILENAME))
+
+
+def read_track(track_dir):
+    """
+    Memory-maps a track written by write_track.
+
+    Args:
+        track_dir (str): Folder of the track in the note store.
+
+    Returns:
+        dict: Stem id -> columns dict. Every column is a read-only view
+        into the memory-mapped file, so no note data is copied.
+    """
+
+    with open(os.path.join(track_dir, INDEX_FILENAME), "r") as f:
+        index = json.load(f)
+
+    if index.get("version") != STORE_VERSION:
+        raise ValueError(f"不支援的 note store 版本: {index.get('version')}")
+
+    arrays = {
+        name: np.load(os.path.join(track_dir, f"{name}.npy"), mmap_mode="r")
+        for name in COLUMNS
+    }
+    return {
+        stem_id: {name: arrays[name][start:stop] for name in COLUMNS}
+        for stem_id, (start, stop) in index["stems"].items()
+    }
+
+
+def read_stem_json(json_path):
+    """
+    Parses one converted SXX.json file into columns.
+
+    Returns:
+        dict or None: Columns of the first phrase, or None if the file
+        does not contain valid note data.
+    """
+
+    try:
+        with open(json_path, "r") as f:
+            notes_data = json.load(f)
+    except FileNotFoundError:
+        print(f"[警告] 找不到 {json_path}，略過")
+        return None
+    except json.JSONDecodeError:
+        print(f"[警告] {json_path} is not a valid JSON file, skipping")
+        return None
+
+    if not isinstance(notes_data, list) or not notes_data:
+        print(f"[警告] {json_path} does not contain valid note data, skipping")
+        return None
+    return notes_to_columns(notes_data[0])
+
+
+def load_track_stems(converted_track_folder_path, store_root=None):
+    """
+    Loads the notes of every stem in a track, preferring the note store.
+
+    Args:
+        converted_track_folder_path (str): Track folder in converted_json.
+        store_root (str): Root of the note store, or None to always parse JSON.
+
+    Returns:
+        dict: Stem id -> columns, for stems with at least one note.
+    """
+
+    track_folder = os.path.basename(os.path.normpath(converted_track_folder_path))
+    if store_root is not None:
+        store_track_path = os.path.join(store_root, track_folder)
+        if has_track(store_track_path):
+            stems = {}
+            for stem_id, columns in read_track(store_track_path).items():
+                if len(columns["position"]) == 0:
+                    print(
+                        f"[警告] {store_track_path}/{stem_id} does not contain valid note data, skipping"
+                    )
+                    continue
+                stems[stem_id] = columns
+            return stems
+
+    stems = {}
+    for filename in sorted(os.listdir(converted_track_folder_path)):
+        if filename.startswith("S") and filename.endswith(".json"):
+            columns = read_stem_json(
+                os.path.join(converted_track_folder_path, filename)
+            )
+            if columns is not None:
+                stems[filename[: -len(".json")]] = columns
+    return stems
+
+
+def stem_source_files(converted_track_folder_path, stem_id, store_root=None):
+    """Returns the files load_track_stems reads the notes of one stem from."""
+
+    track_folder = os.path.basename(os.path.normpath(converted_track_folder_path))
+    if store_root is not None:
+        store_track_path = os.path.join(store_root, track_folder)
+        if has_track(store_track_path):
+            return [os.path.join(store_track_path, INDEX_FILENAME)] + [
+                os.path.join(store_track_path, f"{name}.npy") for name in COLUMNS
+            ]
+    return [os.path.join(converted_track_folder_path, f"{stem_id}.json")]
+
+
+def build_store_from_json(converted_root, store_root):
+    """Converts an existing converted_json tree into the note store."""
+
+    for track_folder in sorted(os.listdir(converted_root)):
+        converted_track_folder_path = os.path.join(converted_root, track_folder)
+        if not os.path.isdir(converted_track_folder_path) or not track_folder.startswith(
+            "Track"
+        ):
+            continue
+
+        stems = {}
+        for filename in os.listdir(converted_track_folder_path):
+            if filename.startswith("S") and filename.endswith(".json"):
+                with open(os.path.join(converted_track_folder_path, filename)) as f:
+                    notes_data = json.load(f)
+                stems[filename[: -len(".json")]] = notes_data[0] if notes_data else []
+
+        write_track(os.path.join(store_root, track_folder), stems)
+        print(f"✓ 已寫入 note store: {track_folder}")
+
+
+if __name__ == "__main__":
+    converted_root = "./converted_json"
+    store_root = "./converted_npy"
+    build_store_from_json(converted_root, store_root)
@@ -0,0 +1,193 @@
+# Pre-tensorized phrase cache - flat memory-mapped features, labels and offsets
+
+import os
+import json
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+from build_manifest import hash_file
+from inference import FEATURE_KEYS
+
+# 所有樂句的音符依序串接成一個陣列，offsets[i]:offsets[i + 1] 為第 i 個樂句
+CACHE_VERSION = 1
+IGNORE_INDEX = -100  # CrossEntropyLoss 的 ignore_index
+ARRAYS = ("features", "labels", "offsets")
+META_FILENAME = "meta.json"
+
+
+def default_cache_dir(phrase_path):
+    """phrases.json -> phrases_cache/"""
+    return os.path.splitext(phrase_path)[0] + "_cache"
+
+
+def encode_labels(phrases, labels, label_map, label_path=None):
+    """
+    Maps every note's label name to its id.
+
+    Empty or unknown names, and notes without a label, become IGNORE_INDEX
+    so they do not contribute to the loss. A single warning reports how
+    many notes were affected.
+    """
+
+    encoded = np.full(sum(len(phrase) for phrase in phrases), IGNORE_INDEX, np.int64)
+    ignored = 0
+    offset = 0
+    for idx, phrase in enumerate(phrases):
+        names = labels[idx] if idx < len(labels) else []
+        for i in range(len(phrase)):
+            label = label_map.get(names[i]) if i < len(names) else None
+            if label is None:
+                ignored += 1
+            else:
+                encoded[offset + i] = label
+        offset += len(phrase)
+
+    if ignored:
+        print(
+            f"[警告] {label_path or 'labels'}: {ignored}/{len(encoded)} 個音符的標籤為空、"
+            f"未知或缺少，訓練時忽略 ({IGNORE_INDEX})"
+        )
+    return encoded
+
+
+def build_phrase_cache(phrase_path, label_path, cache_dir, label_map):
+    """
+    Encodes phrases.json (and optionally phrase_labels.json) once into
+    flat .npy arrays under cache_dir.
+
+    Args:
+        phrase_path (str): JSON list of phrases, each a list of note dicts.
+        label_path (str): JSON list of per-note label names, or None.
+        cache_dir (str): Output folder.
+        label_map (dict): Label name -> id.
+    """
+
+    with open(phrase_path, "r") as f:
+        phrases = json.load(f)
+    labels = None
+    if label_path:
+        with open(label_path, "r") as f:
+            labels = json.load(f)
+
+    lengths = np.array([len(phrase) for phrase in phrases], dtype=np.int64)
+    offsets = np.zeros(len(phrases) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    features = np.array(
+        [[note[key] for key in FEATURE_KEYS] for phrase in phrases for note in phrase],
+        dtype=np.float32,
+    ).reshape(-1, len(FEATURE_KEYS))
+    if labels is not None:
+        encoded = encode_labels(phrases, labels, label_map, label_path)
+    else:
+        encoded = np.full(len(features), IGNORE_INDEX, np.int64)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    for name, data in zip(ARRAYS, (features, encoded, offsets)):
+        np.save(os.path.join(cache_dir, f"{name}.npy"), data)
+
+    # 最後寫入 meta，讀取端以它判斷快取是否完整且與來源一致
+    with open(os.path.join(cache_dir, META_FILENAME), "w") as f:
+        json.dump(_cache_meta(phrase_path, label_path, label_map), f, indent=2)
+
+
+def _cache_meta(phrase_path, label_path, label_map):
+    return {
+        "version": CACHE_VERSION,
+        "phrases_sha1": hash_file(phrase_path),
+        "labels_sha1": hash_file(label_path) if label_path else None,
+        "label_map": label_map,
+    }
+
+
+class PhraseCache:
+    """
+    Memory-mapped view of a phrase cache.
+
+    Use load_phrase_cache to (re)build it when the sources change.
+    """
+
+    def __init__(self, cache_dir):
+        arrays = {
+            name: np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="r")
+            for name in ARRAYS
+        }
+        self.features = arrays["features"]
+        self.labels = arrays["labels"]
+        self.offsets = np.asarray(arrays["offsets"])
+        self.lengths = np.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def features_at(self, idx):
+        """(notes, 4) float32 tensor of one phrase, copied out of the mmap."""
+        start, stop = self.offsets[idx], self.offsets[idx + 1]
+        return torch.from_numpy(np.array(self.features[start:stop]))
+
+    def labels_at(self, idx):
+        """(notes,) int64 tensor of one phrase's label ids."""
+        start, stop = self.offsets[idx], self.offsets[idx + 1]
+        return torch.from_numpy(np.array(self.labels[start:stop]))
+
+
+def load_phrase_cache(phrase_path, label_path=None, label_map=None, cache_dir=None):
+    """
+    Returns the PhraseCache for phrase_path, building it first if it is
+    missing or was built from different sources or labels.
+    """
+
+    cache_dir = cache_dir or default_cache_dir(phrase_path)
+    expected = _cache_meta(phrase_path, label_path, label_map or {})
+    try:
+        with open(os.path.join(cache_dir, META_FILENAME), "r") as f:
+            current = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        current = None
+
+    if current != expected:
+        build_phrase_cache(phrase_path, label_path, cache_dir, label_map or {})
+    return PhraseCache(cache_dir)
+
+
+class BucketBatchSampler(Sampler):
+    """
+    Yields batches of phrase indices with similar lengths.
+
+    Phrases are sorted by length (ties broken randomly), cut into batches
+    of batch_size, and the batch order is shuffled every epoch, so padding
+    stays small while batches still vary between epochs.
+    """
+
+    def __init__(self, lengths, batch_size, shuffle=True, drop_last=False, seed=0):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.lengths) // self.batch_size
+        return -(-len(self.lengths) // self.batch_size)
+
+    def __iter__(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        self.epoch += 1
+
+        if self.shuffle:
+            order = np.lexsort((rng.random(len(self.lengths)), self.lengths))
+        else:
+            order = np.argsort(self.lengths, kind="stable")
+        batches = [
+            order[start : start + self.batch_size].tolist()
+            for start in range(0, len(order), self.batch_size)
+        ]
+        if self.drop_last and batches and len(batches[-1]) < self.batch_size:
+            batches.pop()
+        if self.shuffle:
+            rng.shuffle(batches)
+        return iter(batches)
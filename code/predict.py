@@ -1,45 +1,34 @@
 import json
-import torch
-from model import InstrumentBiLSTM  # 假設你模型存在 model.py
-from torch.nn.utils.rnn import pad_sequence
-
-# 樂器標籤對照
-label_to_instrument = {0: "trumpet", 1: "trombone", 2: "tuba"}
-
-# 載入模型
-model = InstrumentBiLSTM(input_dim=4, hidden_dim=64, output_dim=3)
-model.load_state_dict(torch.load("bilstm_model.pth"))  # 載入訓練後的模型
-model.eval()
-
-def predict_instruments_for_segment(segment_json_path):
-    # 讀入 JSON
-    with open(segment_json_path, 'r') as f:
-        phrase = json.load(f)
-
-    # 處理成 Tensor 格式
-    features = torch.stack([
-        torch.tensor([
-            note["pitch_class"], note["octave"],
-            note["duration"], note["position"]
-        ], dtype=torch.float32) for note in phrase
-    ]).unsqueeze(0)  # 增加 batch 維度
-
-    lengths = torch.tensor([len(phrase)])
-
-    with torch.no_grad():
-        output = model(features, lengths)
-        pred = torch.argmax(output, dim=2)[0]  # 取出 batch 內的第一組
-        labels = [label_to_instrument[i.item()] for i in pred]
-
-    # 配對結果
+from inference import DEFAULT_BATCH_SIZE
+from serving import get_served_model
+
+# 模型於第一次預測時載入並暖機，之後同一程序重複使用
+# 模型檔依序取自 MODEL_PATH 環境變數、checkpoints/ 最新版本、bilstm_model.pth
+
+def assign_instruments(phrase, labels):
+    """在每個音符加上 assigned_instrument"""
     assigned = []
     for note, label in zip(phrase, labels):
         note_with_label = note.copy()
         note_with_label["assigned_instrument"] = label
         assigned.append(note_with_label)
-
     return assigned
 
+
+def predict_instruments_for_segments(segment_json_paths, batch_size=DEFAULT_BATCH_SIZE, model_path=None):
+    """一次處理多個片段，依長度分組批次推論"""
+    phrases = []
+    for segment_json_path in segment_json_paths:
+        with open(segment_json_path, 'r') as f:
+            phrases.append(json.load(f))
+
+    all_labels = get_served_model(model_path).predict(phrases, batch_size)
+    return [assign_instruments(phrase, labels) for phrase, labels in zip(phrases, all_labels)]
+
+
+def predict_instruments_for_segment(segment_json_path, model_path=None):
+    return predict_instruments_for_segments([segment_json_path], model_path=model_path)[0]
+
 # 實際執行範例
 if __name__ == "__main__":
     result = predict_instruments_for_segment("segment.json")
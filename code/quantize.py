@@ -0,0 +1,135 @@
+# Dynamic int8 Quantization - quantized inference and fp32 comparison harness
+
+import io
+import sys
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+from checkpoint import load_checkpoint, latest_checkpoint, CHECKPOINT_DIR
+from inference import predict_label_ids, DEFAULT_BATCH_SIZE
+from phrase_cache import load_phrase_cache, IGNORE_INDEX
+
+# LSTM 與 Linear 的權重轉為 int8，激活值在推論時動態量化
+QUANTIZED_MODULES = {nn.LSTM, nn.Linear}
+LATENCY_SAMPLE = 200  # 單一樂句延遲量測的樂句數
+
+
+def quantize_model(model):
+    """
+    Returns a dynamically quantized int8 copy of model for CPU inference.
+
+    The LSTM and Linear weights are stored as int8 and activations are
+    quantized on the fly, so no calibration data is needed. The original
+    model is left unchanged.
+    """
+
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(model, QUANTIZED_MODULES, dtype=torch.qint8)
+
+
+def model_size_bytes(model):
+    """Size of the model's serialized state_dict."""
+
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def _timed(fn, repeats):
+    """Best wall time of repeats calls, in seconds, and the last result."""
+
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def evaluate_model(model, phrases, labels, batch_size=DEFAULT_BATCH_SIZE, repeats=3):
+    """
+    Measures one model on labelled phrases.
+
+    Args:
+        model (nn.Module): Model to evaluate.
+        phrases (list): Phrase feature arrays.
+        labels (np.ndarray): Flat label id of every note, IGNORE_INDEX where unknown.
+        batch_size (int): Phrases per forward pass for the throughput run.
+        repeats (int): Timed runs; the fastest is reported.
+
+    Returns:
+        dict: predictions (flat note label ids), accuracy, phrases_per_sec,
+        latency_ms (median single-phrase latency) and size_bytes.
+    """
+
+    seconds, predicted = _timed(lambda: predict_label_ids(model, phrases, batch_size), repeats)
+    predicted = np.concatenate(predicted) if predicted else np.empty(0, dtype=np.int64)
+    known = labels != IGNORE_INDEX
+
+    latencies = []
+    for phrase in phrases[:LATENCY_SAMPLE]:
+        latency, _ = _timed(lambda: predict_label_ids(model, [phrase]), 1)
+        latencies.append(latency)
+
+    return {
+        "predictions": predicted,
+        "accuracy": float(np.mean(predicted[known] == labels[known])) if known.any() else 0.0,
+        "phrases_per_sec": len(phrases) / seconds if seconds else 0.0,
+        "latency_ms": float(np.median(latencies)) * 1000 if latencies else 0.0,
+        "size_bytes": model_size_bytes(model),
+    }
+
+
+def compare_quantized(model, phrases, labels, batch_size=DEFAULT_BATCH_SIZE, repeats=3):
+    """
+    Evaluates model in fp32 and dynamic int8 on the same phrases.
+
+    Returns:
+        dict: {"fp32": metrics, "int8": metrics, "agreement": share of notes
+        where both predict the same label}.
+    """
+
+    results = {
+        "fp32": evaluate_model(model, phrases, labels, batch_size, repeats),
+        "int8": evaluate_model(quantize_model(model), phrases, labels, batch_size, repeats),
+    }
+    fp32, int8 = results["fp32"]["predictions"], results["int8"]["predictions"]
+    results["agreement"] = float(np.mean(fp32 == int8)) if len(fp32) else 1.0
+    return results
+
+
+def load_labelled_phrases(phrase_path, label_path, label_map):
+    """Loads phrases.json/phrase_labels.json through the phrase cache as arrays and flat labels."""
+
+    cache = load_phrase_cache(phrase_path, label_path, label_map)
+    phrases = [
+        np.array(cache.features[start:stop])
+        for start, stop in zip(cache.offsets[:-1], cache.offsets[1:])
+    ]
+    return phrases, np.array(cache.labels)
+
+
+if __name__ == "__main__":
+    # 用法：python quantize.py [checkpoint 路徑]，省略時使用最新的 checkpoint
+    phrase_path = "phrases.json"
+    label_path = "phrase_labels.json"
+
+    source = sys.argv[1] if len(sys.argv) > 1 else latest_checkpoint()
+    if source is None:
+        print(f"✗ {CHECKPOINT_DIR} 中沒有 checkpoint")
+        sys.exit(1)
+
+    model, label_map = load_checkpoint(source)
+    phrases, labels = load_labelled_phrases(phrase_path, label_path, label_map)
+    results = compare_quantized(model, phrases, labels)
+
+    print(f"📊 {source}: {len(phrases)} 個樂句, {len(labels)} 個音符 (torch 執行緒: {torch.get_num_threads()})")
+    print(f"{'':6}{'準確率':>10}{'樂句/秒':>12}{'單句延遲(ms)':>16}{'大小(KB)':>12}")
+    for name in ("fp32", "int8"):
+        metrics = results[name]
+        print(
+            f"{name:6}{metrics['accuracy']:>10.4f}{metrics['phrases_per_sec']:>12.1f}"
+            f"{metrics['latency_ms']:>16.2f}{metrics['size_bytes'] / 1024:>12.1f}"
+        )
+    print(f"fp32 與 int8 預測一致的音符比例: {results['agreement']:.4f}")
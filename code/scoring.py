@@ -0,0 +1,97 @@
+import numpy as np
+
+
+def notes_to_columns(notes):
+    """
+    Converts a list of note dicts into columnar NumPy arrays.
+
+    Args:
+        notes (list): Note dicts with pitch_class, octave, duration and position.
+
+    Returns:
+        dict: "pitch", "duration" and "position" arrays of equal length.
+    """
+
+    if isinstance(notes, dict):
+        return notes  # 已經是欄位格式
+
+    count = len(notes)
+    pitch = np.fromiter(
+        (note["octave"] * 12 + note["pitch_class"] for note in notes),
+        dtype=np.int64,
+        count=count,
+    )
+    duration = np.fromiter(
+        (note["duration"] for note in notes), dtype=np.float64, count=count
+    )
+    position = np.fromiter(
+        (note["position"] for note in notes), dtype=np.float64, count=count
+    )
+    return {"pitch": pitch, "duration": duration, "position": position}
+
+
+def _normalize(scores, peak):
+    """Divides scores by peak, or returns zeros when there is no peak."""
+
+    if peak > 0:
+        return scores / peak
+    return np.zeros_like(scores)
+
+
+def breathing_scores(columns):
+    """
+    Computes the normalized pause before every note except the first.
+
+    Args:
+        columns (dict): Columnar notes from notes_to_columns.
+
+    Returns:
+        tuple: (positions, scores) as NumPy arrays.
+    """
+
+    position = np.asarray(columns["position"], dtype=np.float64)
+    duration = np.asarray(columns["duration"], dtype=np.float64)
+    if len(position) < 2:
+        return np.empty(0), np.empty(0)
+
+    pauses = np.maximum(position[1:] - position[:-1] - duration[:-1], 0)
+    return position[1:], _normalize(pauses, pauses.max())
+
+
+def difficulty_scores(columns):
+    """
+    Computes the normalized pitch jump plus note density of every note
+    except the first.
+
+    Args:
+        columns (dict): Columnar notes from notes_to_columns.
+
+    Returns:
+        tuple: (positions, scores) as NumPy arrays.
+    """
+
+    position = np.asarray(columns["position"], dtype=np.float64)
+    duration = np.asarray(columns["duration"], dtype=np.float64)
+    pitch = np.asarray(columns["pitch"], dtype=np.int64)
+    if len(position) < 2:
+        return np.empty(0), np.empty(0)
+
+    pitch_change = np.abs(np.diff(pitch))
+    tail = duration[1:]
+    density = np.zeros_like(tail)
+    np.divide(1.0, tail, out=density, where=tail > 0)
+
+    peak = pitch_change.max() + density.max()
+    return position[1:], _normalize(pitch_change + density, peak)
+
+
+def calculate_breathing_suitability(notes):
+    """Calculates the breathing suitability scores for a list of notes."""
+
+    return breathing_scores(notes_to_columns(notes))
+
+
+def calculate_technical_difficulty(notes):
+    """Calculates the technical difficulty scores for a list of notes."""
+
+    return difficulty_scores(notes_to_columns(notes))
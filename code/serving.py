@@ -0,0 +1,84 @@
+# Model Serving - load and warm the instrument model once per process
+
+import os
+import threading
+import numpy as np
+from checkpoint import load_model, latest_checkpoint, CHECKPOINT_DIR, TORCHSCRIPT_SUFFIX
+from inference import predict_label_ids, predict_labels, DEFAULT_BATCH_SIZE
+from quantize import quantize_model
+
+LEGACY_MODEL_PATH = "bilstm_model.pth"
+
+_served = {}  # (絕對路徑, 修改時間, 是否量化) -> ServedModel
+_lock = threading.Lock()
+
+
+class ServedModel:
+    """A loaded, warmed-up model with its label map."""
+
+    def __init__(self, model, label_map, path, quantized=False):
+        self.model = model
+        self.path = path
+        self.quantized = quantized
+        self.label_map = label_map
+        self.label_to_instrument = {v: k for k, v in label_map.items()}
+
+    def warm_up(self):
+        """Runs one small batch so the first real request skips lazy initialization."""
+        phrase = np.zeros((4, 4), dtype=np.float32)
+        predict_label_ids(self.model, [phrase, phrase[:2]])
+
+    def predict_ids(self, phrases, batch_size=DEFAULT_BATCH_SIZE):
+        return predict_label_ids(self.model, phrases, batch_size)
+
+    def predict(self, phrases, batch_size=DEFAULT_BATCH_SIZE):
+        return predict_labels(self.model, phrases, self.label_to_instrument, batch_size)
+
+
+def resolve_model_path(path=None, checkpoint_dir=CHECKPOINT_DIR):
+    """
+    Chooses the model file: path, then the MODEL_PATH env var, then the
+    newest checkpoint in checkpoint_dir, then the legacy bilstm_model.pth.
+    """
+
+    return (
+        path
+        or os.environ.get("MODEL_PATH")
+        or latest_checkpoint(checkpoint_dir)
+        or LEGACY_MODEL_PATH
+    )
+
+
+def get_served_model(path=None, checkpoint_dir=CHECKPOINT_DIR, quantized=None):
+    """
+    Returns the process-wide ServedModel for path, loading and warming it
+    on first use.
+
+    Later calls reuse the same instance until the file on disk changes,
+    so scripts and web workers pay the load only once. With quantized (or
+    the MODEL_QUANTIZE=1 env var) the LSTM and Linear layers run in
+    dynamic int8; compare it against fp32 with quantize.py first.
+    """
+
+    if quantized is None:
+        quantized = os.environ.get("MODEL_QUANTIZE") == "1"
+    path = os.path.abspath(resolve_model_path(path, checkpoint_dir))
+    if quantized and path.endswith(TORCHSCRIPT_SUFFIX):
+        raise ValueError(f"TorchScript 模型無法在載入後量化，請改用 checkpoint: {path}")
+    key = (path, os.stat(path).st_mtime_ns, quantized)
+    served = _served.get(key)
+    if served is not None:
+        return served
+
+    with _lock:
+        served = _served.get(key)
+        if served is None:
+            model, label_map = load_model(path)
+            if quantized:
+                model = quantize_model(model)
+            served = ServedModel(model, label_map, path, quantized)
+            served.warm_up()
+            # 檔案更新後舊版本不再使用
+            _served.clear()
+            _served[key] = served
+    return served
@@ -1,48 +1,118 @@
 import os
-import pretty_midi
 import json
+import note_store
+import scoring
+import midi_ingest
+from midi_ingest import load_midi_notes, notes_from_arrays
+from note_store import write_track
+from track_executor import list_track_folders, run_tracks
+from build_manifest import BuildManifest, hash_code
 
 INPUT_DIR = "./babyslakh_16k"
 OUTPUT_DIR = "./converted_json"
+STORE_DIR = "./converted_npy"  # 二進位欄位格式，供分析腳本以 mmap 讀取
+WRITE_JSON = True  # 保留逐 stem 的 JSON 供其他工具使用
+# 轉換程式碼變更時需重建所有 Track
+CODE_FILES = [__file__, midi_ingest.__file__, note_store.__file__, scoring.__file__]
+# 與 midi_ingest.py 的 manifest 分開存放，兩個腳本的程式碼摘要不同，共用會互相使對方失效
+MANIFEST_FILENAME = ".convert_manifest.json"
 
 def midi_to_json(midi_path):
-    pm = pretty_midi.PrettyMIDI(midi_path)
-    notes = []
-    for instr in pm.instruments:
-        if instr.is_drum:
-            continue
-        for note in instr.notes:
-            notes.append({
-                "pitch_class": note.pitch % 12,
-                "octave": note.pitch // 12,
-                "duration": round(note.end - note.start, 5),
-                "position": round(note.start, 5)
-            })
-    notes.sort(key=lambda x: x["position"])
-    return [notes] if notes else []
-
-for track_folder in os.listdir(INPUT_DIR):
+    return notes_from_arrays(load_midi_notes(midi_path))
+
+
+def convert_track(track_folder, manifest=None, code_digest=None):
+    """
+    Converts every MIDI file of one track and writes its note store.
+
+    With a manifest, the track is skipped when its MIDI files, the
+    conversion code and the outputs are unchanged since the last build.
+    manifest only needs this track's entries (see
+    BuildManifest.track_manifests); code_digest defaults to
+    hash_code(CODE_FILES).
+
+    Returns:
+        tuple: (converted stem count, new manifest entries).
+    """
+
     track_path = os.path.join(INPUT_DIR, track_folder)
     midi_folder = os.path.join(track_path, "MIDI")
 
     if not os.path.isdir(midi_folder):
-        continue
+        return 0, {}
 
     output_folder = os.path.join(OUTPUT_DIR, track_folder)
-    os.makedirs(output_folder, exist_ok=True)
+    store_folder = os.path.join(STORE_DIR, track_folder)
+    midi_files = sorted(
+        midi_file
+        for midi_file in os.listdir(midi_folder)
+        if midi_file.endswith(".mid") or midi_file.endswith(".midi")
+    )
+    json_paths = {
+        midi_file: os.path.join(
+            output_folder,
+            midi_file.replace(".mid", ".json").replace(".midi", ".json"),
+        )
+        for midi_file in midi_files
+    }
+    outputs = [os.path.join(store_folder, note_store.INDEX_FILENAME)]
+    if WRITE_JSON:
+        outputs.extend(json_paths.values())
 
-    for midi_file in os.listdir(midi_folder):
-        if not midi_file.endswith(".mid") and not midi_file.endswith(".midi"):
-            continue
+    if manifest is not None:
+        fingerprint = manifest.fingerprint(
+            track_folder,
+            [os.path.join(midi_folder, midi_file) for midi_file in midi_files],
+            code_digest or hash_code(CODE_FILES),
+            {"write_json": WRITE_JSON},
+        )
+        if not manifest.is_stale(track_folder, fingerprint, outputs):
+            print(f"- 未變更，略過: {track_folder}")
+            return 0, {}
 
+    if WRITE_JSON:
+        os.makedirs(output_folder, exist_ok=True)
+    track_stems = {}
+    failed = False
+
+    for midi_file in midi_files:
         midi_path = os.path.join(midi_folder, midi_file)
-        json_filename = midi_file.replace(".mid", ".json").replace(".midi", ".json")
-        json_path = os.path.join(output_folder, json_filename)
+        json_path = json_paths[midi_file]
+        json_filename = os.path.basename(json_path)
 
         try:
             phrases = midi_to_json(midi_path)
-            with open(json_path, "w") as f:
-                json.dump(phrases, f, indent=2)
+            if WRITE_JSON:
+                with open(json_path, "w") as f:
+                    json.dump(phrases, f, indent=2)
+            track_stems[os.path.splitext(json_filename)[0]] = (
+                phrases[0] if phrases else []
+            )
             print(f"✓ 轉換成功: {track_folder}/{json_filename}")
         except Exception as e:
             print(f"✗ 轉換失敗: {midi_path}，錯誤：{e}")
+            failed = True
+
+    write_track(store_folder, track_stems)
+
+    # 有 stem 轉換失敗時不記錄，下次執行會重試
+    if manifest is None or failed:
+        return len(track_stems), {}
+    return len(track_stems), {
+        track_folder: manifest.record(track_folder, fingerprint, outputs)
+    }
+
+
+if __name__ == "__main__":
+    manifest = BuildManifest(os.path.join(STORE_DIR, MANIFEST_FILENAME))
+    track_folders = list_track_folders(INPUT_DIR, prefix="")
+    results, failures = run_tracks(
+        convert_track,
+        track_folders,
+        hash_code(CODE_FILES),
+        track_inputs=manifest.track_manifests(track_folders),
+    )
+    for _, entries in results.values():
+        manifest.update(entries)
+    manifest.save()
+    print(f"\n完成 {len(results)} 個 Track，失敗 {len(failures)} 個")
@@ -0,0 +1,89 @@
+import numpy as np
+
+
+class ScoreHistogram:
+    """
+    Mergeable fixed-bin histogram for streaming score statistics.
+
+    Every bin keeps the count and the sum of the values that fell into it,
+    so the mean is exact and a rank band such as the 20%-30% slice of the
+    sorted values is exact for fully covered bins. A partially covered bin
+    contributes its own mean, which bounds the error by one bin width.
+    Memory stays at two arrays of `bins` entries no matter how many values
+    are added.
+
+    Args:
+        bins (int): Number of equal-width bins between low and high.
+        low (float): Lower edge of the first bin.
+        high (float): Upper edge of the last bin. Values outside
+            [low, high] are counted in the edge bins.
+        min_value (float): Values below this are ignored, or None to keep all.
+    """
+
+    def __init__(self, bins=4096, low=0.0, high=1.0, min_value=None):
+        self.bins = bins
+        self.low = low
+        self.high = high
+        self.min_value = min_value
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.sums = np.zeros(bins, dtype=np.float64)
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def add(self, values):
+        """Adds an array of values to the histogram."""
+
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if self.min_value is not None:
+            values = values[values >= self.min_value]
+        if len(values) == 0:
+            return self
+
+        scaled = (values - self.low) / (self.high - self.low) * self.bins
+        index = np.clip(scaled.astype(np.int64), 0, self.bins - 1)
+        self.counts += np.bincount(index, minlength=self.bins)
+        self.sums += np.bincount(index, weights=values, minlength=self.bins)
+        return self
+
+    def merge(self, other):
+        """Adds the state of another histogram with the same binning."""
+
+        if (self.bins, self.low, self.high, self.min_value) != (
+            other.bins,
+            other.low,
+            other.high,
+            other.min_value,
+        ):
+            raise ValueError("無法合併分箱設定不同的 ScoreHistogram")
+        self.counts += other.counts
+        self.sums += other.sums
+        return self
+
+    def mean(self):
+        """Returns the mean of all added values, or 0 if there are none."""
+
+        count = self.count
+        return float(self.sums.sum() / count) if count else 0.0
+
+    def band_mean(self, lower, upper):
+        """
+        Returns the mean of the sorted values between two rank fractions.
+
+        Matches np.mean(sorted_values[int(n * lower):int(n * upper)]) up to
+        the bin width, and returns 0 when the slice is empty.
+        """
+
+        count = self.count
+        start, stop = int(count * lower), int(count * upper)
+        if stop <= start:
+            return 0.0
+
+        ends = np.cumsum(self.counts)
+        begins = ends - self.counts
+        overlap = np.clip(np.minimum(ends, stop) - np.maximum(begins, start), 0, None)
+
+        bin_means = np.zeros(self.bins)
+        np.divide(self.sums, self.counts, out=bin_means, where=self.counts > 0)
+        return float((overlap * bin_means).sum() / (stop - start))
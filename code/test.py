@@ -2,10 +2,13 @@
 
 import json
 import torch
-import torch.nn as nn
-import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader
-from torch.nn.utils.rnn import pad_sequence, pack_padded_sequence, pad_packed_sequence
+from torch.utils.data import Dataset
+from torch.nn.utils.rnn import pad_sequence
+from model import InstrumentBiLSTM
+from inference import predict_labels, DEFAULT_BATCH_SIZE
+from phrase_cache import load_phrase_cache
+from checkpoint import save_checkpoint, CHECKPOINT_DIR
+from training import train_epochs, configure_threads, make_dataloader
 
 # -------------------------------
 # Configs and Label Mapping
@@ -17,32 +20,23 @@ label_to_instrument = {v: k for k, v in instrument_labels.items()}
 # Dataset and Preprocessing
 # -------------------------------
 class PhraseDataset(Dataset):
-    def __init__(self, phrase_path, label_path=None):
-        with open(phrase_path, 'r') as f:
-            self.phrases = json.load(f)
-        if label_path:
-            with open(label_path, 'r') as f:
-                self.labels = json.load(f)
-        else:
-            self.labels = None
+    def __init__(self, phrase_path, label_path=None, cache_dir=None):
+        # 第一次使用時將 JSON 編碼成 phrase_cache，之後直接 mmap 讀取
+        self.cache = load_phrase_cache(
+            phrase_path, label_path, instrument_labels, cache_dir
+        )
+        self.has_labels = label_path is not None
+        self.lengths = self.cache.lengths
 
     def __len__(self):
-        return len(self.phrases)
+        return len(self.cache)
 
     def __getitem__(self, idx):
-        phrase = self.phrases[idx]
-        features = [torch.tensor([
-            note["pitch_class"],
-            note["octave"],
-            note["duration"],
-            note["position"]
-        ], dtype=torch.float32) for note in phrase]
-
-        if self.labels:
-            label_seq = [torch.tensor(instrument_labels[l], dtype=torch.long) for l in self.labels[idx]]
-            return torch.stack(features), torch.tensor(label_seq)
+        features = self.cache.features_at(idx)
+        if self.has_labels:
+            return features, self.cache.labels_at(idx)
         else:
-            return torch.stack(features)
+            return features
 
 # -------------------------------
 # Collate Function for Padding
@@ -60,62 +54,25 @@ def collate_fn(batch):
         padded_sequences = pad_sequence(sequences, batch_first=True)
         return padded_sequences, lengths
 
-# -------------------------------
-# BiLSTM Model
-# -------------------------------
-class InstrumentBiLSTM(nn.Module):
-    def __init__(self, input_dim, hidden_dim, output_dim, num_layers=2):
-        super(InstrumentBiLSTM, self).__init__()
-        self.lstm = nn.LSTM(input_dim, hidden_dim, num_layers=num_layers,
-                            bidirectional=True, batch_first=True)
-        self.fc = nn.Linear(hidden_dim * 2, output_dim)
-
-    def forward(self, x, lengths):
-        packed = pack_padded_sequence(x, lengths.cpu(), batch_first=True, enforce_sorted=False)
-        out, _ = self.lstm(packed)
-        out, _ = pad_packed_sequence(out, batch_first=True)
-        out = self.fc(out)
-        return out
-
 # -------------------------------
 # Training Function
 # -------------------------------
-def train(model, dataloader, epochs=10):
-    optimizer = optim.Adam(model.parameters(), lr=0.001)
-    criterion = nn.CrossEntropyLoss(ignore_index=-100)
-    model.train()
-
-    for epoch in range(epochs):
-        total_loss = 0
-        for X, y, lengths in dataloader:
-            optimizer.zero_grad()
-            outputs = model(X, lengths)
-            loss = criterion(outputs.view(-1, outputs.shape[-1]), y.view(-1))
-            loss.backward()
-            optimizer.step()
-            total_loss += loss.item()
-        print(f"Epoch {epoch+1}: Loss = {total_loss:.4f}")
+def train(model, dataloader, epochs=10, lr=0.001, accumulation_steps=1, checkpoint_dir=None):
+    # 共用 training.py 的訓練迴圈：梯度累積、每個 epoch 才讀取 loss，並記錄 samples/s
+    history = train_epochs(model, dataloader, epochs, lr, accumulation_steps)
+    if checkpoint_dir:
+        # 連同標籤對照存成新版本的 checkpoint，供 predict.py / 網頁服務載入
+        path = save_checkpoint(model, instrument_labels, checkpoint_dir,
+                               epochs=epochs, loss=history[-1] if history else None)
+        print(f"✓ 已儲存 checkpoint: {path}")
+    return history
 
 # -------------------------------
 # Prediction Function
 # -------------------------------
-def predict(model, phrases):
-    model.eval()
-    with torch.no_grad():
-        features = [torch.stack([
-            torch.tensor([
-                note["pitch_class"], note["octave"], note["duration"], note["position"]
-            ], dtype=torch.float32) for note in phrase]) for phrase in phrases]
-
-        lengths = torch.tensor([len(seq) for seq in features])
-        padded = pad_sequence(features, batch_first=True)
-        outputs = model(padded, lengths)
-        predicted = torch.argmax(outputs, dim=2).tolist()
-
-        result = []
-        for i, length in enumerate(lengths):
-            result.append([label_to_instrument[p] for p in predicted[i][:length]])
-        return result
+def predict(model, phrases, batch_size=DEFAULT_BATCH_SIZE):
+    # 依長度分組批次推論，避免逐音符建立 tensor 與整批補齊到最長樂句
+    return predict_labels(model, phrases, label_to_instrument, batch_size)
 
 # -------------------------------
 # Example usage
@@ -124,11 +81,14 @@ if __name__ == "__main__":
     phrase_path = "phrases.json"
     label_path = "phrase_labels.json"
 
+    # TRAIN_THREADS / TRAIN_WORKERS 環境變數可調整執行緒與資料載入程序數
+    configure_threads()
     dataset = PhraseDataset(phrase_path, label_path)
-    dataloader = DataLoader(dataset, batch_size=1, shuffle=False, collate_fn=collate_fn)
+    # 長度相近的樂句組成同一批，減少補齊
+    dataloader = make_dataloader(dataset, batch_size=32, collate_fn=collate_fn)
 
     model = InstrumentBiLSTM(input_dim=4, hidden_dim=64, output_dim=3)
-    train(model, dataloader, epochs=20)
+    train(model, dataloader, epochs=20, checkpoint_dir=CHECKPOINT_DIR)
 
     with open(phrase_path, 'r') as f:
         test_phrases = json.load(f)
@@ -0,0 +1,119 @@
+import os
+import itertools
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+def default_workers():
+    """
+    Returns the worker count for track-level parallelism.
+
+    The TRACK_WORKERS environment variable overrides the CPU count;
+    TRACK_WORKERS=1 runs every track in the current process.
+    """
+
+    workers = int(os.environ.get("TRACK_WORKERS", "0"))
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+
+def list_track_folders(root, prefix="Track"):
+    """Returns the sorted names of the sub-folders of root starting with prefix."""
+
+    return sorted(
+        name
+        for name in os.listdir(root)
+        if name.startswith(prefix) and os.path.isdir(os.path.join(root, name))
+    )
+
+
+def _report_failure(track_folder, error):
+    print(f"✗ {track_folder} 處理失敗：{type(error).__name__}: {error}")
+
+
+def iter_tracks(func, track_folders, *args, workers=None, track_inputs=None):
+    """
+    Runs func(track_folder, *args) for every track like run_tracks, but
+    yields each outcome in track_folders order as soon as it is available.
+
+    At most two tasks per worker are submitted ahead of the track being
+    yielded, so finished results do not pile up in memory while a slow
+    track is still running; the caller can merge and drop each one.
+
+    Yields:
+        tuple: (track_folder, result, error), where error is None on
+        success and the error message otherwise.
+    """
+
+    if workers is None:
+        workers = default_workers()
+    workers = max(1, min(workers, len(track_folders)))
+
+    def call_args(track_folder):
+        if track_inputs is None:
+            return (track_folder,) + args
+        return (track_folder, track_inputs[track_folder]) + args
+
+    if workers == 1:
+        for track_folder in track_folders:
+            try:
+                result = func(*call_args(track_folder))
+            except Exception as e:
+                traceback.print_exc()
+                _report_failure(track_folder, e)
+                yield track_folder, None, f"{type(e).__name__}: {e}"
+            else:
+                yield track_folder, result, None
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        remaining = iter(track_folders)
+        # 依提交順序取出結果，輸出與單核執行時一致；同時只提交有限數量的工作
+        for track_folder in itertools.islice(remaining, 2 * workers):
+            pending.append((track_folder, pool.submit(func, *call_args(track_folder))))
+        while pending:
+            track_folder, future = pending.popleft()
+            try:
+                result = future.result()
+            except Exception as e:
+                _report_failure(track_folder, e)
+                outcome = (track_folder, None, f"{type(e).__name__}: {e}")
+            else:
+                outcome = (track_folder, result, None)
+            for next_folder in itertools.islice(remaining, 1):
+                pending.append((next_folder, pool.submit(func, *call_args(next_folder))))
+            yield outcome
+
+
+def run_tracks(func, track_folders, *args, workers=None, track_inputs=None):
+    """
+    Runs func(track_folder, *args) for every track, fanning out to a
+    process pool.
+
+    Args:
+        func (callable): Module-level function, so it can be pickled.
+        track_folders (list): Track folder names, in the order results are
+            gathered.
+        *args: Extra arguments passed to every call.
+        workers (int): Number of processes; defaults to default_workers().
+        track_inputs (dict): Optional per-track value, passed to func right
+            after track_folder, i.e. func(track_folder, value, *args).
+
+    Returns:
+        tuple: (results, failures). results maps each successful track to
+        its return value in track_folders order; failures maps each failed
+        track to its error message. Use iter_tracks to consume large
+        results one track at a time instead.
+    """
+
+    results = {}
+    failures = {}
+    for track_folder, result, error in iter_tracks(
+        func, track_folders, *args, workers=workers, track_inputs=track_inputs
+    ):
+        if error is None:
+            results[track_folder] = result
+        else:
+            failures[track_folder] = error
+    return results, failures
@@ -0,0 +1,110 @@
+# BiLSTM Training Loop - CPU throughput mode
+
+import os
+import time
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import DataLoader
+from phrase_cache import BucketBatchSampler, IGNORE_INDEX
+
+
+def default_threads():
+    """Intra-op threads: TRAIN_THREADS env var, otherwise every CPU core."""
+    return int(os.environ.get("TRAIN_THREADS", 0)) or os.cpu_count() or 1
+
+
+def default_loader_workers():
+    """DataLoader worker processes: TRAIN_WORKERS env var, default 0 (in-process)."""
+    return int(os.environ.get("TRAIN_WORKERS", 0))
+
+
+def configure_threads(num_threads=None):
+    """
+    Sets torch's intra-op thread count for the LSTM kernels.
+
+    DataLoader workers take cores too, so pass fewer threads than cores
+    when loading in several processes.
+    """
+
+    num_threads = num_threads or default_threads()
+    torch.set_num_threads(num_threads)
+    return num_threads
+
+
+def make_dataloader(dataset, batch_size, collate_fn, num_workers=None, shuffle=True):
+    """
+    Builds a DataLoader over length-bucketed batches.
+
+    Args:
+        dataset: A dataset with a `lengths` array, such as PhraseDataset.
+        batch_size (int): Phrases per batch.
+        collate_fn: Padding collate function of the dataset's module.
+        num_workers (int): Loader processes; defaults to default_loader_workers().
+        shuffle (bool): Reshuffle the batch order every epoch.
+    """
+
+    num_workers = default_loader_workers() if num_workers is None else num_workers
+    sampler = BucketBatchSampler(dataset.lengths, batch_size, shuffle=shuffle)
+    return DataLoader(
+        dataset,
+        batch_sampler=sampler,
+        collate_fn=collate_fn,
+        num_workers=num_workers,
+        persistent_workers=num_workers > 0,
+    )
+
+
+def train_epochs(model, dataloader, epochs=10, lr=0.001, accumulation_steps=1):
+    """
+    Trains model with Adam and cross-entropy over padded note labels.
+
+    The optimizer steps once every accumulation_steps batches, so the
+    effective batch is accumulation_steps times the loader's batch size.
+    Batch losses are summed as a tensor and read once per epoch, instead
+    of calling loss.item() on every step. Each epoch logs its loss and
+    throughput in phrases and notes per second.
+
+    Returns:
+        list: Summed batch loss of every epoch.
+    """
+
+    optimizer = optim.Adam(model.parameters(), lr=lr)
+    criterion = nn.CrossEntropyLoss(ignore_index=IGNORE_INDEX)
+    model.train()
+
+    history = []
+    for epoch in range(epochs):
+        total_loss = torch.zeros(())
+        phrases = notes = pending = 0
+        start = time.perf_counter()
+
+        optimizer.zero_grad()
+        for X, y, lengths in dataloader:
+            if (y == IGNORE_INDEX).all():
+                continue  # 整批沒有可用的標籤，loss 會是 NaN
+
+            outputs = model(X, lengths)
+            loss = criterion(outputs.view(-1, outputs.shape[-1]), y.view(-1))
+            (loss / accumulation_steps).backward()
+            total_loss += loss.detach()
+            phrases += len(lengths)
+            notes += int(lengths.sum())
+
+            pending += 1
+            if pending == accumulation_steps:
+                optimizer.step()
+                optimizer.zero_grad()
+                pending = 0
+
+        if pending:
+            optimizer.step()
+            optimizer.zero_grad()
+
+        elapsed = time.perf_counter() - start
+        history.append(total_loss.item())
+        print(
+            f"Epoch {epoch+1}: Loss = {history[-1]:.4f} "
+            f"({phrases / elapsed:.1f} phrases/s, {notes / elapsed:.0f} notes/s)"
+        )
+    return history
@@ -1,5 +1,6 @@
 import yaml
 import json
+from feature_table import bump_generation
 
 # 輸入與輸出檔案路徑
 yaml_path = "./babyslakh_16k/track00020/metadata.yaml"
@@ -13,4 +14,7 @@ with open(yaml_path, 'r') as f:
 with open(json_path, 'w') as f:
     json.dump(data, f, indent=2)
 
+# 特徵表依世代戳記判斷是否過期
+bump_generation("./features_json")
+
 print("轉換完成：metadata.yaml → metadata.json")
@@ -7,5 +7,36 @@ class Config(object):
     DOWNLOAD_FOLDER = "app/downloads"
     ALLOWED_EXTENSIONS = {"wav", "mp3", "mid", "midi"}
 
-    # 檔案大小限制 (16MB)
+    # 檔案大小限制 (16MB)，大型檔案改用 /api/uploads 分段上傳
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 每個分段的大小，須小於 MAX_CONTENT_LENGTH
+    UPLOAD_MAX_FILE_SIZE = 2 * 1024 * 1024 * 1024  # 分段上傳的單檔上限 (2GB)
+
+    # 背景轉換工作佇列
+    JOB_DB_PATH = "app/uploads/jobs.sqlite3"
+    JOB_WORKERS = 2  # 同時執行的轉換工作數
+    JOB_QUEUE_LIMIT = 100  # 等待中工作上限，超過時拒絕新的轉換請求
+    JOB_STALE_SECONDS = 600  # 執行中工作的擁有程序超過此秒數沒有心跳即重新排入佇列
+    # 進度推送的單一連線最長秒數，連線結束後瀏覽器會重新連線；等待期間佔用一個
+    # 處理執行緒，須以 gunicorn.conf.py 的執行緒 worker 執行
+    SSE_KEEPALIVE_SECONDS = 15
+    SSE_POLL_SECONDS = 0.5  # 查詢其他程序寫入的進度的間隔
+    SSE_RETRY_MILLISECONDS = 500  # 連線結束後瀏覽器重新連線前的等待時間
+
+    # 工作資訊與分析結果的記憶體快取筆數
+    JOB_CACHE_SIZE = 1024
+
+    # 下載的 ZIP 依內容雜湊快取於結果目錄，內容不變時不重新壓縮
+    DOWNLOAD_CACHE_ARCHIVES = True
+
+    # 圖表即時繪製
+    CHART_CACHE_BYTES = 32 * 1024 * 1024  # 已繪製圖片的快取上限
+    CHART_STATS_FOLDER = "output"  # analyze.py 的全域統計，不存在時改用工作本身的統計
+    CHART_DEFAULT_POINTS = 1000  # 圖表資料 API 預設回傳的點數
+    CHART_MAX_POINTS = 5000  # 圖表資料 API 可要求的點數上限
+
+    # 樂器分配模型：每個程序啟動時載入並暖機一次，之後所有工作共用
+    # 未指定 MODEL_PATH 時依序使用環境變數 MODEL_PATH、MODEL_CHECKPOINT_DIR 中最新的 checkpoint
+    MODEL_PATH = None
+    MODEL_CHECKPOINT_DIR = "code/checkpoints"
+    MODEL_QUANTIZE = False  # 以動態 int8 量化推論，啟用前先用 code/quantize.py 比較準確率與延遲
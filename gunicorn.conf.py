@@ -0,0 +1,15 @@
+# gunicorn 設定：gunicorn run:app 會自動讀取目前目錄下的此檔案
+#
+# /api/events 的進度推送連線在等待狀態變更時（最多 SSE_KEEPALIVE_SECONDS 秒）
+# 會佔用一個處理執行緒。同步 worker 一次只能處理一個請求，每個開著的結果頁面
+# 都會佔住一個 worker，因此改用執行緒 worker：每個 worker 可同時服務 threads
+# 個連線，可同時開啟的結果頁面約為 workers * threads 減去一般請求所需。
+
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "32"))
+# 長時間的進度推送連線不應被視為逾時
+timeout = 60